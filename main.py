@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
 import argparse
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent / 'src'))
 
 from database import db
 from ticker_management.manage_tickers import refresh_us, refresh_eu
-from afv20.afv_processor import process, process_single
+from afv20.afv_processor import process, process_single, rescore
 from holdings.holdings_report import (
     parse_stock_positions,
     parse_stock_positions_from_string,
@@ -18,7 +19,9 @@ from holdings.holdings_report import (
 )
 from technical_analysis.analyzer import run as run_ta, run_holdings as run_holdings_ta
 from price_history.fetcher import fetch_and_store as fetch_prices, ensure_for_ta
-from holdings.sharpe import compute as compute_sharpe
+from price_history.archive import enable as archive_prices, compact_db as compact_prices
+from holdings.sharpe import compute as compute_sharpe, update_history as update_sharpe_history
+from utils.run_ledger import RunLedger
 
 DEFAULT_DB = str(Path(__file__).resolve().parent / 'data' / 'finance_data.db')
 
@@ -32,10 +35,12 @@ def cmd_db_update_schema(args):
 
 def cmd_tickers_refresh_us(args):
     refresh_us(args.db)
+    db.bump_data_version(args.db)
 
 
 def cmd_tickers_refresh_eu(args):
     refresh_eu(args.db)
+    db.bump_data_version(args.db)
 
 
 def cmd_tickers_refresh_all(args):
@@ -44,10 +49,18 @@ def cmd_tickers_refresh_all(args):
     print()
     print("=== EU tickers ===")
     refresh_eu(args.db)
+    db.bump_data_version(args.db)
 
 
 def cmd_score_symbol(args):
     process_single(args.symbol, db_file_path=args.db, save=args.save)
+    if args.save:
+        db.bump_data_version(args.db)
+
+
+def cmd_score_rescore(args):
+    rescore(db_file_path=args.db)
+    db.bump_data_version(args.db)
 
 
 def cmd_score_history(args):
@@ -92,20 +105,13 @@ def cmd_score_history(args):
     print("-" * len(header))
 
 
-def cmd_run_daily(args):
-    print("=== Step 1: Update schema ===")
-    db.init_schema(args.db)
-    db.migrate(args.db)
-    print("Schema up to date.")
-    print()
-
-    print("=== Step 2: Refresh tickers ===")
+def _refresh_tickers(args):
     refresh_us(args.db)
     print()
     refresh_eu(args.db)
-    print()
 
-    print("=== Step 3: Save holdings from IBKR ===")
+
+def _save_ibkr_holdings(args):
     with db.connect(args.db) as con:
         already_saved = con.execute(
             "SELECT COUNT(*) FROM holdings WHERE fetched_at::DATE = current_date"
@@ -129,30 +135,71 @@ def cmd_run_daily(args):
         """).fetchall()]
     if ccys:
         save_fx_rates(ccys, db_path=args.db)
+
+
+def cmd_run_daily(args):
+    print("=== Step 1: Update schema ===")
+    db.init_schema(args.db)
+    db.migrate(args.db)
+    print("Schema up to date.")
+
+    # Schema is applied on every run (it is idempotent and creates run_ledger);
+    # the later steps are skipped when --resume finds them done in the last run.
+    ledger = RunLedger.open(args.db, resume=args.resume)
+    print(f"Run {ledger.run_id}")
+    print()
+
+    # Ticker refresh and the IBKR fetch touch different tables; run them side by side
+    print("=== Steps 2 & 3: Refresh tickers / save holdings from IBKR (concurrently) ===")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [
+            pool.submit(ledger.run, 'tickers', lambda: _refresh_tickers(args), 'tickers'),
+            pool.submit(ledger.run, 'holdings', lambda: _save_ibkr_holdings(args), 'holdings'),
+        ]
+        for future in futures:
+            future.result()
     print()
 
     print("=== Step 4: Score all tickers ===")
-    process(args.db)
+    ledger.run('score', lambda: process(args.db, workers=args.workers), 'afv_21_scores')
     print()
 
     print("=== Step 5: Ensure price history ===")
-    ensure_for_ta(args.db)
+    ledger.run('prices', lambda: ensure_for_ta(args.db), 'price_history')
     print()
 
     print("=== Step 6: Technical analysis (top 500) ===")
-    run_ta(args.db)
+    ledger.run('ta', lambda: run_ta(args.db), 'technical_analysis')
     print()
 
     print("=== Step 7: Holdings technical analysis ===")
-    run_holdings_ta(args.db)
+    ledger.run('holdings_ta', lambda: run_holdings_ta(args.db), 'technical_analysis')
+    print()
+
+    print("=== Step 8: Portfolio stats history ===")
+    ledger.run('portfolio_stats', lambda: update_sharpe_history(args.db), 'portfolio_stats_history')
+    ledger.finish()
+    # API responses are cached per data version; publish the run's results
+    db.bump_data_version(args.db)
 
 
 def cmd_prices_fetch(args):
     fetch_prices(args.db, period=args.period, top=args.top)
+    db.bump_data_version(args.db)
+
+
+def cmd_prices_archive(args):
+    archive_prices(args.db, args.dir)
+    db.bump_data_version(args.db)
+
+
+def cmd_prices_compact(args):
+    compact_prices(args.db)
 
 
 def cmd_ta_run(args):
-    run_ta(args.db)
+    run_ta(args.db, top=args.top or None, full=args.full)
+    db.bump_data_version(args.db)
 
 
 def _fetch_positions(args) -> list[dict]:
@@ -188,10 +235,12 @@ def cmd_holdings_save(args):
         print("No stock positions found.")
         return
     save_holdings(positions, db_path=args.db)
+    db.bump_data_version(args.db)
 
 
 def cmd_holdings_ta(args):
     run_holdings_ta(args.db)
+    db.bump_data_version(args.db)
 
 
 def cmd_holdings_sharpe(args):
@@ -231,10 +280,20 @@ def main():
     p_history = score_sub.add_parser('history', help='Show full AFV21 score history for a symbol')
     p_history.add_argument('symbol', help='Yahoo Finance ticker, e.g. AAPL or SSABBH.HE')
 
+    score_sub.add_parser('rescore', help='Re-score every symbol with cached Yahoo data (no network, vectorized)')
+
     # --- run group ---
     run_parser = sub.add_parser('run', help='Run commands')
     run_sub = run_parser.add_subparsers(dest='cmd', required=True)
-    run_sub.add_parser('daily', help='Full daily run: update schema, refresh tickers, score all, technical analysis')
+    p_daily = run_sub.add_parser('daily', help='Full daily run: update schema, refresh tickers, score all, technical analysis')
+    p_daily.add_argument(
+        '--workers', type=int, default=1, metavar='N',
+        help='Yahoo fetch threads for scoring; throughput is capped by the shared rate limit (default: 1)',
+    )
+    p_daily.add_argument(
+        '--resume', action='store_true',
+        help='Continue the last unfinished run, skipping the steps it already completed',
+    )
 
     # --- prices group ---
     prices_parser = sub.add_parser('prices', help='Price history commands')
@@ -248,11 +307,27 @@ def main():
         '--top', type=int, default=2000, metavar='N',
         help='fetch price history for top N symbols by AFV21 score (default: 2000)',
     )
+    p_archive = prices_sub.add_parser(
+        'archive', help='Move price_history into a partitioned Parquet archive behind a view',
+    )
+    p_archive.add_argument(
+        '--dir', default=str(Path(__file__).resolve().parent / 'data' / 'price_archive'), metavar='DIR',
+        help='new directory for the Parquet files (default: data/price_archive)',
+    )
+    prices_sub.add_parser('compact', help='Fold recent price writes into the Parquet archive')
 
     # --- ta group ---
     ta_parser = sub.add_parser('ta', help='Technical analysis commands')
     ta_sub = ta_parser.add_subparsers(dest='cmd', required=True)
-    ta_sub.add_parser('run', help='Run technical analysis on top 500 AFV21 symbols')
+    p_ta = ta_sub.add_parser('run', help='Run technical analysis on top 500 AFV21 symbols')
+    p_ta.add_argument(
+        '--top', type=int, default=500, metavar='N',
+        help='analyse the top N symbols by AFV21 score, 0 for every scored symbol (default: 500)',
+    )
+    p_ta.add_argument(
+        '--full', action='store_true',
+        help='recompute every indicator from full price history instead of the stored ta_state',
+    )
 
     # --- holdings group ---
     DEFAULT_XML = str(Path(__file__).resolve().parent / 'holdings_data' / 'Current_holdings.xml')
@@ -305,6 +380,8 @@ def main():
             cmd_score_symbol(args)
         elif args.cmd == 'history':
             cmd_score_history(args)
+        elif args.cmd == 'rescore':
+            cmd_score_rescore(args)
 
     elif args.group == 'run':
         if args.cmd == 'daily':
@@ -313,6 +390,10 @@ def main():
     elif args.group == 'prices':
         if args.cmd == 'fetch':
             cmd_prices_fetch(args)
+        elif args.cmd == 'archive':
+            cmd_prices_archive(args)
+        elif args.cmd == 'compact':
+            cmd_prices_compact(args)
 
     elif args.group == 'ta':
         if args.cmd == 'run':
@@ -1,10 +1,12 @@
-import random
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import duckdb
 import pandas as pd
 
+from afv20.batch_scorer import insert_scores, score_batch
+from afv20.score_writer import ScoreWriter, wal_path_for
+from database.db import SCORE_SNAPSHOTS, connect, refresh_snapshots
 from finance_data_sources import yahoo
+from utils.rate_limit import TokenBucket
 
 _NEEDED_DATASETS = {'cashflow', 'financials', 'balance_sheet', 'info'}
 _FINANCIAL_DATASETS = {'cashflow', 'financials', 'balance_sheet'}
@@ -14,6 +16,20 @@ _REVIVAL_SAMPLE_SIZE = 50
 _REVIVAL_MIN_INTERVAL_DAYS = 30
 _REVIVAL_GIVE_UP_AFTER_DAYS = 365
 
+# Global Yahoo budget shared by all fetch workers (replaces the old 1–3.5s
+# per-symbol sleep, which capped a single worker at ~0.4 symbols/s).
+_YAHOO_CALLS_PER_SECOND = 2.0
+_YAHOO_BURST = 4
+
+# Buffered score rows are appended every N rows or T seconds, whichever first
+_SCORE_FLUSH_ROWS = 500
+_SCORE_FLUSH_SECONDS = 30.0
+
+_INSERT_SCORE_SQL = """
+    insert into afv_21_scores (symbol, afv, afv21, rp, rp21, fcf_yield, ocf_margin, min_ocf_margin, ocf_margin_volatility, sector_score, geo_score, debt_score, trend_score, vd_score, computed_at)
+    values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, current_timestamp)
+"""
+
 
 def _mark_dead(con, symbol: str, reason: str):
     # Preserve original dead_since so revival tracking stays accurate
@@ -43,24 +59,161 @@ def _pick_revival_candidates(con, n: int = _REVIVAL_SAMPLE_SIZE) -> list[str]:
     return [r[0] for r in rows]
 
 
-def _consecutive_failures(con, symbol: str) -> int:
-    """Count how many of the most recent scores for this symbol are -1000."""
-    rows = con.execute(
-        "select afv from afv_21_scores where symbol = ? order by computed_at desc limit ?",
-        (symbol, _CONSECUTIVE_FAILURE_THRESHOLD)
-    ).fetchall()
-    count = 0
-    for (afv,) in rows:
-        if afv == -1000:
-            count += 1
-        else:
-            break
-    return count
-
-
-def process(db_file_path: str = '../../data/finance_data.db'):
-    con = duckdb.connect(db_file_path)
-    yf = yahoo.YahooFinanceDataSource(con)
+def _plan(con) -> pd.DataFrame:
+    """
+    Label every live ticker in one set-based pass over tickers, afv_21_scores
+    and the yahoo_cache view (instead of three point probes per symbol):
+
+      skip   – has a non-failure score from the last month
+      dead   – last _CONSECUTIVE_FAILURE_THRESHOLD scores were all -1000
+      cached – every dataset in _NEEDED_DATASETS is younger than a month
+      fetch  – anything else; cached_datasets lists what can be reused
+
+    Returns a DataFrame [symbol, action, cached_datasets].
+    """
+    needed = sorted(_NEEDED_DATASETS)
+    return con.execute("""
+        WITH live AS (
+            SELECT DISTINCT yahoo_ticker AS symbol
+            FROM tickers
+            WHERE is_dead IS NOT TRUE AND yahoo_ticker IS NOT NULL
+        ),
+        recent_scores AS (
+            SELECT symbol, afv,
+                   ROW_NUMBER() OVER (PARTITION BY symbol ORDER BY computed_at DESC) AS rn,
+                   computed_at > current_timestamp - INTERVAL 1 MONTH AS is_recent
+            FROM afv_21_scores
+            WHERE symbol IN (SELECT symbol FROM live)
+        ),
+        score_state AS (
+            SELECT symbol,
+                   bool_or(is_recent AND afv != -1000) AS scored_recently,
+                   -- length of the leading run of -1000s among the newest N scores
+                   coalesce(min(rn) FILTER (WHERE afv != -1000 AND rn <= $threshold) - 1,
+                            count(*) FILTER (WHERE rn <= $threshold)) AS consecutive_failures
+            FROM recent_scores
+            GROUP BY symbol
+        ),
+        cache_state AS (
+            SELECT symbol, list(DISTINCT dataset) AS cached_datasets
+            FROM yahoo_cache
+            WHERE ts > current_timestamp - INTERVAL 1 MONTH
+              AND dataset IN (SELECT unnest($needed))
+              AND symbol IN (SELECT symbol FROM live)
+            GROUP BY symbol
+        )
+        SELECT
+            l.symbol,
+            CASE
+                WHEN coalesce(s.scored_recently, false) THEN 'skip'
+                WHEN coalesce(s.consecutive_failures, 0) >= $threshold THEN 'dead'
+                WHEN len(coalesce(c.cached_datasets, [])) = len($needed) THEN 'cached'
+                ELSE 'fetch'
+            END AS action,
+            coalesce(c.cached_datasets, []) AS cached_datasets
+        FROM live l
+        LEFT JOIN score_state s USING (symbol)
+        LEFT JOIN cache_state c USING (symbol)
+        ORDER BY l.symbol
+    """, {"threshold": _CONSECUTIVE_FAILURE_THRESHOLD, "needed": needed}).fetchdf()
+
+
+def _score_symbol(yf, symbol: str, writer: ScoreWriter):
+    """Compute the AFV scores for a symbol whose Yahoo data is in the DB and
+    buffer the row. Any error buffers a -1000 row, which the next run's
+    _plan() counts as a failure."""
+    try:
+        fcf_yield = yf.fcf_yield(symbol)
+        ocf_margin, min_ocf_margin = yf.ocf_margin(symbol)
+        ocf_margin_volatility = yf.ocf_margin_volatility(symbol)
+        has_negative_net_income, avg_net_margin = yf.net_income_check(symbol)
+        scaled_rp = yf.scaled_rp(fcf_yield, ocf_margin, min_ocf_margin, ocf_margin_volatility)
+        scaled_rp21 = yf.scaled_rp_21(fcf_yield, ocf_margin, min_ocf_margin, ocf_margin_volatility, has_negative_net_income, avg_net_margin)
+        sector_score = yf.sector_score(symbol)
+        geo_score = yf.geo_score(symbol)
+        debt_score = yf.debt_score(symbol)
+        trend_score = yf.trend_score(symbol)
+        vd_score = yf.vd_score(symbol)
+
+        sector = yf.sector(symbol)
+        industry_score = yf.industry_score(symbol)
+
+        if sector == 'Financial Services':
+            scaled_rp = scaled_rp21 = debt_score = vd_score = 0
+        elif sector == 'Industrials' and industry_score == -1:
+            vd_score = 0
+
+        afv_score = scaled_rp + sector_score + geo_score + debt_score + trend_score + vd_score
+        afv21_score = scaled_rp21 + sector_score + geo_score + debt_score + trend_score + vd_score
+
+        print(f"AFV Score for {symbol}: {afv_score}")
+        print(f"AFV 2.1 Score for {symbol}: {afv21_score}\n")
+
+    except Exception as e:
+        print(f"Error processing {symbol}: {e}, storing AFV -1000")
+        writer.add_failure(symbol)
+        return
+
+    writer.add(symbol, afv_score, afv21_score, scaled_rp, scaled_rp21, fcf_yield, ocf_margin, min_ocf_margin, ocf_margin_volatility, sector_score, geo_score, debt_score, trend_score, vd_score)
+
+
+def _score_cached(con, yf, symbols: list[str], writer: ScoreWriter):
+    """Score symbols whose Yahoo data is all cached: the vectorized batch
+    scorer handles everything in the typed tables, and the per-symbol path
+    picks up the rest (statements still cached only as JSON)."""
+    if not symbols:
+        return
+    scores, leftovers = score_batch(con, symbols, yf.fx)
+    insert_scores(con, scores)
+    failures = int((scores['afv21'] == -1000).sum())
+    print(f"Batch-scored {len(scores)} cached symbol(s), {failures} stored as -1000")
+
+    for symbol in leftovers:
+        print(f"All Yahoo data for {symbol} cached, scoring from JSON cache...")
+        _score_symbol(yf, symbol, writer)
+        yf.evict(symbol)
+
+
+def _download(yf, symbol: str, missing: set[str]) -> tuple[bool, dict, set[str]]:
+    """Worker-thread half of a fetch: network only, never touches DuckDB.
+    Returns (found on Yahoo, downloaded frames, failed dataset names)."""
+    if not yf.can_be_found(symbol):
+        return False, {}, set()
+    frames, failed = yf.fetch_datasets(symbol, missing)
+    return True, frames, failed
+
+
+def _store_and_score(con, yf, symbol: str, future, writer: ScoreWriter):
+    """Writer-thread half of a fetch: persist what _download() got, then score."""
+    try:
+        found, frames, failed = future.result()
+    except Exception as e:
+        print(f"Error fetching {symbol}: {e}, storing AFV -1000")
+        writer.add_failure(symbol)
+        return
+
+    if not found:
+        _mark_dead(con, symbol, 'not found on Yahoo Finance')
+        return
+
+    yf.store_datasets(symbol, frames)
+    if failed & _FINANCIAL_DATASETS:
+        _mark_dead(con, symbol, f'prefetch failed for: {", ".join(sorted(failed & _FINANCIAL_DATASETS))}')
+        return
+
+    _score_symbol(yf, symbol, writer)
+
+
+def process(db_file_path: str = '../../data/finance_data.db', workers: int = 1):
+    """
+    Score every live ticker. Symbols whose Yahoo data is all cached (younger
+    than a month) are scored straight away; the rest are downloaded on a pool of `workers`
+    threads, throttled by one shared token bucket. All DuckDB reads and writes
+    stay on the calling thread, which scores each symbol as its download lands.
+    """
+    con = connect(db_file_path)
+    limiter = TokenBucket(_YAHOO_CALLS_PER_SECOND, _YAHOO_BURST)
+    yf = yahoo.YahooFinanceDataSource(con, limiter=limiter)
 
     revival_candidates = _pick_revival_candidates(con)
     if revival_candidates:
@@ -72,92 +225,50 @@ def process(db_file_path: str = '../../data/finance_data.db'):
         )
         con.commit()
 
-    tickers = con.execute("select * from tickers where is_dead is not true").fetchdf()
-
-    for idx, row in tickers.iterrows():
-        symbol = row['yahoo_ticker']
-
-        exists = con.execute(
-            "select count(*) from afv_21_scores where symbol = ? and computed_at > current_timestamp - interval 1 month and afv != -1000",
-            (symbol,)
-        ).fetchone()
-        if exists and exists[0] > 0:
-            print(f"AFV score for {symbol} already computed within a month, skipping...")
-            continue
-
-        # Dead by accumulated failures across runs
-        if _consecutive_failures(con, symbol) >= _CONSECUTIVE_FAILURE_THRESHOLD:
-            _mark_dead(con, symbol, f'{_CONSECUTIVE_FAILURE_THRESHOLD} consecutive processing failures')
-            continue
-
-        try:
-            cached_datasets = {
-                row[0] for row in con.execute(
-                    "select distinct dataset from yahoo_data where symbol = ? and ts > current_timestamp - interval 1 month",
-                    (symbol,)
-                ).fetchall()
-            }
-            all_cached = _NEEDED_DATASETS.issubset(cached_datasets)
-
-            if all_cached:
-                print(f"All Yahoo data for {symbol} cached, skipping fetch...")
+    # Score rows are buffered and appended in bulk; rows a crashed run left
+    # in the write-ahead file are replayed first so _plan() sees them.
+    with ScoreWriter(con, wal_path_for(db_file_path), _SCORE_FLUSH_ROWS, _SCORE_FLUSH_SECONDS) as writer:
+        plan = _plan(con)
+        counts = plan['action'].value_counts()
+        print(f"Plan: {counts.get('skip', 0)} scored within a month, {counts.get('dead', 0)} to mark dead, "
+              f"{counts.get('cached', 0)} cached, {counts.get('fetch', 0)} to fetch")
+
+        # One batched FX download up front instead of one per currency mid-run
+        currencies = [r[0] for r in con.execute("""
+            SELECT currency FROM yahoo_info WHERE currency IS NOT NULL
+            UNION
+            SELECT financial_currency FROM yahoo_info WHERE financial_currency IS NOT NULL
+        """).fetchall()]
+        yf.fx.ensure(currencies)
+
+        cached: list[str] = []
+        to_fetch: list[tuple[str, set[str]]] = []
+        for symbol, action, cached_datasets in plan[plan['action'] != 'skip'].itertuples(index=False):
+            if action == 'dead':
+                # Dead by accumulated failures across runs
+                _mark_dead(con, symbol, f'{_CONSECUTIVE_FAILURE_THRESHOLD} consecutive processing failures')
+            elif action == 'cached':
+                cached.append(symbol)
             else:
-                time.sleep(random.uniform(1, 3.5))
-                can_be_found = yf.can_be_found(symbol)
-
-                if not can_be_found:
-                    _mark_dead(con, symbol, 'not found on Yahoo Finance')
-                    continue
-
-                failed = yf.prefetch(symbol)
-                if failed & _FINANCIAL_DATASETS:
-                    _mark_dead(con, symbol, f'prefetch failed for: {", ".join(sorted(failed & _FINANCIAL_DATASETS))}')
-                    continue
-
-            con.execute("BEGIN")
-            fcf_yield = yf.fcf_yield(symbol)
-            ocf_margin, min_ocf_margin = yf.ocf_margin(symbol)
-            ocf_margin_volatility = yf.ocf_margin_volatility(symbol)
-            has_negative_net_income, avg_net_margin = yf.net_income_check(symbol)
-            scaled_rp = yf.scaled_rp(fcf_yield, ocf_margin, min_ocf_margin, ocf_margin_volatility)
-            scaled_rp21 = yf.scaled_rp_21(fcf_yield, ocf_margin, min_ocf_margin, ocf_margin_volatility, has_negative_net_income, avg_net_margin)
-            sector_score = yf.sector_score(symbol)
-            geo_score = yf.geo_score(symbol)
-            debt_score = yf.debt_score(symbol)
-            trend_score = yf.trend_score(symbol)
-            vd_score = yf.vd_score(symbol)
-
-            sector = yf.sector(symbol)
-            industry_score = yf.industry_score(symbol)
-
-            if sector == 'Financial Services':
-                scaled_rp = scaled_rp21 = debt_score = vd_score = 0
-            elif sector == 'Industrials' and industry_score == -1:
-                vd_score = 0
-
-            afv_score = scaled_rp + sector_score + geo_score + debt_score + trend_score + vd_score
-            afv21_score = scaled_rp21 + sector_score + geo_score + debt_score + trend_score + vd_score
-
-            print(f"AFV Score for {symbol}: {afv_score}")
-            print(f"AFV 2.1 Score for {symbol}: {afv21_score}\n")
-
-            con.execute("""
-                insert into afv_21_scores (symbol, afv, afv21, rp, rp21, fcf_yield, ocf_margin, min_ocf_margin, ocf_margin_volatility, sector_score, geo_score, debt_score, trend_score, vd_score, computed_at)
-                values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, current_timestamp)
-            """, (symbol, afv_score, afv21_score, scaled_rp, scaled_rp21, fcf_yield, ocf_margin, min_ocf_margin, ocf_margin_volatility, sector_score, geo_score, debt_score, trend_score, vd_score))
-            con.commit()
-
-        except Exception as e:
-            print(f"Error processing {symbol}: {e}, storing AFV -1000")
-            try:
-                con.execute("ROLLBACK")
-            except Exception:
-                pass
-            con.execute("""
-                insert into afv_21_scores (symbol, afv, afv21, rp, rp21, fcf_yield, ocf_margin, min_ocf_margin, ocf_margin_volatility, sector_score, geo_score, debt_score, trend_score, vd_score, computed_at)
-                values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, current_timestamp)
-            """, (symbol, -1000, -1000, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0))
-            con.commit()
+                to_fetch.append((symbol, _NEEDED_DATASETS - set(cached_datasets)))
+
+        _score_cached(con, yf, cached, writer)
+
+        if to_fetch:
+            print(f"\n--- Fetching {len(to_fetch)} symbol(s) from Yahoo with {workers} worker(s) ---")
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                futures = {
+                    pool.submit(_download, yf, symbol, missing): symbol
+                    for symbol, missing in to_fetch
+                }
+                for future in as_completed(futures):
+                    symbol = futures[future]
+                    try:
+                        _store_and_score(con, yf, symbol, future, writer)
+                    finally:
+                        yf.evict(symbol)
+
+    refresh_snapshots(con, SCORE_SNAPSHOTS)
 
     if revival_candidates:
         revived, failed = [], []
@@ -184,13 +295,30 @@ def process(db_file_path: str = '../../data/finance_data.db'):
 
     con.close()
 
+def rescore(db_file_path: str = '../../data/finance_data.db'):
+    """Re-score every live ticker whose Yahoo data is all cached, regardless of
+    when it was last scored, without any network calls. Use after a formula change."""
+    con = connect(db_file_path)
+    yf = yahoo.YahooFinanceDataSource(con)
+
+    plan = _plan(con)
+    complete = plan['cached_datasets'].map(len) == len(_NEEDED_DATASETS)
+    symbols = plan.loc[complete & (plan['action'] != 'dead'), 'symbol'].tolist()
+    print(f"Re-scoring {len(symbols)} cached symbol(s)")
+    with ScoreWriter(con, wal_path_for(db_file_path), _SCORE_FLUSH_ROWS, _SCORE_FLUSH_SECONDS) as writer:
+        _score_cached(con, yf, symbols, writer)
+    refresh_snapshots(con, SCORE_SNAPSHOTS)
+
+    con.close()
+
+
 def process_single(symbol: str, db_file_path: str = '../../data/finance_data.db', save: bool = False):
-    con = duckdb.connect(db_file_path)
+    con = connect(db_file_path)
     yf_ds = yahoo.YahooFinanceDataSource(con)
 
     cached_datasets = {
         row[0] for row in con.execute(
-            "select distinct dataset from yahoo_data where symbol = ? and ts > current_timestamp - interval 1 month",
+            "select distinct dataset from yahoo_cache where symbol = ? and ts > current_timestamp - interval 1 month",
             (symbol,)
         ).fetchall()
     }
@@ -253,11 +381,9 @@ def process_single(symbol: str, db_file_path: str = '../../data/finance_data.db'
     print(f"{'='*50}\n")
 
     if save:
-        con.execute("""
-            insert into afv_21_scores (symbol, afv, afv21, rp, rp21, fcf_yield, ocf_margin, min_ocf_margin, ocf_margin_volatility, sector_score, geo_score, debt_score, trend_score, vd_score, computed_at)
-            values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, current_timestamp)
-        """, (symbol, afv_score, afv21_score, scaled_rp, scaled_rp21, fcf_yield, ocf_margin, min_ocf_margin, ocf_margin_volatility, sector_score, geo_score, debt_score, trend_score, vd_score))
+        con.execute(_INSERT_SCORE_SQL, (symbol, afv_score, afv21_score, scaled_rp, scaled_rp21, fcf_yield, ocf_margin, min_ocf_margin, ocf_margin_volatility, sector_score, geo_score, debt_score, trend_score, vd_score))
         con.commit()
+        refresh_snapshots(con, SCORE_SNAPSHOTS)
         print(f"Score saved to database.")
 
     con.close()
@@ -0,0 +1,401 @@
+"""
+Vectorized AFV scoring over cached fundamentals.
+
+score_batch() loads the latest yahoo_statements snapshot and yahoo_info row of
+every requested symbol in two queries, lays each needed line item out as a
+(symbols × periods) matrix, newest period first, and evaluates every score
+component for the whole universe with NumPy. It mirrors the per-symbol methods
+in YahooFinanceDataSource branch for branch, including which symbols end up
+with an AFV of -1000, so re-scoring the cached universe after a formula change
+takes seconds instead of one round of Python calls per symbol.
+"""
+import numpy as np
+import pandas as pd
+
+from afv20.score_writer import SCORE_COLUMNS
+from finance_data_sources.yahoo import _GEO_SCORES, _INDUSTRY_SCORES, _SECTOR_SCORES
+
+# (dataset, line item) pairs the score components read
+_LINE_ITEMS = {
+    'ocf':          ('cashflow', 'Operating Cash Flow'),
+    'capex':        ('cashflow', 'Capital Expenditure'),
+    'revenue':      ('financials', 'Total Revenue'),
+    'net_income':   ('financials', 'Net Income'),
+    'total_debt':   ('balance_sheet', 'Total Debt'),
+    'cash':         ('balance_sheet', 'Cash And Cash Equivalents'),
+    'equity':       ('balance_sheet', 'Stockholders Equity'),
+    'total_assets': ('balance_sheet', 'Total Assets'),
+    'bs_ocf':       ('balance_sheet', 'Operating Cash Flow'),
+}
+
+# Latest snapshot per (symbol, dataset), each cell tagged with its period's
+# position in that snapshot (0 = newest), i.e. its column in the yfinance frame.
+_STATEMENTS_SQL = """
+    WITH latest AS (
+        SELECT symbol, dataset, max(ts) AS ts
+        FROM yahoo_statements
+        WHERE symbol IN (SELECT unnest($symbols))
+          AND dataset IN ('cashflow', 'financials', 'balance_sheet')
+          AND ts + INTERVAL 1 MONTH > current_date
+        GROUP BY symbol, dataset
+    ),
+    snapshot AS (
+        SELECT s.symbol, s.dataset, s.line_item, s.period_end, s.value
+        FROM yahoo_statements s
+        JOIN latest l USING (symbol, dataset, ts)
+    ),
+    periods AS (
+        SELECT symbol, dataset, period_end,
+               row_number() OVER (PARTITION BY symbol, dataset ORDER BY period_end DESC) - 1 AS pos
+        FROM (SELECT DISTINCT symbol, dataset, period_end FROM snapshot)
+    )
+    SELECT s.symbol, s.dataset, s.line_item, p.pos, s.period_end, any_value(s.value) AS value
+    FROM snapshot s
+    JOIN periods p USING (symbol, dataset, period_end)
+    WHERE s.line_item IN (SELECT unnest($line_items))
+    GROUP BY ALL
+"""
+
+_INFO_SQL = """
+    SELECT symbol, sector, industry, country, currency, financial_currency,
+           market_cap, trailing_pe, dividend_yield
+    FROM yahoo_info
+    WHERE symbol IN (SELECT unnest($symbols))
+      AND ts + INTERVAL 1 MONTH > current_date
+    QUALIFY row_number() OVER (PARTITION BY symbol ORDER BY ts DESC) = 1
+"""
+
+
+def _matrices(cells: pd.DataFrame, symbols: pd.Index) -> dict[str, tuple[np.ndarray, np.ndarray]]:
+    """name -> (values [symbols × periods] with NaN for missing cells,
+    whether the line item exists in the symbol's snapshot at all).
+    '<dataset>_periods' holds each column's period end as epoch days (-1 if none)."""
+    n_periods = max(4, int(cells['pos'].max()) + 1) if not cells.empty else 4
+    out = {}
+    for name, (dataset, line_item) in _LINE_ITEMS.items():
+        rows = cells[(cells['dataset'] == dataset) & (cells['line_item'] == line_item)]
+        idx = symbols.get_indexer(rows['symbol'])
+        values = np.full((len(symbols), n_periods), np.nan)
+        values[idx, rows['pos'].to_numpy()] = rows['value'].to_numpy(dtype=float)
+        present = np.zeros(len(symbols), dtype=bool)
+        present[idx] = True
+        out[name] = (values, present)
+
+    for dataset in {dataset for dataset, _ in _LINE_ITEMS.values()}:
+        rows = cells[cells['dataset'] == dataset].drop_duplicates(['symbol', 'pos'])
+        periods = np.full((len(symbols), n_periods), -1, dtype=np.int64)
+        days = pd.to_datetime(rows['period_end']).to_numpy().astype('datetime64[D]').astype(np.int64)
+        periods[symbols.get_indexer(rows['symbol']), rows['pos'].to_numpy()] = days
+        out[f'{dataset}_periods'] = periods
+    return out
+
+
+def _align(values: np.ndarray, periods: np.ndarray, onto: np.ndarray) -> np.ndarray:
+    """Reorder each row of `values` (columns dated by `periods`) onto the
+    period columns of `onto`, NaN where a period has no counterpart."""
+    match = (onto[:, :, None] == periods[:, None, :]) & (onto[:, :, None] >= 0)
+    picked = np.take_along_axis(values, match.argmax(axis=2), axis=1)
+    return np.where(match.any(axis=2), picked, np.nan)
+
+
+def _compact(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Series.dropna() per row: non-NaN values shifted left, order kept.
+    Returns (compacted values, count of non-NaN values)."""
+    order = np.argsort(np.isnan(values), axis=1, kind='stable')
+    return np.take_along_axis(values, order, axis=1), (~np.isnan(values)).sum(axis=1)
+
+
+def _head_mean(values: np.ndarray, counts: np.ndarray, n: int) -> np.ndarray:
+    """Mean of the first min(count, n) compacted values per row, NaN if none."""
+    taken = np.minimum(counts, n)
+    mask = np.arange(values.shape[1])[None, :] < taken[:, None]
+    total = np.where(mask, values, 0.0).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(taken > 0, total / taken, np.nan)
+
+
+def _ladder(x: np.ndarray, bounds, scores, default) -> np.ndarray:
+    """Vectorized `if x < b0: s0 elif x < b1: s1 ... else: default`; NaN falls through to default."""
+    with np.errstate(invalid='ignore'):
+        return np.select([x < b for b in bounds], scores, default)
+
+
+def _fcf_yield(m, fx_fin, fx_mkt, market_cap):
+    ocf, ocf_present = m['ocf']
+    capex, capex_present = m['capex']
+    ocf_c, ocf_n = _compact(ocf)
+    capex_c, capex_n = _compact(capex)
+    fcf_mean = _head_mean(ocf_c, ocf_n, 4) + _head_mean(capex_c, capex_n, 4)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        value = (fcf_mean / fx_fin) / (market_cap / fx_mkt)
+    ok = ocf_present & capex_present & (ocf_n > 0) & (capex_n > 0) \
+        & ~np.isnan(market_cap) & ~np.isnan(fx_fin) & ~np.isnan(fx_mkt)
+    return np.where(ok, value, np.nan), ok
+
+
+def _ocf_margin(m, fx_fin):
+    # Oldest four non-NaN values of each series, paired positionally
+    ocf, ocf_present = m['ocf']
+    rev, rev_present = m['revenue']
+    ocf_c, ocf_n = _compact(ocf[:, ::-1])
+    rev_c, rev_n = _compact(rev[:, ::-1])
+    width = min(4, ocf_c.shape[1])
+    pairs = np.minimum(np.minimum(ocf_n, rev_n), 4)
+    ocf_c, rev_c = ocf_c[:, :width], rev_c[:, :width]
+
+    use = (np.arange(width)[None, :] < pairs[:, None]) & (rev_c != 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        margins = (ocf_c / fx_fin[:, None]) / (rev_c / fx_fin[:, None])
+    n_used = use.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg = np.where(use, margins, 0.0).sum(axis=1) / n_used
+    low = np.where(use, margins, np.inf).min(axis=1)
+
+    ok = ocf_present & rev_present & (ocf_n > 0) & (rev_n > 0) & (n_used > 0) & ~np.isnan(fx_fin)
+    avg = np.clip(np.where(ok, avg, np.nan), -2, 2)
+    low = np.clip(np.where(ok, low, np.nan), -2, 2)
+    return avg, low, ok
+
+
+def _ocf_margin_volatility(m):
+    # Aligned on period end dates, like the index intersection it replaces
+    ocf, ocf_present = m['ocf']
+    rev, rev_present = m['revenue']
+    rev = _align(rev, m['financials_periods'], m['cashflow_periods'])
+    common = ~np.isnan(ocf) & ~np.isnan(rev)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        margins = np.where(common, ocf / rev, np.nan)
+    valid = ~np.isnan(margins)
+    n = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, margins, 0.0).sum(axis=1) / n
+        var = np.where(valid, (margins - mean[:, None]) ** 2, 0.0).sum(axis=1) / (n - 1)
+        cv = np.sqrt(var) / np.abs(mean)
+    ok = ocf_present & rev_present & (common.sum(axis=1) >= 3) & (n >= 3) & (mean != 0)
+    return np.where(ok, cv, np.nan)
+
+
+def _net_income_check(m, fx_fin):
+    ni, ni_present = m['net_income']
+    rev, rev_present = m['revenue']
+    ni_c, ni_n = _compact(ni)
+    rev_c, rev_n = _compact(rev)
+    ni_c, rev_c = ni_c[:, :4], rev_c[:, :4]
+    enough = ni_present & rev_present & (ni_n >= 4) & (rev_n >= 4)
+
+    use = enough[:, None] & (rev_c != 0)
+    n_used = use.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        margins = (ni_c / fx_fin[:, None]) / (rev_c / fx_fin[:, None])
+        avg = np.where(use, margins, 0.0).sum(axis=1) / n_used
+    avg = np.where(n_used > 0, avg, 0.0)
+    has_negative = enough & (ni_c < 0).any(axis=1)
+
+    # A missing FX rate makes the per-symbol version fall back to (False, 0.0)
+    failed = ~enough | ((n_used > 0) & np.isnan(fx_fin))
+    return np.where(failed, False, has_negative), np.where(failed, 0.0, avg)
+
+
+def _scaled_rp(fcf, margin, low, vol):
+    with np.errstate(invalid='ignore', over='ignore'):
+        score = np.where(fcf <= 0, -2.0, 7 / (1 + np.exp(-30 * (fcf - 0.15))) - 2)
+
+        has_margin = ~np.isnan(margin)
+        score = np.where(has_margin & (margin < 0), -2.0,
+                np.where(has_margin & (margin < 0.05), score * 0.7,
+                np.where(has_margin & (margin > 0.20), score * 1.2, score)))
+
+        has_low = ~np.isnan(low)
+        deteriorated = (margin != 0) & (low < 0.5 * margin)
+        score = np.where(has_low & (low < 0), -2.0,
+                np.where(has_low & deteriorated, score * 0.7, score))
+
+        score = np.where(vol > 1.0, -2.0,
+                np.where(vol > 0.3, score * 0.5,
+                np.where(vol > 0.15, score * 0.8,
+                np.where(vol < 0.05, score * 1.1, score))))
+
+    return np.maximum(np.minimum(score, 5), -3)
+
+
+def _scaled_rp_21(fcf, margin, low, vol, has_negative, avg_net_margin):
+    with np.errstate(invalid='ignore', over='ignore', divide='ignore'):
+        score = 5.5 / (1 + np.exp(-35 * (fcf - 0.15))) + 0.5
+        score = np.where(has_negative, score * 0.5, score)
+
+        has_margin = ~np.isnan(margin)
+        multiplier = np.clip(0.8 + margin * 2.0, 0.7, 1.3)
+        score = np.where(has_margin, score * multiplier, score)
+
+        has_low = ~np.isnan(low)
+        deteriorated = has_low & (margin != 0) & (low < 0.5 * margin)
+        deterioration = low / (0.5 * margin)
+        score = np.where(deteriorated, score * (0.8 - 0.3 * (1 - deterioration)), score)
+
+        vol_threshold = 0.20
+        score = np.where(vol > vol_threshold,
+                         score * (0.5 + 0.3 * ((1.0 - vol) / (1.0 - vol_threshold))),
+                np.where(vol < 0.05, score * 1.1, score))
+
+        score = np.where(avg_net_margin < 0.05, score * 0.5,
+                np.where(avg_net_margin > 0.15, score * 1.1, score))
+
+        # Early returns of the per-symbol version, in order of precedence
+        forced = (np.isnan(fcf) | (fcf <= 0)) | (has_margin & (margin < 0)) \
+            | (has_low & (low < 0)) | (vol > 1.0)
+    return np.where(forced, -2.0, np.maximum(np.minimum(score, 5), -3))
+
+
+def _debt_score(m):
+    def latest(name, default):
+        values, present = m[name]
+        return np.where(present, values[:, 0], default)
+
+    total_debt = latest('total_debt', 0.0)
+    cash = latest('cash', 0.0)
+    equity = latest('equity', 0.0)
+    total_assets = latest('total_assets', 1.0)
+    ocf = latest('bs_ocf', np.nan)
+
+    net_debt = total_debt - cash
+    with np.errstate(invalid='ignore', divide='ignore'):
+        has_cashflow = (ocf != 0) & (ocf > 0)
+        leverage = np.where(has_cashflow, net_debt / ocf, np.nan)
+        healthy = equity > 0.1 * total_assets
+        net_de_ratio = net_debt / equity
+
+    by_equity = _ladder(net_de_ratio, [0, 0.5, 1.5, 3.0], [1.0, 0.5, 0.0, -0.5], -1.5)
+    by_cashflow = _ladder(leverage, [1, 2, 3, 4], [1.0, 0.5, 0.0, -0.5], -1.5)
+    return np.where(healthy, by_equity, np.where(has_cashflow, by_cashflow, 0.0))
+
+
+def _trend_score(m):
+    ocf, ocf_present = m['ocf']
+    rev, rev_present = m['revenue']
+    head = ocf[:, :4]
+    enough = ocf_present & ~np.isnan(head).any(axis=1)
+
+    oldest_first = head[:, ::-1]
+    a, b = oldest_first[:, :3], oldest_first[:, 1:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rocs = np.where(a != 0, (b - a) / np.abs(a), 0.0)
+    weighted = 0.1 * rocs[:, 0] + 0.3 * rocs[:, 1] + 0.6 * rocs[:, 2]
+
+    with np.errstate(invalid='ignore'):
+        base = np.select(
+            [weighted >= 0.5, weighted >= 0.2, weighted >= -0.2, weighted >= -0.5],
+            [1.0, 0.5, 0.0, -0.5], -1.0,
+        )
+
+    rev_c, rev_n = _compact(rev[:, :4])
+    avg_rev = _head_mean(rev_c, rev_n, 4)
+    avg_ocf = (((oldest_first[:, 0] + oldest_first[:, 1]) + oldest_first[:, 2]) + oldest_first[:, 3]) / 4
+    with np.errstate(invalid='ignore', divide='ignore'):
+        has_margin = rev_present & (avg_rev > 0)
+        margin = avg_ocf / avg_rev
+        score = np.where(~has_margin, base,
+                np.where(margin > 0.10, base,
+                np.where(margin > 0, np.maximum(base - 0.5, -1.0),
+                         np.maximum(base - 1.0, -1.0))))
+    return np.where(enough, score, 0.0)
+
+
+def _vd_score(pe, dividend_yield):
+    dividend_yield = np.nan_to_num(dividend_yield, nan=0.0)
+    with np.errstate(invalid='ignore'):
+        return np.select(
+            [np.isnan(pe) | (pe <= 0), pe > 50, (pe > 20) & (dividend_yield < 1.0), pe > 20, dividend_yield >= 3.0],
+            [-0.5, -1.0, -1.0, -0.5, 0.5], 0.0,
+        )
+
+
+def _fx_divisors(currencies: pd.Series, fx) -> np.ndarray:
+    """Per-row divisor for FxRates.to_eur(): 1 for EUR/unknown, NaN if no rate."""
+    rates = {}
+    for ccy in currencies.dropna().unique():
+        rate = fx.rate(ccy)
+        rates[ccy] = np.nan if rate is None else rate
+    return currencies.map(lambda c: 1.0 if not c or pd.isna(c) else rates[c]).to_numpy(dtype=float)
+
+
+def score_batch(con, symbols: list[str], fx) -> tuple[pd.DataFrame, list[str]]:
+    """
+    Score every symbol whose statements and info are cached in yahoo_statements
+    and yahoo_info. Returns (afv_21_scores rows without computed_at, symbols
+    that lack typed cache rows and must go through the per-symbol scorer).
+    """
+    info = con.execute(_INFO_SQL, {'symbols': symbols}).fetchdf().set_index('symbol')
+    cells = con.execute(_STATEMENTS_SQL, {
+        'symbols': symbols,
+        'line_items': sorted({item for _, item in _LINE_ITEMS.values()}),
+    }).fetchdf()
+
+    datasets = cells.groupby('symbol')['dataset'].nunique() if not cells.empty else pd.Series(dtype=int)
+    complete = set(datasets[datasets == 3].index) & set(info.index)
+    batch = pd.Index(sorted(complete))
+    leftovers = [s for s in symbols if s not in complete]
+    if batch.empty:
+        return pd.DataFrame(columns=SCORE_COLUMNS), leftovers
+
+    info = info.loc[batch]
+    fx.ensure(pd.concat([info['currency'], info['financial_currency']]).dropna().unique())
+    fx_fin = _fx_divisors(info['financial_currency'], fx)
+    fx_mkt = _fx_divisors(info['currency'], fx)
+    market_cap = pd.to_numeric(info['market_cap']).to_numpy(dtype=float)
+
+    m = _matrices(cells[cells['symbol'].isin(complete)], batch)
+    fcf, fcf_ok = _fcf_yield(m, fx_fin, fx_mkt, market_cap)
+    margin, low, margin_ok = _ocf_margin(m, fx_fin)
+    vol = _ocf_margin_volatility(m)
+    has_negative, avg_net_margin = _net_income_check(m, fx_fin)
+
+    rp = _scaled_rp(fcf, margin, low, vol)
+    rp21 = _scaled_rp_21(fcf, margin, low, vol, has_negative, avg_net_margin)
+
+    sector = info['sector']
+    industry = info['industry'].map(_INDUSTRY_SCORES).fillna(0).to_numpy(dtype=float)
+    sector_score = np.where(sector == 'Industrials', industry,
+                            sector.map(_SECTOR_SCORES).fillna(0).to_numpy(dtype=float))
+    geo_score = info['country'].map(lambda c: _GEO_SCORES.get(c, 0.6) if c and not pd.isna(c) else 0) \
+        .to_numpy(dtype=float)
+    debt_score = _debt_score(m)
+    trend_score = _trend_score(m)
+    vd_score = _vd_score(pd.to_numeric(info['trailing_pe']).to_numpy(dtype=float),
+                         pd.to_numeric(info['dividend_yield']).to_numpy(dtype=float))
+
+    financial = (sector == 'Financial Services').to_numpy()
+    rp = np.where(financial, 0.0, rp)
+    rp21 = np.where(financial, 0.0, rp21)
+    debt_score = np.where(financial, 0.0, debt_score)
+    vd_score = np.where(financial | ((sector == 'Industrials').to_numpy() & (industry == -1)), 0.0, vd_score)
+
+    afv = rp + sector_score + geo_score + debt_score + trend_score + vd_score
+    afv21 = rp21 + sector_score + geo_score + debt_score + trend_score + vd_score
+
+    scores = pd.DataFrame({
+        'symbol': batch, 'afv': afv, 'afv21': afv21, 'rp': rp, 'rp21': rp21,
+        'fcf_yield': fcf, 'ocf_margin': margin, 'min_ocf_margin': low, 'ocf_margin_volatility': vol,
+        'sector_score': sector_score, 'geo_score': geo_score, 'debt_score': debt_score,
+        'trend_score': trend_score, 'vd_score': vd_score,
+    })
+
+    # No FCF yield or OCF margin makes the per-symbol scorer raise, which stores -1000
+    failed = ~(fcf_ok & margin_ok)
+    scores.loc[failed, SCORE_COLUMNS[1:]] = 0.0
+    scores.loc[failed, ['afv', 'afv21']] = -1000.0
+    return scores, leftovers
+
+
+def insert_scores(con, scores: pd.DataFrame):
+    """Append batch-computed rows to afv_21_scores in one statement."""
+    if scores.empty:
+        return
+    con.register('_batch_scores', scores[SCORE_COLUMNS])
+    try:
+        con.execute(f"""
+            insert into afv_21_scores ({', '.join(SCORE_COLUMNS)}, computed_at)
+            select {', '.join(SCORE_COLUMNS)}, current_timestamp from _batch_scores
+        """)
+        con.commit()
+    finally:
+        con.unregister('_batch_scores')
@@ -0,0 +1,115 @@
+"""
+Buffered appends to afv_21_scores.
+
+Single-row INSERT + COMMIT per symbol is DuckDB's worst case, so ScoreWriter
+collects score rows in memory and appends them as one DataFrame every
+`flush_rows` rows or `flush_seconds` seconds. Each row is also appended to a
+small JSONL write-ahead file next to the database before it is buffered; the
+file is truncated after every successful flush and replayed on the next start
+if the process died with rows still in memory.
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+import pandas as pd
+
+SCORE_COLUMNS = [
+    'symbol', 'afv', 'afv21', 'rp', 'rp21', 'fcf_yield', 'ocf_margin', 'min_ocf_margin',
+    'ocf_margin_volatility', 'sector_score', 'geo_score', 'debt_score', 'trend_score', 'vd_score',
+]
+
+_INSERT_SQL = f"""
+    insert into afv_21_scores ({', '.join(SCORE_COLUMNS)}, computed_at)
+    select {', '.join(SCORE_COLUMNS)}, computed_at from _score_rows
+"""
+
+# Replayed rows may already be in the table if we died between COMMIT and
+# truncating the log; computed_at is captured per row, so (symbol, computed_at)
+# identifies them.
+_REPLAY_SQL = f"""
+    insert into afv_21_scores ({', '.join(SCORE_COLUMNS)}, computed_at)
+    select {', '.join(f'r.{c}' for c in SCORE_COLUMNS)}, r.computed_at
+    from _score_rows r
+    anti join afv_21_scores s on s.symbol = r.symbol and s.computed_at = r.computed_at
+"""
+
+
+def wal_path_for(db_file_path: str) -> str:
+    return f"{db_file_path}.scores.wal"
+
+
+class ScoreWriter:
+    def __init__(self, con, wal_path: str, flush_rows: int = 500, flush_seconds: float = 30.0):
+        self.con = con
+        self.wal_path = wal_path
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self._rows: list[tuple] = []
+        self._last_flush = time.monotonic()
+        self._wal = None
+
+    def __enter__(self):
+        self.replay()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def replay(self) -> int:
+        """Insert rows left in the write-ahead file by a crashed run."""
+        if not os.path.exists(self.wal_path):
+            return 0
+        rows = []
+        with open(self.wal_path) as f:
+            for line in f:
+                try:
+                    rows.append(tuple(json.loads(line)))
+                except json.JSONDecodeError:
+                    break  # torn final line from the crash
+        if rows:
+            self._write(rows, _REPLAY_SQL)
+            print(f"Replayed {len(rows)} buffered score row(s) from {self.wal_path}")
+        os.remove(self.wal_path)
+        return len(rows)
+
+    def add(self, symbol: str, afv, afv21, rp, rp21, fcf_yield, ocf_margin, min_ocf_margin,
+            ocf_margin_volatility, sector_score, geo_score, debt_score, trend_score, vd_score):
+        row = (symbol, afv, afv21, rp, rp21, fcf_yield, ocf_margin, min_ocf_margin, ocf_margin_volatility,
+               sector_score, geo_score, debt_score, trend_score, vd_score, datetime.now().isoformat())
+        if self._wal is None:
+            self._wal = open(self.wal_path, 'a')
+        self._wal.write(json.dumps([None if v is None else (v if isinstance(v, str) else float(v)) for v in row]) + '\n')
+        self._wal.flush()
+        self._rows.append(row)
+
+        if len(self._rows) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def add_failure(self, symbol: str):
+        self.add(symbol, -1000, -1000, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+
+    def flush(self):
+        if self._rows:
+            self._write(self._rows, _INSERT_SQL)
+            self._rows = []
+        if self._wal is not None:
+            self._wal.close()
+            self._wal = None
+            os.remove(self.wal_path)
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+
+    def _write(self, rows: list[tuple], sql: str):
+        frame = pd.DataFrame.from_records(rows, columns=SCORE_COLUMNS + ['computed_at'])
+        frame = frame.astype({c: float for c in SCORE_COLUMNS[1:]})
+        frame['computed_at'] = pd.to_datetime(frame['computed_at'])
+        self.con.register('_score_rows', frame)
+        try:
+            self.con.execute(sql)
+            self.con.commit()
+        finally:
+            self.con.unregister('_score_rows')
@@ -1,5 +1,7 @@
+import asyncio
 import hmac
 import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
@@ -7,6 +9,9 @@ from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
 
+from api.cache import http_cache
+from api.db import pool
+from api.fx import FX_REFRESH_SECONDS, fx_cache
 from api.routes import dashboard, holdings, prices, scores, screen
 
 API_TOKEN = os.environ.get("AFV_API_TOKEN", "")
@@ -15,12 +20,28 @@ if not API_TOKEN:
 
 limiter = Limiter(key_func=get_remote_address, default_limits=["60/minute"])
 
-app = FastAPI(title="AFV API", version="0.1.0", docs_url=None, redoc_url=None, openapi_url=None)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pool.start()
+    refresher = None
+    if FX_REFRESH_SECONDS > 0:
+        refresher = asyncio.create_task(fx_cache.run_refresher(FX_REFRESH_SECONDS))
+    yield
+    if refresher is not None:
+        refresher.cancel()
+    pool.close()
+
+
+app = FastAPI(title="AFV API", version="0.1.0", docs_url=None, redoc_url=None, openapi_url=None, lifespan=lifespan)
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
 _EXPECTED_HEADER = f"Bearer {API_TOKEN}"
 
+# Registered before auth so that auth, added last, wraps it and runs first
+app.middleware("http")(http_cache)
+
 
 @app.middleware("http")
 async def auth(request: Request, call_next):
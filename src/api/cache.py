@@ -0,0 +1,99 @@
+"""
+HTTP caching for read-only API routes.
+
+Everything the API serves changes only when the CLI writes and calls
+database.db.bump_data_version(), so GET responses are keyed on that
+version. Clients get an ETag and Last-Modified and a 304 when they already
+hold the current version; full responses are kept in a small in-process
+LRU per (path, query) until the version moves on. Streamed responses
+(no Content-Length) and bodies over CACHE_MAX_BYTES pass through uncached,
+with only the validators added.
+"""
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+
+from api.db import pool
+
+CACHE_ENTRIES = int(os.environ.get("AFV_API_CACHE_ENTRIES", "256"))
+CACHE_MAX_BYTES = int(os.environ.get("AFV_API_CACHE_MAX_BYTES", str(1 << 20)))
+
+# Holdings carry user-edited theses and fx-rates has its own TTL cache that
+# may hold live quotes; neither follows the data version
+_UNCACHED = ("/api/holdings", "/api/dashboard/fx-rates")
+
+# Part of every ETag so a deploy (which restarts the service) invalidates
+# what clients cached from the previous code, even at the same data version
+_BOOT = int(time.time())
+_BOOTED_AT = datetime.fromtimestamp(_BOOT, timezone.utc)
+
+_entries: OrderedDict[tuple[str, str], tuple[bytes, dict[str, str]]] = OrderedDict()
+_entries_version = None
+
+
+def _not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def http_cache(request: Request, call_next):
+    global _entries_version
+
+    path = request.url.path
+    if request.method != "GET" or not path.startswith("/api/") or path.startswith(_UNCACHED):
+        return await call_next(request)
+
+    current = await run_in_threadpool(pool.data_version)
+    if current is None:
+        return await call_next(request)
+    version, updated_at = current
+
+    etag = f'"{version}-{_BOOT}"'
+    last_modified = max(updated_at, _BOOTED_AT)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": format_datetime(last_modified.astimezone(timezone.utc), usegmt=True),
+        "Cache-Control": "private, no-cache",
+    }
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    if version != _entries_version:
+        _entries.clear()
+        _entries_version = version
+    key = (path, request.url.query)
+    if key in _entries:
+        _entries.move_to_end(key)
+        body, route_headers = _entries[key]
+        return Response(body, headers={**route_headers, **headers})
+
+    response = await call_next(request)
+    if response.status_code != 200:
+        return response
+    length = response.headers.get("content-length")
+    if length is None or int(length) > CACHE_MAX_BYTES:
+        response.headers.update(headers)
+        return response
+
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    # Response() sets Content-Length for the body itself
+    route_headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+    if version == _entries_version:
+        _entries[key] = (body, route_headers)
+        if len(_entries) > CACHE_ENTRIES:
+            _entries.popitem(last=False)
+    return Response(body, headers={**route_headers, **headers})
@@ -1,32 +1,191 @@
 import os
+import threading
+import time
 import duckdb
 from contextlib import contextmanager
 
+from database.db import release_requested
+
 DB_PATH = os.environ.get("AFV_DB_PATH", "data/finance_data.db")
 
 
 MEM_LIMIT = os.environ.get("AFV_DUCKDB_MEMORY", "500MB")
 
+# Idle cursors kept for reuse; extra ones are closed when handed back
+POOL_SIZE = int(os.environ.get("AFV_DB_POOL_SIZE", "8"))
+
+# Close the instance after this long without requests; the nightly job
+# doesn't depend on it, it asks for the file through release_requested()
+IDLE_SECONDS = float(os.environ.get("AFV_DB_IDLE_SECONDS", "300"))
+
+# How often the reaper looks for a release request
+_RELEASE_POLL_SECONDS = 0.25
+
+
+class ConnectionPool:
+    """
+    One read-only DuckDB instance shared by every request.
+
+    Requests borrow a cursor (a lightweight connection on the shared
+    instance) and hand it back afterwards, so the catalog and buffer pool
+    stay warm between requests. The instance is reopened when the file's
+    inode or mtime changes (the nightly job replaced or rewrote it), closed
+    while a write from this process runs, and released after IDLE_SECONDS
+    without traffic. When another process is waiting for the file lock
+    (database.db.connect leaves a release request) the instance is closed
+    as soon as borrowed cursors come back and not reopened until the
+    request is gone. Closing the instance closes its cursors too, so all of
+    these wait for borrowed cursors to come back first.
+    """
+
+    def __init__(self, path: str, memory_limit: str, size: int = 8, idle_seconds: float = 300.0):
+        self.path = path
+        self.memory_limit = memory_limit
+        self.size = size
+        self.idle_seconds = idle_seconds
+        self._cond = threading.Condition()
+        self._conn = None
+        self._stamp = None
+        self._version = None
+        self._idle: list[duckdb.DuckDBPyConnection] = []
+        self._in_use = 0
+        self._draining = False
+        self._last_used = time.monotonic()
+        self._stop = threading.Event()
+        self._reaper = None
+
+    def _file_stamp(self):
+        st = os.stat(self.path)
+        return st.st_ino, st.st_mtime_ns
+
+    def _drain(self):
+        """Wait (holding the condition) until no cursor is borrowed, then
+        close the instance. Other callers block until _draining is cleared."""
+        self._draining = True
+        self._cond.wait_for(lambda: self._in_use == 0)
+        for cur in self._idle:
+            cur.close()
+        self._idle = []
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _acquire(self) -> duckdb.DuckDBPyConnection:
+        with self._cond:
+            while True:
+                self._cond.wait_for(lambda: not self._draining)
+                if self._conn is not None and self._file_stamp() != self._stamp:
+                    try:
+                        self._drain()
+                    finally:
+                        self._draining = False
+                        self._cond.notify_all()
+                if self._conn is not None or not release_requested(self.path):
+                    break
+                # another process is taking the lock; let it go first
+                self._cond.wait(_RELEASE_POLL_SECONDS)
+            if self._conn is None:
+                self._conn = duckdb.connect(self.path, read_only=True)
+                self._conn.execute(f"SET memory_limit='{self.memory_limit}'")
+                self._stamp = self._file_stamp()
+                self._version = self._read_version(self._conn)
+            cur = self._idle.pop() if self._idle else self._conn.cursor()
+            self._in_use += 1
+            self._last_used = time.monotonic()
+            return cur
+
+    def _release(self, cur: duckdb.DuckDBPyConnection):
+        with self._cond:
+            self._in_use -= 1
+            self._last_used = time.monotonic()
+            if len(self._idle) < self.size:
+                self._idle.append(cur)
+            else:
+                cur.close()
+            self._cond.notify_all()
+
+    @staticmethod
+    def _read_version(conn):
+        try:
+            return conn.execute("SELECT version, updated_at FROM data_version WHERE id = 1").fetchone()
+        except duckdb.CatalogException:
+            return None  # database predates data_version
+
+    def data_version(self):
+        """(version, updated_at) of the data on disk, or None if it was never
+        bumped. Read once per open, since it can only change with the file."""
+        with self.cursor():
+            return self._version
+
+    @contextmanager
+    def cursor(self):
+        cur = self._acquire()
+        try:
+            yield cur
+        finally:
+            self._release(cur)
+
+    @contextmanager
+    def writer(self):
+        """Read-write connection; the shared read-only instance is closed
+        for the duration since DuckDB won't mix the two in one process."""
+        with self._cond:
+            self._cond.wait_for(lambda: not self._draining)
+            self._drain()
+        try:
+            conn = duckdb.connect(self.path, read_only=False)
+            try:
+                yield conn
+            finally:
+                conn.close()
+        finally:
+            with self._cond:
+                self._draining = False
+                self._cond.notify_all()
+
+    def _reap(self):
+        while not self._stop.wait(_RELEASE_POLL_SECONDS):
+            with self._cond:
+                if self._conn is None or self._draining:
+                    continue
+                idle = self._in_use == 0 and time.monotonic() - self._last_used >= self.idle_seconds
+                if idle or release_requested(self.path):
+                    self._drain()
+                    self._draining = False
+                    self._cond.notify_all()
+
+    def start(self):
+        """Open the database (if it exists yet) and start the idle reaper."""
+        if os.path.exists(self.path):
+            with self.cursor():
+                pass
+        if self._reaper is None:
+            self._stop.clear()
+            self._reaper = threading.Thread(target=self._reap, name="duckdb-pool-reaper", daemon=True)
+            self._reaper.start()
+
+    def close(self):
+        self._stop.set()
+        if self._reaper is not None:
+            self._reaper.join()
+            self._reaper = None
+        with self._cond:
+            self._cond.wait_for(lambda: not self._draining)
+            self._drain()
+            self._draining = False
+            self._cond.notify_all()
+
 
-def get_conn() -> duckdb.DuckDBPyConnection:
-    conn = duckdb.connect(DB_PATH, read_only=True)
-    conn.execute(f"SET memory_limit='{MEM_LIMIT}'")
-    return conn
+pool = ConnectionPool(DB_PATH, MEM_LIMIT, POOL_SIZE, IDLE_SECONDS)
 
 
 @contextmanager
 def db_cursor():
-    conn = get_conn()
-    try:
+    with pool.cursor() as conn:
         yield conn
-    finally:
-        conn.close()
 
 
 @contextmanager
 def db_write_cursor():
-    conn = duckdb.connect(DB_PATH, read_only=False)
-    try:
+    with pool.writer() as conn:
         yield conn
-    finally:
-        conn.close()
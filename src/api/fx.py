@@ -0,0 +1,87 @@
+"""
+EUR FX quotes for the dashboard, served from memory.
+
+Rates come from the fx_rates table (kept current by the daily run) and
+are re-read at most every FX_TTL_SECONDS. When FX_REFRESH_SECONDS is set,
+a background task also pulls live quotes for the currencies clients have
+asked for and layers them over the table values. Only currencies already
+in fx_rates are tracked that way, so query strings can't add arbitrary
+tickers to the download. The API only reads the
+database, so live quotes are kept in memory and never stored.
+"""
+import asyncio
+import os
+import re
+import time
+from datetime import date
+
+from fastapi.concurrency import run_in_threadpool
+
+from api.db import db_cursor
+from finance_data_sources.fx import download_eur_rates
+
+FX_TTL_SECONDS = float(os.environ.get("AFV_FX_TTL_SECONDS", "300"))
+FX_REFRESH_SECONDS = float(os.environ.get("AFV_FX_REFRESH_SECONDS", "0"))  # 0 = no live refresh
+
+# Upper bound on the currencies the live refresh downloads
+_MAX_WANTED = 64
+_CURRENCY = re.compile(r"^[A-Z]{3}$")
+
+_LATEST_SQL = """
+    SELECT DISTINCT ON (currency) currency, round(eur_rate::DOUBLE, 6)
+    FROM fx_rates
+    ORDER BY currency, date DESC
+"""
+
+
+class FxCache:
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._stored: dict[str, float] = {}
+        self._loaded_at = None
+        self._live: dict[str, float] = {}
+        self._wanted: set[str] = set()
+        self._lock = asyncio.Lock()
+
+    def _load(self) -> dict[str, float]:
+        with db_cursor() as conn:
+            return dict(conn.execute(_LATEST_SQL).fetchall())
+
+    async def rates(self, currencies) -> dict[str, float]:
+        """Units of each currency per EUR; currencies without a known rate
+        are left out, EUR is always 1.0."""
+        async with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl_seconds:
+                self._stored = await run_in_threadpool(self._load)
+                self._loaded_at = time.monotonic()
+        for ccy in currencies:
+            if len(self._wanted) >= _MAX_WANTED:
+                break
+            if _CURRENCY.match(ccy) and ccy in self._stored:
+                self._wanted.add(ccy)
+        known = {**self._stored, **self._live}
+        rates = {"EUR": 1.0}
+        for ccy in currencies:
+            if ccy in known:
+                rates[ccy] = known[ccy]
+        return rates
+
+    async def refresh_live(self):
+        """Download today's quotes for every currency requested so far."""
+        if not self._wanted:
+            return
+        today = date.today()
+        rows = await run_in_threadpool(download_eur_rates, sorted(self._wanted), today, today)
+        # rows are in date order per currency; the last one wins
+        self._live.update({ccy: rate for _, ccy, rate in rows})
+
+    async def run_refresher(self, interval: float):
+        while True:
+            try:
+                await self.refresh_live()
+            except Exception as e:
+                print(f"FX refresh failed: {e}")
+            await asyncio.sleep(interval)
+
+
+fx_cache = FxCache(FX_TTL_SECONDS)
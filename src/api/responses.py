@@ -0,0 +1,123 @@
+"""
+JSON responses built straight from DuckDB result sets.
+
+Rows are pulled with fetchmany() as plain tuples and encoded once, instead
+of going DataFrame -> to_json -> json.loads -> FastAPI's encoder. NaN and
+±inf become null. orjson is used when installed; the stdlib fallback
+produces the same output, only slower.
+"""
+import json
+import math
+import weakref
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from fastapi import HTTPException
+from fastapi.responses import Response, StreamingResponse
+
+from api.db import db_cursor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_BATCH = 2048
+
+
+def _default(obj):
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default)
+    return json.dumps(content, default=_default, allow_nan=False, separators=(",", ":")).encode()
+
+
+class JSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def _float_columns(description) -> list[int]:
+    return [i for i, col in enumerate(description) if str(col[1]) in ("FLOAT", "DOUBLE")]
+
+
+def _clean(row: tuple, float_cols: list[int]) -> tuple:
+    if not float_cols:
+        return row
+    row = list(row)
+    for i in float_cols:
+        v = row[i]
+        if v is not None and not math.isfinite(v):
+            row[i] = None
+    return tuple(row)
+
+
+def _batches(cur):
+    columns = [col[0] for col in cur.description]
+    float_cols = _float_columns(cur.description)
+    while batch := cur.fetchmany(_BATCH):
+        yield [dict(zip(columns, _clean(row, float_cols))) for row in batch]
+
+
+def records(conn, sql: str, params: dict) -> list[dict]:
+    """Run `sql` and return its rows as JSON-ready dicts."""
+    rows = []
+    for batch in _batches(conn.execute(sql, params)):
+        rows.extend(batch)
+    return rows
+
+
+def first_record(conn, sql: str, params: dict, not_found: str) -> dict:
+    """First row of `sql`, or a 404 with `not_found` as detail."""
+    rows = records(conn, sql, params)
+    if not rows:
+        raise HTTPException(status_code=404, detail=not_found)
+    return rows[0]
+
+
+def stream_records(sql: str, params: dict, not_found: str) -> StreamingResponse:
+    """
+    Stream the rows of `sql` as a JSON array, one fetchmany() batch at a
+    time, so large results are never held in memory whole. The cursor is
+    borrowed for as long as the body is being sent; an empty result is a 404.
+
+    The cursor goes back when the body finishes or fails, or, if the client
+    left before the body was ever started (a generator's finally doesn't run
+    then), when the unstarted body is garbage-collected.
+    """
+    cursor = db_cursor()
+    conn = cursor.__enter__()
+    try:
+        batches = _batches(conn.execute(sql, params))
+        first = next(batches, None)
+    except BaseException:
+        cursor.__exit__(None, None, None)
+        raise
+    if first is None:
+        cursor.__exit__(None, None, None)
+        raise HTTPException(status_code=404, detail=not_found)
+
+    def body():
+        try:
+            yield b"["
+            yield dumps(first)[1:-1]
+            for batch in batches:
+                yield b","
+                yield dumps(batch)[1:-1]
+            yield b"]"
+        finally:
+            release()
+
+    content = body()
+    # runs at most once, whichever of the two comes first
+    release = weakref.finalize(content, cursor.__exit__, None, None, None)
+    return StreamingResponse(content, media_type="application/json")
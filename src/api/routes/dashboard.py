@@ -1,7 +1,13 @@
-from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi import APIRouter, Query, Request
 from typing import Optional
 from api.db import db_cursor, DB_PATH as API_DB_PATH
-from holdings.sharpe import calculate as calculate_sharpe, calculate_history as calculate_sharpe_history
+from api.fx import fx_cache
+from api.responses import JSONResponse, first_record, records
+from holdings.sharpe import (
+    calculate as calculate_sharpe,
+    calculate_history as calculate_sharpe_history,
+    stored_history as stored_sharpe_history,
+)
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
@@ -10,18 +16,6 @@ limiter = Limiter(key_func=get_remote_address)
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
 TOP_PICKS_SQL = """
-WITH latest_ta AS (
-    SELECT DISTINCT ON (symbol) *
-    FROM technical_analysis
-    ORDER BY symbol, computed_at DESC
-),
-latest_scores AS (
-    SELECT DISTINCT ON (symbol)
-        symbol, afv21, rp21, fcf_yield, ocf_margin, sector_score,
-        geo_score, debt_score, trend_score, vd_score, computed_at
-    FROM afv_21_scores
-    ORDER BY symbol, computed_at DESC
-)
 SELECT
     ta.symbol,
     t.asset_name,
@@ -60,19 +54,6 @@ WITH latest_holdings AS (
     FROM holdings
     ORDER BY symbol, fetched_at DESC
 ),
-latest_scores AS (
-    SELECT DISTINCT ON (symbol)
-        symbol, afv21, computed_at
-    FROM afv_21_scores
-    ORDER BY symbol, computed_at DESC
-),
-latest_ta AS (
-    SELECT DISTINCT ON (symbol)
-        symbol, ma_cross_signal, ma_cross_days_ago, rsi14,
-        macd_sentiment, obv_trend, ma200_trend, computed_at
-    FROM technical_analysis
-    ORDER BY symbol, computed_at DESC
-),
 -- For each holding, find the best matching yahoo_ticker via the tickers table.
 -- Prefer the ticker that matches holdings.yahoo_symbol, fall back to any match.
 holding_tickers AS (
@@ -122,17 +103,6 @@ ORDER BY ht.pos_value DESC
 
 
 POTENTIAL_CROSSES_SQL = """
-WITH latest_ta AS (
-    SELECT DISTINCT ON (symbol) *
-    FROM technical_analysis
-    ORDER BY symbol, computed_at DESC
-),
-latest_scores AS (
-    SELECT DISTINCT ON (symbol)
-        symbol, afv21, rp21
-    FROM afv_21_scores
-    ORDER BY symbol, computed_at DESC
-)
 SELECT
     ta.symbol,
     t.asset_name,
@@ -156,17 +126,6 @@ LIMIT $limit
 """
 
 EARLY_RECOVERY_SQL = """
-WITH latest_ta AS (
-    SELECT DISTINCT ON (symbol) *
-    FROM technical_analysis
-    ORDER BY symbol, computed_at DESC
-),
-latest_scores AS (
-    SELECT DISTINCT ON (symbol)
-        symbol, afv21
-    FROM afv_21_scores
-    ORDER BY symbol, computed_at DESC
-)
 SELECT
     ta.symbol,
     t.asset_name,
@@ -210,19 +169,11 @@ SELECT
     ta.ma200_trend,
     ta.ma200_bottom_days_ago,
     ta.computed_at AS ta_computed_at
-FROM technical_analysis ta
+FROM latest_ta ta
 WHERE ta.symbol = $symbol
-ORDER BY ta.computed_at DESC
-LIMIT 1
 """
 
 
-def _rows_to_dicts(conn, sql: str, params: dict) -> list[dict]:
-    import json
-    result = conn.execute(sql, params).fetchdf()
-    return json.loads(result.to_json(orient="records", date_format="iso"))
-
-
 @router.get("/top-picks")
 def top_picks(
     limit: int = Query(50, ge=1, le=500),
@@ -230,12 +181,12 @@ def top_picks(
     ma_cross: Optional[str] = Query(None, pattern="^(golden_cross|death_cross)$"),
 ):
     with db_cursor() as conn:
-        rows = _rows_to_dicts(conn, TOP_PICKS_SQL, {
+        rows = records(conn, TOP_PICKS_SQL, {
             "limit": limit,
             "min_afv21": min_afv21,
             "ma_cross": ma_cross,
         })
-    return {"count": len(rows), "results": rows}
+    return JSONResponse({"count": len(rows), "results": rows})
 
 
 @router.get("/potential-crosses")
@@ -244,11 +195,11 @@ def potential_crosses(
     min_afv21: float = Query(0.0),
 ):
     with db_cursor() as conn:
-        rows = _rows_to_dicts(conn, POTENTIAL_CROSSES_SQL, {
+        rows = records(conn, POTENTIAL_CROSSES_SQL, {
             "limit": limit,
             "min_afv21": min_afv21,
         })
-    return {"count": len(rows), "results": rows}
+    return JSONResponse({"count": len(rows), "results": rows})
 
 
 @router.get("/early-recovery")
@@ -257,22 +208,18 @@ def early_recovery(
     min_afv21: float = Query(0.0),
 ):
     with db_cursor() as conn:
-        rows = _rows_to_dicts(conn, EARLY_RECOVERY_SQL, {
+        rows = records(conn, EARLY_RECOVERY_SQL, {
             "limit": limit,
             "min_afv21": min_afv21,
         })
-    return {"count": len(rows), "results": rows}
+    return JSONResponse({"count": len(rows), "results": rows})
 
 
 @router.get("/ta/{symbol}")
 def ta_detail(symbol: str):
     with db_cursor() as conn:
-        import json
-        df = conn.execute(TA_DETAIL_SQL, {"symbol": symbol}).fetchdf()
-        if df.empty:
-            raise HTTPException(status_code=404, detail=f"No technical analysis data for {symbol}")
-        rows = json.loads(df.to_json(orient="records", date_format="iso"))
-        return rows[0]
+        row = first_record(conn, TA_DETAIL_SQL, {"symbol": symbol}, f"No technical analysis data for {symbol}")
+    return JSONResponse(row)
 
 
 @router.get("/sharpe/history")
@@ -282,35 +229,29 @@ def sharpe_history(
     window: int = Query(252, ge=30, le=504),
     risk_free_rate: float = Query(0.04, ge=0.0, le=1.0),
 ):
-    try:
-        rows = calculate_sharpe_history(db_path=API_DB_PATH, window=window, risk_free_rate=risk_free_rate)
-    except ValueError as e:
-        return {"data": [], "message": str(e)}
+    with db_cursor() as conn:
+        rows = stored_sharpe_history(conn, window=window, risk_free_rate=risk_free_rate)
+    if rows is None:
+        # Window not persisted by the daily run, or holdings changed since
+        try:
+            rows = calculate_sharpe_history(db_path=API_DB_PATH, window=window, risk_free_rate=risk_free_rate)
+        except ValueError as e:
+            return {"data": [], "message": str(e)}
     return {"data": rows, "message": None}
 
 
 @router.get("/holdings")
 def holdings():
     with db_cursor() as conn:
-        rows = _rows_to_dicts(conn, HOLDINGS_SQL, {})
-    return {"count": len(rows), "results": rows}
+        rows = records(conn, HOLDINGS_SQL, {})
+    return JSONResponse({"count": len(rows), "results": rows})
 
 
 @router.get("/fx-rates")
 @limiter.limit("10/minute")
-def fx_rates(request: Request, currencies: str = Query(..., description="Comma-separated currency codes, e.g. USD,SEK,GBP")):
-    import yfinance as yf
+async def fx_rates(request: Request, currencies: str = Query(..., description="Comma-separated currency codes, e.g. USD,SEK,GBP")):
     ccys = [c.strip().upper() for c in currencies.split(',') if c.strip().upper() not in ('', 'EUR')]
-    rates = {'EUR': 1.0}
-    for ccy in ccys:
-        try:
-            info = yf.Ticker(f'EUR{ccy}=X').fast_info
-            rate = getattr(info, 'last_price', None)
-            if rate:
-                rates[ccy] = float(rate)
-        except Exception:
-            pass
-    return rates
+    return await fx_cache.rates(ccys)
 
 
 @router.get("/sharpe")
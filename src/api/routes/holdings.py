@@ -1,6 +1,7 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter
 from pydantic import BaseModel
 from api.db import db_cursor, db_write_cursor
+from api.responses import JSONResponse, first_record
 
 router = APIRouter(prefix="/holdings", tags=["holdings"])
 
@@ -17,13 +18,12 @@ resolved AS (
         ROW_NUMBER() OVER (ORDER BY (t.yahoo_ticker = h.yahoo_symbol) DESC) AS pref
     FROM latest_holding h
     JOIN tickers t ON h.symbol = t.raw_ticker
-    WHERE EXISTS (SELECT 1 FROM afv_21_scores WHERE symbol = t.yahoo_ticker)
+    WHERE EXISTS (SELECT 1 FROM latest_scores WHERE symbol = t.yahoo_ticker)
 ),
 latest_score AS (
-    SELECT DISTINCT ON (symbol) *
-    FROM afv_21_scores
+    SELECT *
+    FROM latest_scores
     WHERE symbol = (SELECT yahoo_ticker FROM resolved WHERE pref = 1)
-    ORDER BY symbol, computed_at DESC
 )
 SELECT
     h.symbol,
@@ -70,12 +70,8 @@ class ThesisBody(BaseModel):
 @router.get("/{symbol}")
 def holding_detail(symbol: str):
     with db_cursor() as conn:
-        import json
-        df = conn.execute(HOLDING_DETAIL_SQL, {"symbol": symbol}).fetchdf()
-        if df.empty:
-            raise HTTPException(status_code=404, detail=f"No holding found for symbol {symbol}")
-        rows = json.loads(df.to_json(orient="records", date_format="iso"))
-        return rows[0]
+        row = first_record(conn, HOLDING_DETAIL_SQL, {"symbol": symbol}, f"No holding found for symbol {symbol}")
+    return JSONResponse(row)
 
 
 @router.put("/{symbol}/thesis")
@@ -1,26 +1,114 @@
-import json
+from datetime import date
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import Response
 
 from api.db import db_cursor
+from api.responses import JSONResponse, stream_records
 
 router = APIRouter(prefix="/prices", tags=["prices"])
 
+# Bucket key per resampling interval
+_INTERVALS = {
+    "1d": "date",
+    "1w": "date_trunc('week', date)",
+    "1mo": "date_trunc('month', date)",
+}
 
-@router.get("/{symbol}")
-def price_history(symbol: str):
-    with db_cursor() as conn:
-        df = conn.execute(
-            """
-            SELECT date::VARCHAR AS date, open, high, low, close, volume
+# Merge the daily bars of one bucket into a single OHLCV bar dated on its
+# first trading day
+_MERGE = """
+    min(date) AS date,
+    arg_min(open, date) AS open,
+    max(high) AS high,
+    min(low) AS low,
+    arg_max(close, date) AS close,
+    sum(volume)::BIGINT AS volume
+"""
+
+# REAL columns are rounded so float32 noise doesn't bloat the payload
+_PRICE_COLUMNS = ("open", "high", "low", "close")
+
+
+def _bars_sql(interval: str, points: Optional[int]) -> str:
+    """Daily bars of $symbol within [$start, $end], resampled to `interval`
+    and, if there are more than `points` bars, merged into `points` buckets
+    of consecutive bars."""
+    sql = f"""
+        WITH daily AS (
+            SELECT date, open, high, low, close, volume
             FROM price_history
             WHERE symbol = $symbol
-            ORDER BY date ASC
-            """,
-            {"symbol": symbol},
-        ).fetchdf()
+              AND ($start::DATE IS NULL OR date >= $start)
+              AND ($end::DATE IS NULL OR date <= $end)
+        ),
+        bars AS (
+            SELECT {_MERGE} FROM daily GROUP BY {_INTERVALS[interval]}
+        )
+    """
+    if points:
+        sql += f""",
+        buckets AS (
+            SELECT *, ntile({int(points)}) OVER (ORDER BY date) AS bucket FROM bars
+        ),
+        sampled AS (
+            SELECT {_MERGE} FROM buckets GROUP BY bucket
+        )
+        """
+    source = "sampled" if points else "bars"
+    prices = ", ".join(
+        f"CASE WHEN isfinite({c}) THEN round({c}::DOUBLE, 4) END AS {c}" for c in _PRICE_COLUMNS
+    )
+    return sql + f"SELECT date::VARCHAR AS date, {prices}, volume FROM {source} ORDER BY date"
+
+
+def _columns_sql(bars_sql: str) -> str:
+    cols = ", ".join(f"list({c} ORDER BY date) AS {c}" for c in ("date",) + _PRICE_COLUMNS + ("volume",))
+    return f"SELECT count(*) AS count, {cols} FROM ({bars_sql})"
 
-    if df.empty:
-        raise HTTPException(status_code=404, detail=f"No price history for {symbol}")
 
-    return json.loads(df.to_json(orient="records"))
+def _arrow_response(bars_sql: str, params: dict, not_found: str) -> Response:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise HTTPException(status_code=400, detail="Arrow output needs pyarrow installed on the server")
+    with db_cursor() as conn:
+        table = conn.execute(bars_sql, params).fetch_arrow_table()
+    if table.num_rows == 0:
+        raise HTTPException(status_code=404, detail=not_found)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(sink.getvalue().to_pybytes(), media_type="application/vnd.apache.arrow.stream")
+
+
+@router.get("/{symbol}")
+def price_history(
+    symbol: str,
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    interval: str = Query("1d", pattern="^(1d|1w|1mo)$"),
+    points: Optional[int] = Query(None, ge=10, le=5000, description="Merge into at most this many bars"),
+    format: str = Query("columns", pattern="^(columns|rows|arrow)$"),
+):
+    """
+    OHLCV bars for a symbol. The default `columns` format returns one array
+    per field ({"count", "date", "open", ..., "volume"}); `rows` returns one
+    object per bar and `arrow` an Arrow IPC stream.
+    """
+    params = {"symbol": symbol, "start": start, "end": end}
+    not_found = f"No price history for {symbol}"
+    bars_sql = _bars_sql(interval, points)
+
+    if format == "rows":
+        return stream_records(bars_sql, params, not_found)
+    if format == "arrow":
+        return _arrow_response(bars_sql, params, not_found)
+
+    with db_cursor() as conn:
+        row = conn.execute(_columns_sql(bars_sql), params).fetchone()
+    if not row[0]:
+        raise HTTPException(status_code=404, detail=not_found)
+    columns = ("count", "date") + _PRICE_COLUMNS + ("volume",)
+    return JSONResponse(dict(zip(columns, row)))
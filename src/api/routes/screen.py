@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException, Query, Request
 from typing import Optional, List
 from api.db import db_cursor
+from api.responses import JSONResponse, records
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
@@ -30,36 +31,11 @@ _SECTORS_BY_INDUSTRY: dict[str, list[str]] = {
 }
 
 SCREEN_SQL = """
-WITH latest_scores AS (
+WITH candidates AS (
     SELECT symbol, afv21, rp21
-    FROM (
-        SELECT DISTINCT ON (symbol)
-            symbol, afv21, rp21
-        FROM afv_21_scores
-        WHERE afv21 > -1000
-        ORDER BY symbol, computed_at DESC
-    )
+    FROM latest_valid_scores
     ORDER BY afv21 DESC
     LIMIT $candidate_limit
-),
-latest_info AS (
-    SELECT DISTINCT ON (yd.symbol)
-        yd.symbol,
-        json_extract_string(yd.data, '$.sector.0')   AS sector,
-        json_extract_string(yd.data, '$.industry.0') AS industry,
-        CAST(json_extract(yd.data, '$.marketCap.0')     AS BIGINT) AS market_cap,
-        CAST(json_extract(yd.data, '$.averageVolume.0') AS BIGINT) AS avg_volume_3m
-    FROM yahoo_data yd
-    JOIN latest_scores ls ON yd.symbol = ls.symbol
-    WHERE yd.dataset = 'info'
-    ORDER BY yd.symbol, yd.ts DESC
-),
-latest_ta AS (
-    SELECT DISTINCT ON (symbol)
-        symbol, ma_cross_signal, ma_cross_days_ago, ma_distance_pct,
-        rsi14, macd_sentiment, obv_trend, ma200_trend, close_price
-    FROM technical_analysis
-    ORDER BY symbol, computed_at DESC
 )
 SELECT
     s.symbol,
@@ -78,7 +54,7 @@ SELECT
     ta.obv_trend,
     ta.ma200_trend,
     ta.close_price
-FROM latest_scores s
+FROM candidates s
 JOIN latest_info i ON s.symbol = i.symbol
 LEFT JOIN latest_ta ta ON s.symbol = ta.symbol
 LEFT JOIN tickers t ON s.symbol = t.yahoo_ticker
@@ -97,12 +73,6 @@ LIMIT $limit
 """
 
 
-def _to_dicts(conn, sql: str, params: dict) -> list[dict]:
-    import json
-    df = conn.execute(sql, params).fetchdf()
-    return json.loads(df.to_json(orient="records", date_format="iso"))
-
-
 @router.get("/options")
 def screen_options():
     return {
@@ -133,7 +103,7 @@ def screen(
     ma_cross_param  = None if potential_cross else ma_cross
 
     with db_cursor() as conn:
-        rows = _to_dicts(conn, SCREEN_SQL, {
+        rows = records(conn, SCREEN_SQL, {
             "candidate_limit": max(1500, limit * 10),
             "min_afv21":       min_afv21,
             "sector":          sector,
@@ -147,4 +117,4 @@ def screen(
             "max_rsi":         max_rsi,
             "limit":           limit,
         })
-    return {"count": len(rows), "results": rows}
+    return JSONResponse({"count": len(rows), "results": rows})
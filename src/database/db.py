@@ -1,22 +1,64 @@
 from pathlib import Path
+import os
 import sys
+import time
 import duckdb
 
 DB_PATH = str(Path(__file__).resolve().parent.parent.parent / 'data' / 'finance_data.db')
 
+# How long connect() keeps retrying while another process holds the file lock
+LOCK_WAIT_SECONDS = 120.0
+_LOCK_RETRY_MAX_DELAY = 0.5
+
+# While connect() waits for a lock it keeps <db>.release fresh; the API
+# server watches for it and closes its shared read-only instance. A request
+# file older than this is left over from a process that died.
+RELEASE_REQUEST_MAX_AGE = 5.0
+
+
+def release_request_path(db_path: str) -> str:
+    return f"{db_path}.release"
+
+
+def release_requested(db_path: str) -> bool:
+    """Whether a process is waiting for the lock on `db_path`."""
+    try:
+        return time.time() - os.path.getmtime(release_request_path(db_path)) < RELEASE_REQUEST_MAX_AGE
+    except FileNotFoundError:
+        return False
+
 
 def connect(db_path: str = DB_PATH, read_only: bool = False) -> duckdb.DuckDBPyConnection:
-    """Open a DuckDB connection. Pass read_only=True when no writes are needed."""
+    """Open a DuckDB connection. Pass read_only=True when no writes are needed.
+
+    A lock held by another process is retried with backoff for up to
+    LOCK_WAIT_SECONDS, asking the API server to let go of the file in the
+    meantime (see release_requested), before giving up."""
+    request = Path(release_request_path(db_path))
+    deadline = time.monotonic() + LOCK_WAIT_SECONDS
+    delay = 0.05
     try:
-        return duckdb.connect(db_path, read_only=read_only)
-    except duckdb.IOException as e:
-        if 'lock' in str(e).lower():
-            print(f"ERROR: {db_path} is locked by another process.")
-            print("You probably have an open DuckDB connection in a Jupyter notebook.")
-            print("Close it with:  con.close()")
-            print("or restart the notebook kernel, then re-run this command.")
-            sys.exit(1)
-        raise
+        while True:
+            try:
+                return duckdb.connect(db_path, read_only=read_only)
+            except duckdb.IOException as e:
+                if 'lock' not in str(e).lower():
+                    raise
+                if time.monotonic() + delay > deadline:
+                    break
+                try:
+                    request.touch()
+                except OSError:
+                    pass
+                time.sleep(delay)
+                delay = min(delay * 2, _LOCK_RETRY_MAX_DELAY)
+    finally:
+        request.unlink(missing_ok=True)
+    print(f"ERROR: {db_path} is still locked by another process after {LOCK_WAIT_SECONDS:.0f}s.")
+    print("You probably have an open DuckDB connection in a Jupyter notebook.")
+    print("Close it with:  con.close()")
+    print("or restart the notebook kernel, then re-run this command.")
+    sys.exit(1)
 
 
 def migrate(db_path: str = DB_PATH):
@@ -45,7 +87,8 @@ def migrate(db_path: str = DB_PATH):
                 high    REAL,
                 low     REAL,
                 close   REAL,
-                volume  BIGINT
+                volume  BIGINT,
+                PRIMARY KEY (symbol, date)
             )
         """)
         con.execute("ALTER TABLE tickers ADD COLUMN IF NOT EXISTS is_dead boolean default false")
@@ -71,6 +114,236 @@ def migrate(db_path: str = DB_PATH):
             )
         """)
 
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS yahoo_statements (
+                symbol     VARCHAR,
+                dataset    VARCHAR, -- 'cashflow', 'quarterly_cashflow', 'financials', 'balance_sheet'
+                line_item  VARCHAR,
+                period_end DATE,
+                value      DOUBLE,
+                ts         TIMESTAMP
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS yahoo_info (
+                symbol             VARCHAR,
+                sector             VARCHAR,
+                industry           VARCHAR,
+                country            VARCHAR,
+                currency           VARCHAR,
+                financial_currency VARCHAR,
+                market_cap         BIGINT,
+                avg_volume_3m      BIGINT,
+                trailing_pe        DOUBLE,
+                dividend_yield     DOUBLE,
+                ts                 TIMESTAMP
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS run_ledger (
+                run_id      TEXT,
+                step        TEXT,
+                status      TEXT,      -- 'running', 'done', 'failed'
+                started_at  TIMESTAMP,
+                finished_at TIMESTAMP,
+                rows        BIGINT,    -- rows the step added to its target table
+                error       TEXT,
+                PRIMARY KEY (run_id, step)
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS data_version (
+                id         INTEGER PRIMARY KEY,  -- single row, id = 1
+                version    BIGINT NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS portfolio_stats_history (
+                window_days     INTEGER,   -- rolling window in trading days
+                date            DATE,
+                ann_return      DOUBLE,
+                ann_vol         DOUBLE,
+                max_drawdown    DOUBLE,
+                portfolio_value DOUBLE,    -- cumulative value, 1.0 at the first return
+                weights_hash    TEXT,      -- holdings positions the row was computed with
+                PRIMARY KEY (window_days, date)
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS ta_state (
+                symbol          TEXT PRIMARY KEY,
+                last_date       DATE,      -- newest bar folded into the state
+                bars            INTEGER,   -- bars up to last_date
+                ema12           DOUBLE,
+                ema26           DOUBLE,
+                macd_signal     DOUBLE,    -- EMA9 of ema12 - ema26
+                obv             DOUBLE,    -- running OBV total
+                last_cross_date DATE,      -- latest MA50/MA200 crossing, NULL if none
+                updated_at      TIMESTAMP
+            )
+        """)
+        # columns of the first ta_state layout, which re-summed history to validate it
+        con.execute("ALTER TABLE ta_state DROP COLUMN IF EXISTS close_sum")
+        con.execute("ALTER TABLE ta_state DROP COLUMN IF EXISTS volume_sum")
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS trading_calendar (
+                mic     TEXT,
+                date    DATE,
+                symbols INTEGER,   -- symbols with a bar that day
+                PRIMARY KEY (mic, date)
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS price_fetch_log (
+                symbol       TEXT,
+                start_date   DATE,
+                end_date     DATE,      -- inclusive
+                requested_at TIMESTAMP,
+                rows         INTEGER    -- bars received for the range
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS price_archive (
+                id   INTEGER PRIMARY KEY,  -- single row, id = 1, only in archive mode
+                root TEXT                  -- Parquet directory behind the price_history view
+            )
+        """)
+        _create_yahoo_cache_view(con)
+        _backfill_yahoo_info(con)
+        _add_price_history_key(con)
+        _create_indexes(con)
+        refresh_snapshots(con)
+
+
+def _create_yahoo_cache_view(con):
+    """One row per cached (symbol, dataset, ts) snapshot, whichever table holds it."""
+    con.execute("""
+        CREATE OR REPLACE VIEW yahoo_cache AS
+        SELECT symbol, dataset, ts FROM yahoo_data
+        UNION ALL
+        SELECT DISTINCT symbol, dataset, ts FROM yahoo_statements
+    """)
+
+
+# Latest row per symbol, rebuilt by the pipeline after each step that writes
+# the source table, so API routes read them instead of running DISTINCT ON
+# over the full history on every request.
+_SNAPSHOTS = {
+    # newest score of any kind, -1000 failures included
+    'latest_scores': """
+        SELECT DISTINCT ON (symbol) * FROM afv_21_scores ORDER BY symbol, computed_at DESC
+    """,
+    # newest successful score
+    'latest_valid_scores': """
+        SELECT DISTINCT ON (symbol) * FROM afv_21_scores WHERE afv21 > -1000 ORDER BY symbol, computed_at DESC
+    """,
+    'latest_ta': """
+        SELECT DISTINCT ON (symbol) * FROM technical_analysis ORDER BY symbol, computed_at DESC
+    """,
+    'latest_info': """
+        SELECT DISTINCT ON (symbol) * FROM yahoo_info ORDER BY symbol, ts DESC
+    """,
+}
+SCORE_SNAPSHOTS = ('latest_scores', 'latest_valid_scores', 'latest_info')
+TA_SNAPSHOTS = ('latest_ta',)
+
+
+def refresh_snapshots(con, tables=tuple(_SNAPSHOTS)):
+    """Rebuild the given latest_* tables (all by default) in one transaction."""
+    con.execute("BEGIN")
+    for table in tables:
+        con.execute(f"CREATE OR REPLACE TABLE {table} AS {_SNAPSHOTS[table]}")
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_symbol ON {table} (symbol)")
+    con.execute("COMMIT")
+
+
+def bump_data_version(db_path: str = DB_PATH):
+    """Mark the data the API serves as changed. The API keys its response
+    cache and ETags on this version, so call it after writes it should see."""
+    with connect(db_path) as con:
+        con.execute("""
+            INSERT INTO data_version (id, version, updated_at) VALUES (1, 1, now())
+            ON CONFLICT (id) DO UPDATE SET
+                version = data_version.version + 1, updated_at = excluded.updated_at
+        """)
+
+
+def _add_price_history_key(con):
+    """Rebuild a keyless price_history with PRIMARY KEY (symbol, date), keeping
+    one row per key, so stores can upsert instead of DELETE + INSERT. Not
+    needed once price_history is the Parquet archive view."""
+    if not _is_table(con, 'price_history'):
+        return
+    has_key = con.execute("""
+        SELECT count(*) FROM duckdb_constraints()
+        WHERE table_name = 'price_history' AND constraint_type = 'PRIMARY KEY'
+    """).fetchone()[0]
+    if has_key:
+        return
+
+    con.execute("BEGIN")
+    con.execute("""
+        CREATE TABLE price_history_keyed (
+            symbol  VARCHAR,
+            date    DATE,
+            open    REAL,
+            high    REAL,
+            low     REAL,
+            close   REAL,
+            volume  BIGINT,
+            PRIMARY KEY (symbol, date)
+        )
+    """)
+    con.execute("""
+        INSERT INTO price_history_keyed
+        SELECT symbol, date, open, high, low, close, volume
+        FROM price_history
+        WHERE symbol IS NOT NULL AND date IS NOT NULL
+        QUALIFY row_number() OVER (PARTITION BY symbol, date) = 1
+    """)
+    con.execute("DROP TABLE price_history")
+    con.execute("ALTER TABLE price_history_keyed RENAME TO price_history")
+    con.execute("COMMIT")
+
+
+def _is_table(con, name: str) -> bool:
+    return con.execute("SELECT count(*) FROM duckdb_tables() WHERE table_name = ?", (name,)).fetchone()[0] > 0
+
+
+def _create_indexes(con):
+    """ART indexes for the per-symbol point lookups of the API and processor.
+    DuckDB only turns single-column equality filters into index scans, so the
+    indexes are on symbol alone; the time column is sorted after the lookup."""
+    for table in ('afv_21_scores', 'yahoo_data', 'yahoo_statements', 'yahoo_info',
+                  'technical_analysis', 'price_history'):
+        if not _is_table(con, table):
+            continue  # price_history in archive mode is a view
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_symbol ON {table} (symbol)")
+
+
+def _backfill_yahoo_info(con):
+    """Populate yahoo_info from the JSON info blobs once, on the first migrate after it was added."""
+    if con.execute("SELECT COUNT(*) FROM yahoo_info").fetchone()[0]:
+        return
+    con.execute("""
+        INSERT INTO yahoo_info
+        SELECT
+            symbol,
+            json_extract_string(data, '$.sector.0'),
+            json_extract_string(data, '$.industry.0'),
+            json_extract_string(data, '$.country.0'),
+            json_extract_string(data, '$.currency.0'),
+            json_extract_string(data, '$.financialCurrency.0'),
+            TRY_CAST(json_extract(data, '$.marketCap.0')     AS BIGINT),
+            TRY_CAST(json_extract(data, '$.averageVolume.0') AS BIGINT),
+            TRY_CAST(json_extract(data, '$.trailingPE.0')    AS DOUBLE),
+            TRY_CAST(json_extract(data, '$.dividendYield.0') AS DOUBLE),
+            ts
+        FROM yahoo_data
+        WHERE dataset = 'info'
+    """)
+
 def init_schema(db_path: str = DB_PATH):
     with connect(db_path) as con:
         con.execute("""
@@ -156,7 +429,8 @@ def init_schema(db_path: str = DB_PATH):
                 high    REAL,
                 low     REAL,
                 close   REAL,
-                volume  BIGINT
+                volume  BIGINT,
+                PRIMARY KEY (symbol, date)
             )
         """)
 
@@ -193,16 +467,119 @@ def init_schema(db_path: str = DB_PATH):
             )
         """)
 
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS yahoo_statements (
+                symbol     VARCHAR,
+                dataset    VARCHAR, -- 'cashflow', 'quarterly_cashflow', 'financials', 'balance_sheet'
+                line_item  VARCHAR,
+                period_end DATE,
+                value      DOUBLE,
+                ts         TIMESTAMP
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS yahoo_info (
+                symbol             VARCHAR,
+                sector             VARCHAR,
+                industry           VARCHAR,
+                country            VARCHAR,
+                currency           VARCHAR,
+                financial_currency VARCHAR,
+                market_cap         BIGINT,
+                avg_volume_3m      BIGINT,
+                trailing_pe        DOUBLE,
+                dividend_yield     DOUBLE,
+                ts                 TIMESTAMP
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS run_ledger (
+                run_id      TEXT,
+                step        TEXT,
+                status      TEXT,      -- 'running', 'done', 'failed'
+                started_at  TIMESTAMP,
+                finished_at TIMESTAMP,
+                rows        BIGINT,    -- rows the step added to its target table
+                error       TEXT,
+                PRIMARY KEY (run_id, step)
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS data_version (
+                id         INTEGER PRIMARY KEY,  -- single row, id = 1
+                version    BIGINT NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS portfolio_stats_history (
+                window_days     INTEGER,   -- rolling window in trading days
+                date            DATE,
+                ann_return      DOUBLE,
+                ann_vol         DOUBLE,
+                max_drawdown    DOUBLE,
+                portfolio_value DOUBLE,    -- cumulative value, 1.0 at the first return
+                weights_hash    TEXT,      -- holdings positions the row was computed with
+                PRIMARY KEY (window_days, date)
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS ta_state (
+                symbol          TEXT PRIMARY KEY,
+                last_date       DATE,      -- newest bar folded into the state
+                bars            INTEGER,   -- bars up to last_date
+                ema12           DOUBLE,
+                ema26           DOUBLE,
+                macd_signal     DOUBLE,    -- EMA9 of ema12 - ema26
+                obv             DOUBLE,    -- running OBV total
+                last_cross_date DATE,      -- latest MA50/MA200 crossing, NULL if none
+                updated_at      TIMESTAMP
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS trading_calendar (
+                mic     TEXT,
+                date    DATE,
+                symbols INTEGER,   -- symbols with a bar that day
+                PRIMARY KEY (mic, date)
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS price_fetch_log (
+                symbol       TEXT,
+                start_date   DATE,
+                end_date     DATE,      -- inclusive
+                requested_at TIMESTAMP,
+                rows         INTEGER    -- bars received for the range
+            )
+        """)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS price_archive (
+                id   INTEGER PRIMARY KEY,  -- single row, id = 1, only in archive mode
+                root TEXT                  -- Parquet directory behind the price_history view
+            )
+        """)
+        _create_yahoo_cache_view(con)
+        _create_indexes(con)
+        refresh_snapshots(con)
+
 def drop_schema(db_path: str = DB_PATH):
     with connect(db_path) as con:
         con.execute("DROP TABLE IF EXISTS tickers;")
+        con.execute("DROP VIEW IF EXISTS yahoo_cache;")
         con.execute("DROP TABLE IF EXISTS yahoo_data;")
+        con.execute("DROP TABLE IF EXISTS yahoo_statements;")
+        con.execute("DROP TABLE IF EXISTS yahoo_info;")
+        con.execute("DROP TABLE IF EXISTS latest_info;")
         con.execute("DROP TABLE IF EXISTS afv_20_scores;")
 
 def truncate_schema(db_path: str = DB_PATH):
     with connect(db_path) as con:
         con.execute("DELETE FROM tickers;")
         con.execute("DELETE FROM yahoo_data;")
+        con.execute("DELETE FROM yahoo_statements;")
+        con.execute("DELETE FROM yahoo_info;")
+        con.execute("DELETE FROM latest_info;")
         con.execute("DELETE FROM afv_20_scores;")
 
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+"""
+EUR FX rates backed by the fx_rates table.
+
+fx_rates.eur_rate is the EURCCY=X quote, i.e. units of `currency` per 1 EUR,
+so a value in `currency` converts as value / eur_rate. Rates are served from
+an in-memory dict keyed by (date, currency); anything the table lacks is
+downloaded for all currencies at once with a single yf.download call and
+persisted, so re-scoring and backtests over known dates never hit the network.
+"""
+import bisect
+from datetime import date, timedelta
+
+import pandas as pd
+import yfinance as yf
+
+# A quote this many days old still counts for a date (weekends, holidays)
+_MAX_AGE_DAYS = 7
+
+
+def download_eur_rates(currencies, start: date, end: date) -> list[tuple[date, str, float]]:
+    """(date, currency, eur_rate) daily closes for [start - _MAX_AGE_DAYS, end],
+    all currencies in one yf.download call. Nothing is stored."""
+    ccys = sorted({c for c in currencies if c and c != 'EUR'})
+    if not ccys:
+        return []
+    pairs = [f'EUR{c}=X' for c in ccys]
+    try:
+        data = yf.download(
+            pairs,
+            start=start - timedelta(days=_MAX_AGE_DAYS),
+            end=end + timedelta(days=1),
+            auto_adjust=False,
+            progress=False,
+        )
+    except Exception as e:
+        print(f"  Warning: FX download failed: {e}")
+        return []
+    if data.empty:
+        return []
+
+    closes = data['Close']
+    if isinstance(closes, pd.Series):
+        closes = closes.to_frame(pairs[0])
+    rows = []
+    for ccy, pair in zip(ccys, pairs):
+        if pair not in closes.columns:
+            continue
+        for ts, value in closes[pair].dropna().items():
+            if value:
+                rows.append((ts.date(), ccy, float(value)))
+    return rows
+
+
+class FxRates:
+    def __init__(self, con):
+        self.con = con
+        self._rates: dict[tuple[date, str], float] = {}
+        self._dates: dict[str, list[date]] = {}  # sorted quote dates per currency
+        self._unavailable: set[tuple[date, str]] = set()  # downloads that came back empty
+        self._loaded = False
+
+    def _put(self, day: date, currency: str, eur_rate: float):
+        if (day, currency) not in self._rates:
+            bisect.insort(self._dates.setdefault(currency, []), day)
+        self._rates[(day, currency)] = eur_rate
+
+    def load(self):
+        """Read every stored rate into memory. Called lazily on first lookup."""
+        for day, currency, eur_rate in self.con.execute(
+            "SELECT date, currency, eur_rate FROM fx_rates"
+        ).fetchall():
+            self._put(day, currency, eur_rate)
+        self._loaded = True
+
+    def rate(self, currency: str, on: date | None = None) -> float | None:
+        """Units of `currency` per EUR as of `on` (default today), or None if
+        no quote within _MAX_AGE_DAYS is known."""
+        if currency == 'EUR':
+            return 1.0
+        if not self._loaded:
+            self.load()
+        on = on or date.today()
+        dates = self._dates.get(currency, [])
+        i = bisect.bisect_right(dates, on)
+        if i and (on - dates[i - 1]).days <= _MAX_AGE_DAYS:
+            return self._rates[(dates[i - 1], currency)]
+        return None
+
+    def refresh(self, currencies, start: date | None = None, end: date | None = None) -> list[str]:
+        """Download EURCCY quotes for all currencies in one batched call and
+        upsert them into fx_rates. Returns the currencies that got a rate."""
+        currencies = list(currencies)
+        end = end or date.today()
+        start = start or end
+        ccys = sorted({c for c in currencies if c and c != 'EUR'})
+
+        rows = []
+        if 'EUR' in currencies:
+            rows.append((end, 'EUR', 1.0))
+        rows += download_eur_rates(ccys, start, end)
+
+        if not rows:
+            return []
+
+        self.con.executemany("""
+            INSERT INTO fx_rates (date, currency, eur_rate)
+            VALUES (?, ?, ?)
+            ON CONFLICT (date, currency) DO UPDATE SET eur_rate = excluded.eur_rate
+        """, rows)
+        for day, currency, eur_rate in rows:
+            self._put(day, currency, eur_rate)
+
+        fetched = sorted({r[1] for r in rows})
+        for ccy in ccys:
+            if ccy not in fetched:
+                print(f"  Warning: could not fetch EUR{ccy} rate")
+        return fetched
+
+    def ensure(self, currencies, start: date | None = None, end: date | None = None):
+        """Download (in one call) only the currencies without a usable rate at
+        both ends of [start, end]."""
+        end = end or date.today()
+        start = start or end
+        missing = [
+            c for c in {c for c in currencies if c}
+            if self.rate(c, start) is None or self.rate(c, end) is None
+        ]
+        if missing:
+            self.refresh(missing, start, end)
+
+    def to_eur(self, value: float, currency: str, on: date | None = None) -> float:
+        if not currency or currency == 'EUR':
+            return value
+        on = on or date.today()
+        eur_rate = self.rate(currency, on)
+        if eur_rate is None and (on, currency) not in self._unavailable:
+            self.ensure([currency], on, on)
+            eur_rate = self.rate(currency, on)
+            if eur_rate is None:
+                self._unavailable.add((on, currency))
+        if eur_rate is None:
+            raise ValueError(f"No EUR{currency} rate available for {on}")
+        return value / eur_rate
@@ -1,6 +1,6 @@
 import random
 import time
-from datetime import timedelta
+from datetime import date, timedelta
 
 import duckdb
 import yfinance as yf
@@ -8,12 +8,241 @@ import numpy as np
 import pandas as pd
 from io import StringIO
 
+from finance_data_sources.fx import FxRates
+
+# Raw yfinance accessor per dataset, used by fetch_datasets() to download
+# without touching the database.
+_DATASET_FETCHERS = {
+    'cashflow':           lambda ticker: ticker.cashflow,
+    'quarterly_cashflow': lambda ticker: ticker.quarterly_cashflow,
+    'financials':         lambda ticker: ticker.financials,
+    'balance_sheet':      lambda ticker: ticker.balance_sheet,
+    'info':               lambda ticker: pd.DataFrame([ticker.info]),
+}
+
+# Financial statements live in the long-format yahoo_statements table,
+# one row per (line_item, period_end) cell, instead of JSON blobs.
+_STATEMENT_DATASETS = {'cashflow', 'quarterly_cashflow', 'financials', 'balance_sheet'}
+
+# Yahoo info keys kept as typed columns in yahoo_info, and their column names.
+_INFO_COLUMNS = {
+    'sector':            'sector',
+    'industry':          'industry',
+    'country':           'country',
+    'currency':          'currency',
+    'financialCurrency': 'financial_currency',
+    'marketCap':         'market_cap',
+    'averageVolume':     'avg_volume_3m',
+    'trailingPE':        'trailing_pe',
+    'dividendYield':     'dividend_yield',
+}
+
+
+# Score lookups, shared with the vectorized batch scorer in afv20.batch_scorer.
+_INDUSTRY_SCORES = {
+    # ✅ Anti-fragile, essential, or resource-linked
+    "Agricultural Inputs": 1,
+    "Farm Products": 1,
+    "Food Distribution": 1,
+    "Grocery Stores": 1,
+    "Packaged Foods": 1,
+    "Beverages - Brewers": 1,
+    "Beverages - Non-Alcoholic": 1,
+    "Beverages - Wineries & Distilleries": 0,  # somewhat cyclical, not core
+    "Oil & Gas Drilling": 1,
+    "Oil & Gas E&P": 1,
+    "Oil & Gas Equipment & Services": 1,
+    "Oil & Gas Integrated": 1,
+    "Oil & Gas Midstream": 1,
+    "Oil & Gas Refining & Marketing": 1,
+    "Utilities - Diversified": 1,
+    "Utilities - Independent Power Producers": 1,
+    "Utilities - Regulated Electric": 1,
+    "Utilities - Regulated Gas": 1,
+    "Utilities - Regulated Water": 1,
+    "Utilities - Renewable": 1,
+    "Waste Management": 1,
+    "Marine Shipping": 1,
+    "Railroads": 1,
+    "Integrated Freight & Logistics": 1,
+    "Farm & Heavy Construction Machinery": 1,
+    "Building Materials": 1,
+    "Building Products & Equipment": 1,
+    "Specialty Industrial Machinery": 1,
+    "Electrical Equipment & Parts": 1,
+    "Metal Fabrication": 1,
+    "Steel": 1,
+    "Copper": 1,
+    "Aluminum": 1,
+    "Gold": 1,
+    "Other Industrial Metals & Mining": 1,
+    "Other Precious Metals & Mining": 1,
+    "Pollution & Treatment Controls": 1,
+    "Tools & Accessories": 1,
+    "Security & Protection Services": 1,
+    "Aerospace & Defense": 1,
+
+    # ⚪ Neutral, mixed resilience
+    "Chemicals": 0,
+    "Specialty Chemicals": 0,
+    "Packaging & Containers": 0,
+    "Paper & Paper Products": 0,
+    "Lumber & Wood Production": 0,
+    "Scientific & Technical Instruments": 0,
+    "Business Equipment & Supplies": 0,
+    "Industrial Distribution": 0,
+    "Rental & Leasing Services": 0,
+    "Specialty Business Services": 0,
+    "Staffing & Employment Services": 0,
+    "Consulting Services": 0,
+    "Conglomerates": 0,
+    "Education & Training Services": 0,
+    "Textile Manufacturing": 0,
+    "Personal Services": 0,
+    "Home Improvement Retail": 0,
+    "Furnishings, Fixtures & Appliances": 0,
+    "Restaurants": 0,
+    "Travel Services": 0,
+    "Leisure": 0,
+    "Resorts & Casinos": 0,
+    "Lodging": 0,
+
+    # ❌ Fragile / bubble-prone / consumer cyclical
+    "Apparel Manufacturing": -1,
+    "Apparel Retail": -1,
+    "Luxury Goods": -1,
+    "Footwear & Accessories": -1,
+    "Auto & Truck Dealerships": -1,
+    "Auto Manufacturers": -1,
+    "Auto Parts": -1,
+    "Recreational Vehicles": -1,
+    "Advertising Agencies": -1,
+    "Electronic Gaming & Multimedia": -1,
+    "Entertainment": -1,
+    "Publishing": -1,
+    "Internet Content & Information": -1,
+    "Internet Retail": -1,
+    "Gambling": -1,
+
+    # ❌ Speculative tech
+    "Semiconductors": -1,
+    "Semiconductor Equipment & Materials": -1,
+    "Computer Hardware": -1,
+    "Electronic Components": -1,
+    "Electronics & Computer Distribution": -1,
+    "Consumer Electronics": -1,
+    "Software - Application": -1,
+    "Software - Infrastructure": -1,
+    "Information Technology Services": -1,
+
+    # ❌ Fragile transport (highly cyclical, fuel sensitive)
+    "Airlines": -1,
+    "Airports & Air Services": -1,
+
+    # ❓ Financials — neutral/fragile depending on philosophy
+    "Banks - Diversified": 0,
+    "Banks - Regional": 0,
+    "Asset Management": 0,
+    "Capital Markets": 0,
+    "Credit Services": 0,
+    "Financial Data & Stock Exchanges": 0,
+    "Insurance - Diversified": 0,
+    "Insurance - Life": 0,
+    "Insurance - Property & Casualty": 0,
+    "Insurance - Reinsurance": 0,
+    "Insurance - Specialty": 0,
+    "Mortgage Finance": 0,
+    "Real Estate Services": 0,
+    "Real Estate - Development": 0,
+    "Real Estate - Diversified": 0,
+    "REIT - Diversified": 0,
+    "REIT - Healthcare Facilities": 0,
+    "REIT - Hotel & Motel": 0,
+    "REIT - Industrial": 0,
+    "REIT - Office": 0,
+    "REIT - Residential": 0,
+    "REIT - Retail": 0,
+
+    # ❓ Healthcare — neutral (not truly anti-fragile, not speculative like biotech)
+    "Biotechnology": -1,
+    "Diagnostics & Research": 0,
+    "Drug Manufacturers - General": 0,
+    "Drug Manufacturers - Specialty & Generic": 0,
+    "Health Information Services": 0,
+    "Healthcare Plans": 0,
+    "Medical Care Facilities": 0,
+    "Medical Devices": 0,
+    "Medical Distribution": 0,
+    "Medical Instruments & Supplies": 0,
+    "Pharmaceutical Retailers": 0,
+
+    # ❓ Telecom
+    "Telecom Services": 0,
+
+    # ❓ Tobacco (declining but still cash cows)
+    "Tobacco": 0,
+}
+
+_SECTOR_SCORES = {
+    "Utilities": 1,
+    "Energy": 1,
+    "Industrials": 1,
+    "Healthcare": 1,
+    "Consumer Defensive": 0.5,
+    "Basic Materials": 0.5,
+    "Technology": 0,
+    "Communication Services": 0,
+    "Consumer Cyclical": -0.5,
+    "Real Estate": -1,
+    "Financial Services": -1
+}
+
+_GEO_SCORES = {
+    'Germany': 1.0,
+    'France': 1.0,
+    'Finland': 1.0,
+    'Sweden': 1.0,
+    'Netherlands': 1.0,
+    'United Kingdom': 1.0,
+    'Switzerland': 1.0,
+    'Norway': 1.0,
+    'United States': 0.8,
+    'Canada': 0.8,
+    'Japan': 0.8,
+    'Australia': 0.7,
+    'Hong Kong': 0.6,
+    'Singapore': 0.6,
+    'South Korea': 0.6,
+    'India': 0.4,
+    'Brazil': 0.4,
+    'China': 0.3,
+    'Russia': -1,
+    'Turkey': -1,
+    'South Africa': -0.5,
+}
+
+
 class YahooFinanceDataSource:
-    def __init__(self, con):
+    def __init__(self, con, limiter=None, fx=None):
         self._ticker_cache = {}
-        self._fx_cache = {}
         self._info_cache = {}
+        # symbol -> {dataset: DataFrame}; cleared per symbol by evict()
+        self._dataset_cache = {}
         self.con = con
+        self.fx = fx if fx is not None else FxRates(con)
+        # Optional utils.rate_limit.TokenBucket shared with other threads
+        self.limiter = limiter
+
+    def _throttle(self):
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+    def evict(self, symbol: str):
+        """Drop everything memoized for a symbol. Call once it has been scored
+        so memory stays flat over a full-universe run."""
+        self._dataset_cache.pop(symbol, None)
+        self._info_cache.pop(symbol, None)
+        self._ticker_cache.pop(symbol, None)
 
     def _get_ticker(self, symbol):
         if symbol not in self._ticker_cache:
@@ -23,6 +252,7 @@ class YahooFinanceDataSource:
     def _fetch_with_retry(self, fetch_fn, max_attempts=3):
         for attempt in range(max_attempts):
             try:
+                self._throttle()
                 result = fetch_fn()
                 if result is not None and (not hasattr(result, 'empty') or not result.empty):
                     return result
@@ -73,17 +303,20 @@ class YahooFinanceDataSource:
         if symbol in self._info_cache:
             return self._info_cache[symbol]
 
-        data = self._get_yahoo_data(symbol, 'info')
-
-        if data is None or data.empty:
-            ticker = self._get_ticker(symbol)
-            info = self._fetch_with_retry(lambda: pd.DataFrame([ticker.info]))
-            if info is None or info.empty:
-                raise Exception(f"Could not fetch info for {symbol} after retries")
-            self._store_yahoo_data(symbol, 'info', info)
-            result = info.iloc[0].to_dict()
-        else:
-            result = data.iloc[0].to_dict()
+        result = self._get_info_row(symbol)
+        if result is None:
+            # Info cached before yahoo_info existed is only available as JSON
+            data = self._get_yahoo_data(symbol, 'info')
+
+            if data is None or data.empty:
+                ticker = self._get_ticker(symbol)
+                info = self._fetch_with_retry(lambda: pd.DataFrame([ticker.info]))
+                if info is None or info.empty:
+                    raise Exception(f"Could not fetch info for {symbol} after retries")
+                self._store_yahoo_data(symbol, 'info', info)
+                result = info.iloc[0].to_dict()
+            else:
+                result = data.iloc[0].to_dict()
 
         self._info_cache[symbol] = result
         return result
@@ -115,15 +348,110 @@ class YahooFinanceDataSource:
         return data
 
     def _store_yahoo_data(self, symbol: str, dataset: str, data: pd.DataFrame):
-        json_str = data.to_json()
+        self._dataset_cache.setdefault(symbol, {})[dataset] = data
         jitter_days = random.uniform(0, 3)
         ts = pd.Timestamp.now() + timedelta(days=jitter_days)
+
+        if dataset in _STATEMENT_DATASETS:
+            self._store_statement(symbol, dataset, data, ts)
+            return
+
+        json_str = data.to_json()
         self.con.execute(
             "insert into yahoo_data (symbol, dataset, data, ts) values (?, ?, ?, ?)",
             (symbol, dataset, json_str, ts)
         )
+        if dataset == 'info':
+            self._store_info_row(symbol, data.iloc[0].to_dict(), ts)
+
+    def _store_statement(self, symbol: str, dataset: str, data: pd.DataFrame, ts):
+        values = data.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+        n_items, n_periods = values.shape
+        long = pd.DataFrame({
+            'line_item':  np.repeat(data.index.astype(str).to_numpy(), n_periods),
+            'period_end': np.tile(pd.to_datetime(data.columns).date, n_items),
+            'value':      values.ravel(),
+        })
+
+        self.con.register('_stmt_rows', long)
+        try:
+            self.con.execute("""
+                insert into yahoo_statements (symbol, dataset, line_item, period_end, value, ts)
+                select ?, ?, line_item, period_end, value, ? from _stmt_rows
+            """, (symbol, dataset, ts))
+        finally:
+            self.con.unregister('_stmt_rows')
+
+    def _store_info_row(self, symbol: str, info: dict, ts):
+        values = []
+        for key, column in _INFO_COLUMNS.items():
+            value = info.get(key)
+            if value is not None and pd.isna(value):
+                value = None
+            if value is not None and column in ('market_cap', 'avg_volume_3m'):
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    value = None
+            values.append(value)
+
+        columns = ', '.join(_INFO_COLUMNS.values())
+        placeholders = ', '.join('?' * (len(_INFO_COLUMNS) + 2))
+        self.con.execute(
+            f"insert into yahoo_info (symbol, {columns}, ts) values ({placeholders})",
+            (symbol, *values, ts)
+        )
+
+    def _get_info_row(self, symbol: str) -> dict | None:
+        """Latest typed info snapshot keyed by the original Yahoo field names."""
+        columns = ', '.join(_INFO_COLUMNS.values())
+        row = self.con.execute(
+            f"select {columns} from yahoo_info where symbol = ? and ts + interval 1 month > current_date order by ts desc limit 1",
+            (symbol,)
+        ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(_INFO_COLUMNS.keys(), row))
+
+    def _get_statement(self, symbol: str, dataset: str) -> pd.DataFrame | None:
+        """Rebuild the yfinance-shaped frame (line items × period ends, newest
+        period first) from the latest cached snapshot in yahoo_statements."""
+        rows = self.con.execute("""
+            select line_item, period_end, value
+            from yahoo_statements
+            where symbol = ? and dataset = ? and ts = (
+                select max(ts) from yahoo_statements
+                where symbol = ? and dataset = ? and ts + interval 1 month > current_date
+            )
+        """, (symbol, dataset, symbol, dataset)).fetchdf()
+
+        if rows.empty:
+            return None
+
+        rows = rows.drop_duplicates(['line_item', 'period_end'])
+        frame = rows.pivot(index='line_item', columns='period_end', values='value')
+        frame.columns = pd.to_datetime(frame.columns)
+        frame.columns.name = None
+        frame.index.name = None
+        return frame.sort_index(axis=1, ascending=False).astype(float)
+
     def _get_yahoo_data(self, symbol: str, dataset: str):
-        # Check if we have cached data
+        memo = self._dataset_cache.get(symbol, {})
+        if dataset in memo:
+            return memo[dataset]
+
+        data = self._load_yahoo_data(symbol, dataset)
+        if data is not None:
+            self._dataset_cache.setdefault(symbol, {})[dataset] = data
+        return data
+
+    def _load_yahoo_data(self, symbol: str, dataset: str):
+        if dataset in _STATEMENT_DATASETS:
+            frame = self._get_statement(symbol, dataset)
+            if frame is not None:
+                return frame
+
+        # JSON blobs: info, history, and statements cached before yahoo_statements existed
         result = self.con.execute(
             "select data from yahoo_data where symbol = ? and dataset = ? and ts + interval 1 month > current_date order by ts desc limit 1",
             (symbol, dataset,)
@@ -135,26 +463,12 @@ class YahooFinanceDataSource:
 
             return df
 
-    def normalize_to_eur(self, value: float, currency: str) -> float:
-        if not currency or currency == "EUR":
-            return value
-
-        if currency in self._fx_cache:
-            return value * self._fx_cache[currency]
-
-        fx_pair = f"{currency}EUR=X"
-        try:
-            fx_rate = self._get_ticker(fx_pair).history(period="1d")["Close"].iloc[-1]
-        except Exception:
-            inverted_pair = f"EUR{currency}=X"
-            fx_rate_inv = self._get_ticker(inverted_pair).history(period="1d")["Close"].iloc[-1]
-            fx_rate = 1 / fx_rate_inv
-
-        self._fx_cache[currency] = fx_rate
-        return value * fx_rate
+    def normalize_to_eur(self, value: float, currency: str, on: date | None = None) -> float:
+        return self.fx.to_eur(value, currency, on)
 
     def can_be_found(self, symbol: str) -> bool:
         ticker = self._get_ticker(symbol)
+        self._throttle()
         try:
             fi = ticker.fast_info
             if fi is not None:
@@ -187,6 +501,26 @@ class YahooFinanceDataSource:
                 failed.add(name)
         return failed
 
+    def fetch_datasets(self, symbol: str, datasets) -> tuple[dict[str, pd.DataFrame], set[str]]:
+        """Download datasets from Yahoo without touching the database.
+        Safe to call from worker threads; persist the frames with store_datasets()
+        on the thread that owns the connection. Returns (frames, failed names)."""
+        ticker = self._get_ticker(symbol)
+        frames, failed = {}, set()
+        for name in sorted(datasets):
+            fetch = _DATASET_FETCHERS[name]
+            data = self._fetch_with_retry(lambda: fetch(ticker))
+            if data is None or data.empty:
+                print(f"Prefetch failed for {symbol} [{name}]: no data after retries")
+                failed.add(name)
+            else:
+                frames[name] = data
+        return frames, failed
+
+    def store_datasets(self, symbol: str, frames: dict[str, pd.DataFrame]):
+        for name, data in frames.items():
+            self._store_yahoo_data(symbol, name, data)
+
     def fcf_yield(self, symbol: str) -> float | None:
         """Fetch Operating Cash Flow (TTM) from Yahoo Finance"""
         try:
@@ -419,150 +753,6 @@ class YahooFinanceDataSource:
         return info.get("sector", None)
 
     def industry_score(self, symbol: str) -> float:
-        industry_scores = {
-            # ✅ Anti-fragile, essential, or resource-linked
-            "Agricultural Inputs": 1,
-            "Farm Products": 1,
-            "Food Distribution": 1,
-            "Grocery Stores": 1,
-            "Packaged Foods": 1,
-            "Beverages - Brewers": 1,
-            "Beverages - Non-Alcoholic": 1,
-            "Beverages - Wineries & Distilleries": 0,  # somewhat cyclical, not core
-            "Oil & Gas Drilling": 1,
-            "Oil & Gas E&P": 1,
-            "Oil & Gas Equipment & Services": 1,
-            "Oil & Gas Integrated": 1,
-            "Oil & Gas Midstream": 1,
-            "Oil & Gas Refining & Marketing": 1,
-            "Utilities - Diversified": 1,
-            "Utilities - Independent Power Producers": 1,
-            "Utilities - Regulated Electric": 1,
-            "Utilities - Regulated Gas": 1,
-            "Utilities - Regulated Water": 1,
-            "Utilities - Renewable": 1,
-            "Waste Management": 1,
-            "Marine Shipping": 1,
-            "Railroads": 1,
-            "Integrated Freight & Logistics": 1,
-            "Farm & Heavy Construction Machinery": 1,
-            "Building Materials": 1,
-            "Building Products & Equipment": 1,
-            "Specialty Industrial Machinery": 1,
-            "Electrical Equipment & Parts": 1,
-            "Metal Fabrication": 1,
-            "Steel": 1,
-            "Copper": 1,
-            "Aluminum": 1,
-            "Gold": 1,
-            "Other Industrial Metals & Mining": 1,
-            "Other Precious Metals & Mining": 1,
-            "Pollution & Treatment Controls": 1,
-            "Tools & Accessories": 1,
-            "Security & Protection Services": 1,
-            "Aerospace & Defense": 1,
-
-            # ⚪ Neutral, mixed resilience
-            "Chemicals": 0,
-            "Specialty Chemicals": 0,
-            "Packaging & Containers": 0,
-            "Paper & Paper Products": 0,
-            "Lumber & Wood Production": 0,
-            "Scientific & Technical Instruments": 0,
-            "Business Equipment & Supplies": 0,
-            "Industrial Distribution": 0,
-            "Rental & Leasing Services": 0,
-            "Specialty Business Services": 0,
-            "Staffing & Employment Services": 0,
-            "Consulting Services": 0,
-            "Conglomerates": 0,
-            "Education & Training Services": 0,
-            "Textile Manufacturing": 0,
-            "Personal Services": 0,
-            "Home Improvement Retail": 0,
-            "Furnishings, Fixtures & Appliances": 0,
-            "Restaurants": 0,
-            "Travel Services": 0,
-            "Leisure": 0,
-            "Resorts & Casinos": 0,
-            "Lodging": 0,
-
-            # ❌ Fragile / bubble-prone / consumer cyclical
-            "Apparel Manufacturing": -1,
-            "Apparel Retail": -1,
-            "Luxury Goods": -1,
-            "Footwear & Accessories": -1,
-            "Auto & Truck Dealerships": -1,
-            "Auto Manufacturers": -1,
-            "Auto Parts": -1,
-            "Recreational Vehicles": -1,
-            "Advertising Agencies": -1,
-            "Electronic Gaming & Multimedia": -1,
-            "Entertainment": -1,
-            "Publishing": -1,
-            "Internet Content & Information": -1,
-            "Internet Retail": -1,
-            "Gambling": -1,
-
-            # ❌ Speculative tech
-            "Semiconductors": -1,
-            "Semiconductor Equipment & Materials": -1,
-            "Computer Hardware": -1,
-            "Electronic Components": -1,
-            "Electronics & Computer Distribution": -1,
-            "Consumer Electronics": -1,
-            "Software - Application": -1,
-            "Software - Infrastructure": -1,
-            "Information Technology Services": -1,
-
-            # ❌ Fragile transport (highly cyclical, fuel sensitive)
-            "Airlines": -1,
-            "Airports & Air Services": -1,
-
-            # ❓ Financials — neutral/fragile depending on philosophy
-            "Banks - Diversified": 0,
-            "Banks - Regional": 0,
-            "Asset Management": 0,
-            "Capital Markets": 0,
-            "Credit Services": 0,
-            "Financial Data & Stock Exchanges": 0,
-            "Insurance - Diversified": 0,
-            "Insurance - Life": 0,
-            "Insurance - Property & Casualty": 0,
-            "Insurance - Reinsurance": 0,
-            "Insurance - Specialty": 0,
-            "Mortgage Finance": 0,
-            "Real Estate Services": 0,
-            "Real Estate - Development": 0,
-            "Real Estate - Diversified": 0,
-            "REIT - Diversified": 0,
-            "REIT - Healthcare Facilities": 0,
-            "REIT - Hotel & Motel": 0,
-            "REIT - Industrial": 0,
-            "REIT - Office": 0,
-            "REIT - Residential": 0,
-            "REIT - Retail": 0,
-
-            # ❓ Healthcare — neutral (not truly anti-fragile, not speculative like biotech)
-            "Biotechnology": -1,
-            "Diagnostics & Research": 0,
-            "Drug Manufacturers - General": 0,
-            "Drug Manufacturers - Specialty & Generic": 0,
-            "Health Information Services": 0,
-            "Healthcare Plans": 0,
-            "Medical Care Facilities": 0,
-            "Medical Devices": 0,
-            "Medical Distribution": 0,
-            "Medical Instruments & Supplies": 0,
-            "Pharmaceutical Retailers": 0,
-
-            # ❓ Telecom
-            "Telecom Services": 0,
-
-            # ❓ Tobacco (declining but still cash cows)
-            "Tobacco": 0,
-        }
-
         info = self._get_info(symbol)
         industry = info.get("industry", None)
         print(f"Industry for {symbol}: {industry}")
@@ -570,23 +760,9 @@ class YahooFinanceDataSource:
         if not industry:
             return 0  # Neutral if unknown
 
-        return industry_scores.get(industry, 0)  # Default to 0 if industry is unmapped
+        return _INDUSTRY_SCORES.get(industry, 0)  # Default to 0 if industry is unmapped
 
     def sector_score(self, symbol: str) -> float:
-        SECTOR_SCORE_MAP = {
-            "Utilities": 1,
-            "Energy": 1,
-            "Industrials": 1,
-            "Healthcare": 1,
-            "Consumer Defensive": 0.5,
-            "Basic Materials": 0.5,
-            "Technology": 0,
-            "Communication Services": 0,
-            "Consumer Cyclical": -0.5,
-            "Real Estate": -1,
-            "Financial Services": -1
-        }
-
         try:
             info = self._get_info(symbol)
             sector = info.get("sector", None)
@@ -599,7 +775,7 @@ class YahooFinanceDataSource:
             if sector == "Industrials":
                 return industry_score
 
-            return SECTOR_SCORE_MAP.get(sector, 0)  # Default to 0 if sector is unmappe
+            return _SECTOR_SCORES.get(sector, 0)  # Default to 0 if sector is unmappe
         except Exception as e:
             print(f"Error fetching sector for {symbol}: {e}")
             return None
@@ -614,31 +790,7 @@ class YahooFinanceDataSource:
             if not country:
                 return 0  # Neutral if unknown
 
-            geo_scores = {
-                'Germany': 1.0,
-                'France': 1.0,
-                'Finland': 1.0,
-                'Sweden': 1.0,
-                'Netherlands': 1.0,
-                'United Kingdom': 1.0,
-                'Switzerland': 1.0,
-                'Norway': 1.0,
-                'United States': 0.8,
-                'Canada': 0.8,
-                'Japan': 0.8,
-                'Australia': 0.7,
-                'Hong Kong': 0.6,
-                'Singapore': 0.6,
-                'South Korea': 0.6,
-                'India': 0.4,
-                'Brazil': 0.4,
-                'China': 0.3,
-                'Russia': -1,
-                'Turkey': -1,
-                'South Africa': -0.5,
-            }
-
-            return geo_scores.get(country, 0.6)  # Default: neutral score
+            return _GEO_SCORES.get(country, 0.6)  # Default: neutral score
         except Exception as e:
             print(f"Error fetching country for {symbol}: {e}")
             return None
@@ -1,4 +1,5 @@
 """Portfolio Sharpe ratio calculator using holdings + price_history from DB."""
+import hashlib
 import sys
 from datetime import date, timedelta
 from pathlib import Path
@@ -11,6 +12,9 @@ from database.db import connect, DB_PATH
 
 _TRADING_DAYS = 252
 
+# Rolling windows the daily run persists to portfolio_stats_history
+HISTORY_WINDOWS = (252,)
+
 
 def _load_holdings_weights(con) -> dict[str, float]:
     rows = con.execute("""
@@ -114,23 +118,9 @@ def calculate(db_path: str = DB_PATH, lookback_days: int = 365,
     }
 
 
-def calculate_history(db_path: str = DB_PATH, window: int = 252,
-                      risk_free_rate: float = 0.04) -> list[dict]:
-    """
-    Compute rolling portfolio stats (Sharpe, ann_return, ann_vol, max_drawdown)
-    for every date in price history. Uses current holdings as fixed weights.
-    window = rolling window in trading days (default 252 = 1 year).
-    """
-    with connect(db_path, read_only=True) as con:
-        weights_raw = _load_holdings_weights(con)
-        if not weights_raw:
-            raise ValueError("No holdings in DB. Run 'holdings save' first.")
-        cutoff = date(2000, 1, 1)  # all available history
-        prices = _load_prices(con, list(weights_raw.keys()), cutoff)
-
-    if prices.empty:
-        raise ValueError("No price history found for holdings.")
-
+def _portfolio_returns(prices: pd.DataFrame, weights_raw: dict[str, float]) -> pd.Series:
+    """Daily returns of the holdings at fixed weights, from the first day
+    any of them has a price."""
     prices = prices.dropna(axis=1, thresh=30)
     weights = {s: v for s, v in weights_raw.items() if s in set(prices.columns)}
     if not weights:
@@ -142,42 +132,214 @@ def calculate_history(db_path: str = DB_PATH, window: int = 252,
 
     daily_returns = prices.ffill().pct_change(fill_method=None).fillna(0.0)
     portfolio_returns = daily_returns.dot(weight_vec)
-    portfolio_returns = portfolio_returns.loc[portfolio_returns.ne(0.0).cummax()]
-
-    min_periods = min(30, window)
+    return portfolio_returns.loc[portfolio_returns.ne(0.0).cummax()]
 
-    ann_return = portfolio_returns.rolling(window, min_periods=min_periods).mean() * _TRADING_DAYS
-    ann_vol    = portfolio_returns.rolling(window, min_periods=min_periods).std() * np.sqrt(_TRADING_DAYS)
-    sharpe     = (ann_return - risk_free_rate) / ann_vol.replace(0, np.nan)
 
-    def _max_dd(arr):
-        cum = np.cumprod(1 + arr)
-        peak = np.maximum.accumulate(cum)
-        return float(((cum - peak) / peak).min())
+def _rolling_stats(portfolio_returns: pd.Series, window: int) -> pd.DataFrame:
+    """Rolling ann_return, ann_vol and max_drawdown; NaN until 30 returns
+    (or `window`, if smaller) are available."""
+    min_periods = min(30, window)
+    rolling = portfolio_returns.rolling(window, min_periods=min_periods)
 
-    max_dd = portfolio_returns.rolling(window, min_periods=min_periods).apply(_max_dd, raw=True)
+    return pd.DataFrame({
+        "ann_return":   rolling.mean() * _TRADING_DAYS,
+        "ann_vol":      rolling.std() * np.sqrt(_TRADING_DAYS),
+        "max_drawdown": _rolling_max_drawdown(portfolio_returns.values, window, min_periods),
+    }, index=portfolio_returns.index)
 
-    cum_value = (1 + portfolio_returns).cumprod()
-    cum_value = cum_value / cum_value.iloc[0]
 
+def _rolling_max_drawdown(returns: np.ndarray, window: int, min_periods: int) -> np.ndarray:
+    """
+    Max drawdown of every trailing `window` of daily returns, as a
+    rolling(window, min_periods).apply of cumprod/maximum.accumulate would
+    give, without a Python call per window.
+
+    Within a window the drawdown at day k is C[k] / max(C[start..k]) - 1,
+    where C is the cumulative product over the whole series (the window's
+    own cumprod differs only by a constant factor). All windows advance
+    together: step d updates each window's running peak and worst ratio
+    with its d-th element, so the work is `window` in-place ufunc passes
+    over n values. C is left-padded with C[0] for the first window - 1
+    rows; a flat stretch before the first day adds no drawdown and doesn't
+    change any peak, so short windows come out right.
+    """
+    n = len(returns)
+    if n == 0:
+        return np.empty(0)
+    cum = np.cumprod(1 + returns)
+    padded = np.concatenate([np.full(window - 1, cum[0]), cum])
+
+    peak = padded[:n].copy()
+    worst = np.ones(n)
+    ratio = np.empty(n)
+    for d in range(1, window):
+        day = padded[d:d + n]
+        np.maximum(peak, day, out=peak)
+        np.divide(day, peak, out=ratio)
+        np.minimum(worst, ratio, out=worst)
+
+    out = worst - 1
+    out[:min_periods - 1] = np.nan
+    return out
+
+
+def _history_rows(dates, ann_return, ann_vol, max_dd, portfolio_value, risk_free_rate: float) -> list[dict]:
     result = []
-    for ts, sh, ar, av, md in zip(
-        sharpe.index, sharpe.values, ann_return.values, ann_vol.values, max_dd.values
-    ):
-        if any(np.isnan(v) for v in [sh, ar, av, md]):
+    for ts, ar, av, md, pv in zip(dates, ann_return, ann_vol, max_dd, portfolio_value):
+        if any(np.isnan(v) for v in [ar, av, md]) or av == 0:
             continue
         result.append({
-            "date":            str(ts.date()),
-            "sharpe":          round(float(sh), 4),
+            "date":            str(ts)[:10],
+            "sharpe":          round(float((ar - risk_free_rate) / av), 4),
             "ann_return":      round(float(ar), 4),
             "ann_vol":         round(float(av), 4),
             "max_drawdown":    round(float(md), 4),
-            "portfolio_value": round(float(cum_value.loc[ts]), 4),
+            "portfolio_value": round(float(pv), 4),
         })
-
     return result
 
 
+def calculate_history(db_path: str = DB_PATH, window: int = 252,
+                      risk_free_rate: float = 0.04) -> list[dict]:
+    """
+    Compute rolling portfolio stats (Sharpe, ann_return, ann_vol, max_drawdown)
+    for every date in price history. Uses current holdings as fixed weights.
+    window = rolling window in trading days (default 252 = 1 year).
+    """
+    with connect(db_path, read_only=True) as con:
+        weights_raw = _load_holdings_weights(con)
+        if not weights_raw:
+            raise ValueError("No holdings in DB. Run 'holdings save' first.")
+        cutoff = date(2000, 1, 1)  # all available history
+        prices = _load_prices(con, list(weights_raw.keys()), cutoff)
+
+    if prices.empty:
+        raise ValueError("No price history found for holdings.")
+
+    portfolio_returns = _portfolio_returns(prices, weights_raw)
+    stats = _rolling_stats(portfolio_returns, window)
+
+    cum_value = (1 + portfolio_returns).cumprod()
+    cum_value = cum_value / cum_value.iloc[0]
+
+    return _history_rows(
+        stats.index, stats["ann_return"].values, stats["ann_vol"].values,
+        stats["max_drawdown"].values, cum_value.values, risk_free_rate,
+    )
+
+
+def _positions_hash(con) -> str:
+    """
+    Key of the stored series: symbol -> position quantity of the latest
+    holdings snapshot. Market values move daily with prices and would force
+    a rebuild on every run, so only a change in what is held (a trade, a
+    symbol added or dropped) starts a new series.
+    """
+    rows = con.execute("""
+        SELECT yahoo_symbol, sum(position)
+        FROM holdings
+        WHERE fetched_at::DATE = (SELECT MAX(fetched_at)::DATE FROM holdings)
+          AND pos_value > 0 AND yahoo_symbol IS NOT NULL AND yahoo_symbol != ''
+        GROUP BY yahoo_symbol
+        ORDER BY yahoo_symbol
+    """).fetchall()
+    key = ";".join(f"{s}={q:.6f}" for s, q in rows)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def update_history(db_path: str = DB_PATH, windows: tuple[int, ...] = HISTORY_WINDOWS) -> None:
+    """
+    Persist the rolling stats of calculate_history into portfolio_stats_history
+    (risk-free rate excluded, so any rate can be applied on read). While the
+    held positions are unchanged only dates after the last stored one are
+    computed, from just enough price history to fill their windows; a
+    change in positions rebuilds the whole series.
+    """
+    with connect(db_path) as con:
+        weights_raw = _load_holdings_weights(con)
+        if not weights_raw:
+            print("  No holdings in DB, skipping portfolio stats.")
+            return
+        weights_hash = _positions_hash(con)
+
+        for window in windows:
+            last = con.execute("""
+                SELECT date, portfolio_value, weights_hash
+                FROM portfolio_stats_history
+                WHERE window_days = ?
+                ORDER BY date DESC
+                LIMIT 1
+            """, [window]).fetchone()
+            if last and last[2] != weights_hash:
+                last = None
+            # ~1.5 calendar days per trading day covers the window before `last`
+            since = last[0] - timedelta(days=int(window * 1.5) + 14) if last else date(2000, 1, 1)
+
+            prices = _load_prices(con, list(weights_raw.keys()), since)
+            if prices.empty:
+                print(f"  No price history for holdings, skipping {window}-day stats.")
+                continue
+            try:
+                portfolio_returns = _portfolio_returns(prices, weights_raw)
+            except ValueError as e:
+                print(f"  {e}")
+                continue
+
+            stats = _rolling_stats(portfolio_returns, window).dropna()
+            cum_value = (1 + portfolio_returns).cumprod()
+            if last and pd.Timestamp(last[0]) in cum_value.index:
+                cum_value = last[1] * cum_value / cum_value.loc[pd.Timestamp(last[0])]
+                stats = stats.loc[stats.index > pd.Timestamp(last[0])]
+            else:
+                last = None
+                cum_value = cum_value / cum_value.iloc[0]
+
+            frame = stats.assign(
+                window_days=window,
+                date=stats.index.date,
+                portfolio_value=cum_value.reindex(stats.index).values,
+                weights_hash=weights_hash,
+            )
+            con.register('_stats_rows', frame)
+            try:
+                con.execute("BEGIN")
+                try:
+                    if last is None:
+                        con.execute("DELETE FROM portfolio_stats_history WHERE window_days = ?", [window])
+                    con.execute("""
+                        INSERT OR REPLACE INTO portfolio_stats_history
+                            (window_days, date, ann_return, ann_vol, max_drawdown, portfolio_value, weights_hash)
+                        SELECT window_days, date, ann_return, ann_vol, max_drawdown, portfolio_value, weights_hash
+                        FROM _stats_rows
+                    """)
+                    con.execute("COMMIT")
+                except Exception:
+                    con.execute("ROLLBACK")
+                    raise
+            finally:
+                con.unregister('_stats_rows')
+            mode = "appended" if last else "rebuilt with"
+            print(f"  {window}-day portfolio stats: {mode} {len(frame)} row(s)")
+
+
+def stored_history(con, window: int = 252, risk_free_rate: float = 0.04) -> list[dict] | None:
+    """calculate_history's output read from portfolio_stats_history, or None
+    if the window isn't stored or was computed for different positions."""
+    if not _load_holdings_weights(con):
+        return None
+    df = con.execute("""
+        SELECT date, ann_return, ann_vol, max_drawdown, portfolio_value
+        FROM portfolio_stats_history
+        WHERE window_days = ? AND weights_hash = ?
+        ORDER BY date
+    """, [window, _positions_hash(con)]).fetchnumpy()
+    if not len(df["date"]):
+        return None
+    return _history_rows(
+        df["date"], df["ann_return"], df["ann_vol"], df["max_drawdown"], df["portfolio_value"], risk_free_rate,
+    )
+
+
 def compute(db_path: str = DB_PATH, lookback_days: int = 365,
             risk_free_rate: float = 0.04) -> None:
     try:
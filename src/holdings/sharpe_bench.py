@@ -0,0 +1,74 @@
+"""
+Benchmark the rolling max-drawdown used by sharpe.calculate_history against
+the previous per-window rolling().apply implementation.
+
+Synthetic data: `years` of business days for `holdings` symbols with random
+daily returns, combined at random weights like _portfolio_returns does.
+
+    python src/holdings/sharpe_bench.py [--years 20] [--holdings 50] [--window 252]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from holdings.sharpe import _rolling_max_drawdown
+
+
+def _max_dd_apply(portfolio_returns: pd.Series, window: int, min_periods: int) -> np.ndarray:
+    """The implementation _rolling_max_drawdown replaced."""
+    def _max_dd(arr):
+        cum = np.cumprod(1 + arr)
+        peak = np.maximum.accumulate(cum)
+        return float(((cum - peak) / peak).min())
+
+    return portfolio_returns.rolling(window, min_periods=min_periods).apply(_max_dd, raw=True).values
+
+
+def _portfolio(years: int, holdings: int, seed: int = 0) -> pd.Series:
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=years * 252)
+    returns = pd.DataFrame(rng.normal(0.0003, 0.018, (len(dates), holdings)), index=dates)
+    weights = rng.random(holdings)
+    return returns.dot(weights / weights.sum())
+
+
+def _time(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--years', type=int, default=20)
+    parser.add_argument('--holdings', type=int, default=50)
+    parser.add_argument('--window', type=int, default=252)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    returns = _portfolio(args.years, args.holdings)
+    min_periods = min(30, args.window)
+    print(f"{len(returns)} trading days, {args.holdings} holdings, window {args.window}")
+
+    old = _max_dd_apply(returns, args.window, min_periods)
+    new = _rolling_max_drawdown(returns.values, args.window, min_periods)
+    if not np.allclose(old, new, equal_nan=True, rtol=0, atol=1e-12):
+        print(f"MISMATCH: max abs diff {np.nanmax(np.abs(old - new)):.3g}")
+        sys.exit(1)
+
+    t_old = _time(lambda: _max_dd_apply(returns, args.window, min_periods), args.repeat)
+    t_new = _time(lambda: _rolling_max_drawdown(returns.values, args.window, min_periods), args.repeat)
+    print(f"  rolling().apply : {t_old * 1000:9.1f} ms")
+    print(f"  vectorized      : {t_new * 1000:9.1f} ms  ({t_old / t_new:.0f}x faster, results match)")
+
+
+if __name__ == '__main__':
+    main()
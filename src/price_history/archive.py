@@ -0,0 +1,181 @@
+"""
+Optional Parquet archive for price_history.
+
+In archive mode the bars live outside the database file, in Hive-
+partitioned Parquet under a directory: <root>/year=YYYY/bucket=X/data0.parquet,
+where the bucket is the symbol's first character. Every file is sorted
+by (symbol, date), so each file covers a narrow symbol range and DuckDB
+skips files and row groups by their min/max statistics on symbol-filtered
+reads. The database file keeps everything else and stays small.
+
+price_history becomes a view with the same columns, so readers don't
+change. Writers upsert into price_history_delta, a small keyed table that
+the view lays over the archive (its rows win). compact() folds the delta
+into the partitions it touches and empties it. Each partition is
+rewritten to a temporary file that then replaces the old one, so a
+reader or a crash mid-compaction only ever sees whole files.
+
+    python main.py prices archive --dir data/price_archive   # switch over
+    python main.py prices compact                            # fold in the delta
+"""
+import os
+import uuid
+from pathlib import Path
+
+from database.db import connect
+
+_DELTA = 'price_history_delta'
+
+# Hive partition value for a symbol; anything but A-Z/0-9 shares '_'
+_BUCKET_SQL = """
+    CASE WHEN regexp_matches(upper(left(symbol, 1)), '^[A-Z0-9]$')
+         THEN upper(left(symbol, 1)) ELSE '_' END
+"""
+
+_COLUMNS = 'symbol, date, open, high, low, close, volume'
+
+
+def _read_sql(root: str, year: str = '*', bucket: str = '*') -> str:
+    return (f"read_parquet('{root}/year={year}/bucket={bucket}/*.parquet', hive_partitioning = true, "
+            f"hive_types = {{'year': INTEGER, 'bucket': VARCHAR}})")
+
+
+def _view_sql(root: str) -> str:
+    return f"""
+        CREATE OR REPLACE VIEW price_history AS
+        SELECT {_COLUMNS} FROM {_DELTA}
+        UNION ALL
+        SELECT a.symbol, a.date, a.open, a.high, a.low, a.close, a.volume
+        FROM {_read_sql(root)} a
+        ANTI JOIN {_DELTA} d ON a.symbol = d.symbol AND a.date = d.date
+    """
+
+
+def archive_root(con) -> str | None:
+    """The archive directory, or None when price_history is a plain table."""
+    row = con.execute("SELECT root FROM price_archive WHERE id = 1").fetchone()
+    return row[0] if row else None
+
+
+def write_table(con) -> str:
+    """Table that price upserts go to: the delta in archive mode."""
+    return _DELTA if archive_root(con) else 'price_history'
+
+
+def enable(db_path: str, root: str) -> None:
+    """Move price_history into a Parquet archive under `root` and replace
+    it with the archive view. `root` must not exist yet."""
+    root = str(Path(root).resolve())
+    with connect(db_path) as con:
+        if archive_root(con):
+            print(f"price_history is already archived under {archive_root(con)}.")
+            return
+        if os.path.exists(root):
+            raise ValueError(f"{root} already exists; pick a new directory for the archive")
+        rows = con.execute("SELECT count(*) FROM price_history").fetchone()[0]
+        if not rows:
+            raise ValueError("price_history is empty; fetch prices before archiving")
+
+        print(f"Writing {rows:,} price rows to {root}…")
+        con.execute(f"""
+            COPY (
+                SELECT {_COLUMNS}, year(date) AS year, {_BUCKET_SQL} AS bucket
+                FROM price_history
+                ORDER BY symbol, date
+            ) TO '{root}' (FORMAT PARQUET, PARTITION_BY (year, bucket), FILENAME_PATTERN 'data')
+        """)
+
+        con.execute("BEGIN")
+        con.execute(f"""
+            CREATE TABLE {_DELTA} (
+                symbol  VARCHAR,
+                date    DATE,
+                open    REAL,
+                high    REAL,
+                low     REAL,
+                close   REAL,
+                volume  BIGINT,
+                PRIMARY KEY (symbol, date)
+            )
+        """)
+        con.execute("DROP TABLE price_history")
+        con.execute(_view_sql(root))
+        con.execute("INSERT INTO price_archive (id, root) VALUES (1, ?)", (root,))
+        con.execute("COMMIT")
+    _rewrite_file(db_path)
+    print("price_history now reads from the archive.")
+
+
+def _rewrite_file(db_path: str) -> None:
+    """Copy the database into a fresh file and swap it in. DuckDB reuses the
+    blocks of a dropped table but never shrinks the file, so this is what
+    actually gives back the space the moved prices took."""
+    tmp = f"{db_path}.rewrite"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    with connect(db_path) as con:
+        name = con.execute("SELECT current_database()").fetchone()[0]
+        con.execute(f"ATTACH '{tmp}' AS rewrite")
+        con.execute(f'COPY FROM DATABASE "{name}" TO rewrite')
+        con.execute("DETACH rewrite")
+    before = os.path.getsize(db_path)
+    os.replace(tmp, db_path)
+    print(f"Database file: {before / 1e6:,.1f} MB → {os.path.getsize(db_path) / 1e6:,.1f} MB.")
+
+
+def compact(con) -> int:
+    """
+    Rewrite every archive partition the delta touches with the delta's
+    rows merged in, then empty the delta. Returns the number of partitions
+    rewritten; 0 when not in archive mode or the delta is empty.
+    """
+    root = archive_root(con)
+    if not root:
+        return 0
+    partitions = con.execute(f"""
+        SELECT DISTINCT year(date) AS year, {_BUCKET_SQL} AS bucket FROM {_DELTA} ORDER BY 1, 2
+    """).fetchall()
+
+    for year, bucket in partitions:
+        part_dir = Path(root) / f"year={year}" / f"bucket={bucket}"
+        old_files = sorted(part_dir.glob('*.parquet'))
+        part_dir.mkdir(parents=True, exist_ok=True)
+        existing = ''
+        if old_files:
+            existing = f"""
+                UNION ALL
+                SELECT a.symbol, a.date, a.open, a.high, a.low, a.close, a.volume
+                FROM {_read_sql(root, year, bucket)} a
+                ANTI JOIN {_DELTA} d ON a.symbol = d.symbol AND a.date = d.date
+            """
+        tmp = part_dir / f".compact-{uuid.uuid4().hex}.tmp"
+        con.execute(f"""
+            COPY (
+                SELECT * FROM (
+                    SELECT {_COLUMNS} FROM {_DELTA}
+                    WHERE year(date) = ? AND {_BUCKET_SQL} = ?
+                    {existing}
+                )
+                ORDER BY symbol, date
+            ) TO '{tmp}' (FORMAT PARQUET)
+        """, (year, bucket))
+        target = part_dir / 'data0.parquet'
+        os.replace(tmp, target)
+        for f in old_files:
+            if f != target:
+                f.unlink()
+
+    con.execute(f"DELETE FROM {_DELTA}")
+    con.execute("CHECKPOINT")
+    return len(partitions)
+
+
+def compact_db(db_path: str) -> None:
+    """CLI entry point for compact()."""
+    with connect(db_path) as con:
+        if not archive_root(con):
+            print("price_history is not archived; nothing to compact.")
+            return
+        pending = con.execute(f"SELECT count(*) FROM {_DELTA}").fetchone()[0]
+        rewritten = compact(con)
+        print(f"Compacted {pending:,} new price rows into {rewritten} archive partition(s).")
@@ -1,16 +1,54 @@
-import random
 import sys
-import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, time, timedelta
 from pathlib import Path
+from zoneinfo import ZoneInfo
 
 import pandas as pd
 import yfinance as yf
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 from database.db import connect
+from price_history import archive, trading_calendar
+from utils.rate_limit import AdaptiveRateLimiter
 
 _BATCH_SIZE = 50
-_MIN_DAYS = 400  # below this a symbol gets a 2y backfill; ~1.6 years trading days
+
+# Batches in flight at once, and their pace in batches per second: it
+# starts near the old fixed 2-4s gap, halves on an error or empty
+# response and creeps back up while responses are healthy
+_DOWNLOAD_WORKERS = 4
+_BATCH_RATE = 0.33
+_MIN_BATCH_RATE = 0.05
+_MAX_BATCH_RATE = 2.0
+# History the daily run keeps per symbol, in calendar days back from the
+# last session; a symbol whose first bar is within the slack of that
+# start counts as complete
+_HISTORY_DAYS = 730
+_HISTORY_SLACK_DAYS = 7
+
+# Exchange timezone and closing time by Yahoo symbol suffix; no suffix is a
+# US listing. Other suffixes fall back to end of day UTC.
+_EXCHANGE_CLOSE = {
+    '':    ('America/New_York',  time(16, 0)),
+    '.L':  ('Europe/London',     time(16, 35)),
+    '.DE': ('Europe/Berlin',     time(17, 35)),
+    '.PA': ('Europe/Paris',      time(17, 35)),
+    '.AS': ('Europe/Amsterdam',  time(17, 35)),
+    '.BR': ('Europe/Brussels',   time(17, 35)),
+    '.LS': ('Europe/Lisbon',     time(16, 35)),
+    '.MI': ('Europe/Rome',       time(17, 35)),
+    '.MC': ('Europe/Madrid',     time(17, 35)),
+    '.SW': ('Europe/Zurich',     time(17, 30)),
+    '.VI': ('Europe/Vienna',     time(17, 35)),
+    '.ST': ('Europe/Stockholm',  time(17, 30)),
+    '.OL': ('Europe/Oslo',       time(16, 25)),
+    '.CO': ('Europe/Copenhagen', time(17, 0)),
+    '.HE': ('Europe/Helsinki',   time(18, 30)),
+    '.WA': ('Europe/Warsaw',     time(17, 5)),
+    '.AT': ('Europe/Athens',     time(17, 20)),
+}
+_DEFAULT_CLOSE = ('UTC', time(23, 59))
 
 
 def _ta_symbols(con, top: int) -> list[str]:
@@ -41,12 +79,13 @@ def _ta_symbols(con, top: int) -> list[str]:
 
 
 def _coverage(con, symbols: list[str]) -> pd.DataFrame:
-    """Return a DataFrame with columns [symbol, days] for the given symbol list."""
+    """Return a DataFrame with columns [symbol, first_date, last_date] for the
+    given symbol list; both are NaT for symbols without history."""
     sym_df = pd.DataFrame({'symbol': symbols})
     con.register('_cov_syms', sym_df)
     try:
         return con.execute("""
-            SELECT s.symbol, COUNT(ph.date) AS days
+            SELECT s.symbol, MIN(ph.date) AS first_date, MAX(ph.date) AS last_date
             FROM _cov_syms s
             LEFT JOIN price_history ph ON ph.symbol = s.symbol
             GROUP BY s.symbol
@@ -55,61 +94,233 @@ def _coverage(con, symbols: list[str]) -> pd.DataFrame:
         con.unregister('_cov_syms')
 
 
-def _download(symbols: list[str], period: str) -> dict[str, pd.DataFrame]:
-    histories: dict[str, pd.DataFrame] = {}
-    total_batches = (len(symbols) + _BATCH_SIZE - 1) // _BATCH_SIZE
+def _requested(con, symbols: list[str]) -> dict[str, list[tuple[date, date]]]:
+    """Ranges already asked for per symbol, from price_fetch_log."""
+    con.register('_log_syms', pd.DataFrame({'symbol': symbols}))
+    try:
+        rows = con.execute("""
+            SELECT l.symbol, l.start_date, l.end_date
+            FROM price_fetch_log l
+            JOIN _log_syms s ON l.symbol = s.symbol
+        """).fetchall()
+    finally:
+        con.unregister('_log_syms')
+    requested: dict[str, list[tuple[date, date]]] = {}
+    for symbol, start, end in rows:
+        requested.setdefault(symbol, []).append((start, end))
+    return requested
+
+
+def _log_requests(con, group: list[str], start: date, end: date,
+                  histories: dict[str, pd.DataFrame]) -> None:
+    """Record that [start, end] was requested for each symbol and how many
+    bars came back."""
+    rows = []
+    for symbol in group:
+        df = histories.get(symbol)
+        got = 0 if df is None else int(((df.index.date >= start) & (df.index.date <= end)).sum())
+        rows.append((symbol, start, end, got))
+    con.register('_log_rows', pd.DataFrame(rows, columns=['symbol', 'start_date', 'end_date', 'rows']))
+    try:
+        con.execute("""
+            INSERT INTO price_fetch_log (symbol, start_date, end_date, requested_at, rows)
+            SELECT symbol, start_date, end_date, now(), rows FROM _log_rows
+        """)
+    finally:
+        con.unregister('_log_rows')
+
+
+def _last_session(symbol: str, now: datetime | None = None) -> date:
+    """
+    Date of the symbol's exchange's most recent closed session: today once
+    the local close has passed, otherwise the weekday before. Holidays are
+    not known here, so the day after one still counts as missing.
+    """
+    suffix = '.' + symbol.rsplit('.', 1)[1] if '.' in symbol else ''
+    tz, close = _EXCHANGE_CLOSE.get(suffix, _DEFAULT_CLOSE)
+    local = (now or datetime.now(ZoneInfo('UTC'))).astimezone(ZoneInfo(tz))
+    day = local.date() if local.time() >= close else local.date() - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
 
-    for i in range(0, len(symbols), _BATCH_SIZE):
-        batch = symbols[i:i + _BATCH_SIZE]
-        batch_num = i // _BATCH_SIZE + 1
-        print(f"  Batch {batch_num}/{total_batches} ({len(batch)} symbols)…")
 
+def _download_batch(batch: list[str], span: dict, limiter: AdaptiveRateLimiter,
+                    empty_is_failure: bool = True) -> dict[str, pd.DataFrame]:
+    """One yf.download call, paced by `limiter` and reported back to it."""
+    limiter.acquire()
+    try:
+        data = yf.download(batch, **span, auto_adjust=True, progress=False)
+    except Exception:
+        limiter.failure()
+        raise
+    if data is None or data.empty:
+        if empty_is_failure:
+            limiter.failure()
+        return {}
+    limiter.success()
+
+    histories = {}
+    for symbol in batch:
         try:
-            data = yf.download(batch, period=period, auto_adjust=True, progress=False)
-            if data.empty:
+            df = data.xs(symbol, axis=1, level=1).dropna(how='all')
+            if not df.empty and 'Close' in df.columns:
+                histories[symbol] = df
+        except KeyError:
+            pass
+    return histories
+
+
+def _download(symbols: list[str], period: str | None = None, start: date | None = None,
+              end: date | None = None) -> dict[str, pd.DataFrame]:
+    """
+    Daily bars for `symbols`, either for a yfinance period or from start
+    up to (not including) end.
+
+    _DOWNLOAD_WORKERS batches run at once, paced by an AdaptiveRateLimiter
+    that backs off on errors and empty responses. Symbols missing afterwards
+    (failed batches, or dropped from a partial one) are retried one at a
+    time; an empty single-symbol response just means no bars, so it doesn't
+    slow the pace down.
+    """
+    span = {'period': period} if period else {'start': start, 'end': end}
+    batches = [symbols[i:i + _BATCH_SIZE] for i in range(0, len(symbols), _BATCH_SIZE)]
+    limiter = AdaptiveRateLimiter(_BATCH_RATE, _MIN_BATCH_RATE, _MAX_BATCH_RATE)
+    histories: dict[str, pd.DataFrame] = {}
+
+    with ThreadPoolExecutor(max_workers=_DOWNLOAD_WORKERS) as pool:
+        futures = {pool.submit(_download_batch, batch, span, limiter): n
+                   for n, batch in enumerate(batches, 1)}
+        for future in as_completed(futures):
+            n = futures[future]
+            try:
+                got = future.result()
+            except Exception as e:
+                print(f"  Batch {n}/{len(batches)} error: {e}")
                 continue
-            for symbol in batch:
+            histories.update(got)
+            print(f"  Batch {n}/{len(batches)}: {len(got)}/{len(batches[n - 1])} symbols "
+                  f"(pace {limiter.rate:.2f} batches/s)")
+
+        missing = [s for s in symbols if s not in histories]
+        if missing:
+            print(f"  Retrying {len(missing)} symbol(s) individually…")
+            retries = [pool.submit(_download_batch, [s], span, limiter, False) for s in missing]
+            for future in as_completed(retries):
                 try:
-                    df = data.xs(symbol, axis=1, level=1).dropna(how='all')
-                    if not df.empty and 'Close' in df.columns:
-                        histories[symbol] = df
-                except KeyError:
+                    histories.update(future.result())
+                except Exception:
                     pass
-        except Exception as e:
-            print(f"  Batch {batch_num} error: {e}")
-
-        if i + _BATCH_SIZE < len(symbols):
-            time.sleep(random.uniform(2, 4))
+            still_missing = [s for s in missing if s not in histories]
+            if still_missing:
+                shown = ', '.join(still_missing[:10]) + (' …' if len(still_missing) > 10 else '')
+                print(f"  No data for {len(still_missing)} symbol(s): {shown}")
 
     return histories
 
 
-def _store(con, histories: dict[str, pd.DataFrame]) -> None:
+# price_history, or its delta table in archive mode (see archive.write_table)
+_UPSERT_SQL = """
+    INSERT INTO {table} (symbol, date, open, high, low, close, volume)
+    SELECT symbol, date, open, high, low, close, volume FROM _ph_rows
+    ON CONFLICT (symbol, date) DO UPDATE SET
+        open = excluded.open, high = excluded.high, low = excluded.low,
+        close = excluded.close, volume = excluded.volume
+"""
+
+
+# Symbols whose incoming rows add or change a bar at or before their
+# ta_state.last_date: their stored TA state no longer matches the history,
+# so it is dropped and technical_analysis recomputes them in full. Only the
+# incoming rows are compared, so the check costs nothing per stored bar.
+_STALE_TA_STATE_SQL = """
+    DELETE FROM ta_state
+    WHERE symbol IN (
+        SELECT r.symbol
+        FROM _ph_rows r
+        JOIN ta_state s ON r.symbol = s.symbol AND r.date <= s.last_date
+        LEFT JOIN price_history p ON p.symbol = r.symbol AND p.date = r.date
+        WHERE p.symbol IS NULL
+           OR p.close IS DISTINCT FROM r.close::REAL
+           OR p.volume IS DISTINCT FROM r.volume::BIGINT
+    )
+"""
+
+
+def _price_frame(histories: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """All downloaded histories as one long frame in price_history's columns."""
+    frames = []
     for symbol, df in histories.items():
         price_df = df[['Open', 'High', 'Low', 'Close', 'Volume']].copy()
         price_df.index.name = 'date'
         price_df = price_df.reset_index()
         price_df.columns = ['date', 'open', 'high', 'low', 'close', 'volume']
-        price_df['symbol'] = symbol
-        price_df['date'] = pd.to_datetime(price_df['date']).dt.date
+        price_df.insert(0, 'symbol', symbol)
+        frames.append(price_df)
+    rows = pd.concat(frames, ignore_index=True)
+    rows['date'] = pd.to_datetime(rows['date']).dt.date
+    # ON CONFLICT can't update the same row twice in one statement
+    return rows.drop_duplicates(['symbol', 'date'], keep='last')
 
-        con.register('_ph_tmp', price_df)
-        con.execute("""
-            DELETE FROM price_history
-            WHERE (symbol, date) IN (SELECT symbol, date FROM _ph_tmp)
-        """)
-        con.execute("""
-            INSERT INTO price_history (symbol, date, open, high, low, close, volume)
-            SELECT symbol, date, open, high, low, close, volume FROM _ph_tmp
-        """)
-        con.unregister('_ph_tmp')
+
+def _store(con, histories: dict[str, pd.DataFrame]) -> None:
+    """Upsert every history in one statement and one transaction, dropping
+    the TA state of symbols whose stored history it changes."""
+    if not histories:
+        return
+    con.register('_ph_rows', _price_frame(histories))
+    try:
+        con.execute("BEGIN")
+        try:
+            con.execute(_STALE_TA_STATE_SQL)
+            con.execute(_UPSERT_SQL.format(table=archive.write_table(con)))
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+    finally:
+        con.unregister('_ph_rows')
+
+
+def _plan(symbol: str, first_date, last_date, holes: list[tuple[date, date]],
+          requested: list[tuple[date, date]]) -> list[tuple[date, date]]:
+    """
+    Date ranges (inclusive) to download for one symbol:
+    - no history → the last _HISTORY_DAYS up to its exchange's last session
+    - history starting after that window → the missing head
+    - holes inside the stored span (trading_calendar.missing_ranges)
+    - stored bars ending before the last session → from the last stored
+      date on; refetching that bar replaces one saved before its close
+
+    A range inside one already requested (price_fetch_log) is dropped, so a
+    listing that starts late or a hole Yahoo can't fill is asked for once.
+    """
+    session = _last_session(symbol)
+    start = session - timedelta(days=_HISTORY_DAYS)
+    if pd.isna(first_date):
+        ranges = [(start, session)]
+    else:
+        first_date, last_date = pd.Timestamp(first_date).date(), pd.Timestamp(last_date).date()
+        ranges = []
+        if first_date > start + timedelta(days=_HISTORY_SLACK_DAYS):
+            ranges.append((start, first_date - timedelta(days=1)))
+        ranges += holes
+        if last_date < session:
+            ranges.append((last_date, session))
+    return [(lo, hi) for lo, hi in ranges
+            if not any(r_lo <= lo and hi <= r_hi for r_lo, r_hi in requested)]
 
 
 def ensure_for_ta(db_path: str, top: int = 500):
     """
-    Called by the daily run before TA. For each symbol TA will use:
-    - fewer than _MIN_DAYS of history → fetch 2y (self-healing backfill)
-    - otherwise → fetch 7d (daily top-up)
+    Called by the daily run before TA. Rebuilds trading_calendar, then
+    downloads only what is missing for each symbol TA will use (see _plan):
+    a new symbol's full window, a late-starting history's head, holes in
+    the middle and the sessions since its last bar. Symbols current as of
+    their exchange's last closed session without holes are skipped.
+
+    Ranges are grouped by (start, end) so each group is one set of download
+    batches, and every request is logged to price_fetch_log.
 
     No manual backfill command needed: any new symbol entering the top list
     automatically gets a full history on its first appearance.
@@ -120,18 +331,29 @@ def ensure_for_ta(db_path: str, top: int = 500):
             print("  No scored symbols found. Run the AFV processor first.")
             return
 
-        cov = _coverage(con, symbols)
-        needs_backfill = cov[cov['days'] < _MIN_DAYS]['symbol'].tolist()
-        needs_topup    = cov[cov['days'] >= _MIN_DAYS]['symbol'].tolist()
+        sessions = trading_calendar.refresh(con)
+        print(f"  Trading calendar: {sessions} exchange sessions.")
+        holes = trading_calendar.missing_ranges(con, symbols)
+        requested = _requested(con, symbols)
+
+        groups: dict[tuple[date, date], list[str]] = {}
+        for symbol, first_date, last_date in _coverage(con, symbols).itertuples(index=False):
+            for rng in _plan(symbol, first_date, last_date, holes.get(symbol, []), requested.get(symbol, [])):
+                groups.setdefault(rng, []).append(symbol)
 
-        if needs_backfill:
-            print(f"  {len(needs_backfill)} symbol(s) need backfill (<{_MIN_DAYS} days) — fetching 2y…")
-            _store(con, _download(needs_backfill, period='2y'))
+        wanted = {s for group in groups.values() for s in group}
+        print(f"  {len(symbols) - len(wanted)} symbol(s) complete and current — skipped; "
+              f"{len(wanted)} need {len(groups)} date range(s).")
 
-        if needs_topup:
-            print(f"  {len(needs_topup)} symbol(s) up to date — fetching 7d top-up…")
-            _store(con, _download(needs_topup, period='7d'))
+        for (start, end), group in sorted(groups.items()):
+            print(f"  {len(group)} symbol(s) — fetching {start} to {end}…")
+            # yfinance's end date is exclusive
+            histories = _download(group, start=start, end=end + timedelta(days=1))
+            _store(con, histories)
+            _log_requests(con, group, start, end, histories)
 
+        if archive.compact(con):
+            print("  Compacted new prices into the Parquet archive.")
         print(f"  Price history ready for {len(symbols)} symbols.")
 
 
@@ -149,4 +371,5 @@ def fetch_and_store(db_path: str, period: str = '7d', top: int = 500,
 
         print(f"Fetching price history (period={period}) for {len(syms)} symbols…")
         _store(con, _download(syms, period))
+        archive.compact(con)
         print("Price history updated.")
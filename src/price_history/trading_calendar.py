@@ -0,0 +1,170 @@
+"""
+Exchange trading calendars and price-history gap detection.
+
+No calendar data is shipped, so sessions are read off price_history
+itself. Each symbol is assigned to its exchange (MIC): from tickers.mic
+where the symbol is known there, otherwise from its Yahoo suffix. A date
+is a session for a MIC when at least _SESSION_SHARE of the MIC's symbols
+listed at the time (between their first and last stored bar) have a bar
+that day. A holiday therefore never becomes a session, and one symbol's
+missing days don't hide a session that the rest of its exchange traded.
+
+With the calendar, a missing bar is a session inside a symbol's stored
+span without a row: a hole to re-fetch, as opposed to a short listing
+history that simply starts late.
+"""
+from datetime import date
+
+import pandas as pd
+
+# Yahoo suffix -> MIC, the inverse of the suffix maps in ticker_management
+# and holdings_report; symbols without a suffix are US listings
+_SUFFIX_MIC = {
+    '':    'XNYS',
+    '.L':  'XLON',
+    '.DE': 'XETR',
+    '.PA': 'XPAR',
+    '.AS': 'XAMS',
+    '.SW': 'XSWX',
+    '.MI': 'XMIL',
+    '.MC': 'XMAD',
+    '.ST': 'XSTO',
+    '.OL': 'XOSL',
+    '.CO': 'XCSE',
+    '.HE': 'XHEL',
+    '.BR': 'XBRU',
+    '.LS': 'XLIS',
+    '.VI': 'XWBO',
+    '.AT': 'XATH',
+    '.WA': 'XWAR',
+}
+
+# Share of an exchange's listed symbols that must have a bar for a date to
+# count as a session
+_SESSION_SHARE = 0.5
+
+_CALENDAR_SQL = """
+    WITH bars AS (
+        SELECT m.mic, p.symbol, p.date
+        FROM price_history p
+        JOIN _cal_mics m ON p.symbol = m.symbol
+        WHERE p.close IS NOT NULL
+    ),
+    spans AS (
+        SELECT mic, symbol, min(date) AS first_date, max(date) AS last_date
+        FROM bars
+        GROUP BY mic, symbol
+    ),
+    listed AS (
+        -- symbols listed per MIC from each date on: +1 at a first bar,
+        -- -1 the day after a last bar
+        SELECT mic, date, sum(sum(delta)) OVER (PARTITION BY mic ORDER BY date) AS listed
+        FROM (
+            SELECT mic, first_date AS date, 1 AS delta FROM spans
+            UNION ALL
+            SELECT mic, last_date + 1 AS date, -1 AS delta FROM spans
+        )
+        GROUP BY mic, date
+    ),
+    daily AS (
+        SELECT mic, date, count(*) AS symbols
+        FROM bars
+        GROUP BY mic, date
+    )
+    SELECT d.mic, d.date, d.symbols
+    FROM daily d
+    ASOF JOIN listed l ON d.mic = l.mic AND d.date >= l.date
+    WHERE d.symbols >= ? * l.listed
+"""
+
+_GAPS_SQL = """
+    WITH spans AS (
+        SELECT p.symbol, m.mic, min(p.date) AS first_date, max(p.date) AS last_date
+        FROM price_history p
+        JOIN _gap_mics m ON p.symbol = m.symbol
+        GROUP BY p.symbol, m.mic
+    ),
+    sessions AS (
+        SELECT mic, date, row_number() OVER (PARTITION BY mic ORDER BY date) AS idx
+        FROM trading_calendar
+    ),
+    missing AS (
+        SELECT s.symbol, c.date, c.idx
+        FROM spans s
+        JOIN sessions c ON c.mic = s.mic AND c.date BETWEEN s.first_date AND s.last_date
+        ANTI JOIN price_history p ON p.symbol = s.symbol AND p.date = c.date
+    )
+    -- consecutive sessions share idx - row_number, so each island is one range
+    SELECT symbol, min(date) AS start_date, max(date) AS end_date
+    FROM (
+        SELECT symbol, date, idx - row_number() OVER (PARTITION BY symbol ORDER BY idx) AS island
+        FROM missing
+    )
+    GROUP BY symbol, island
+    ORDER BY symbol, start_date
+"""
+
+
+def symbol_mics(con, symbols: list[str]) -> dict[str, str]:
+    """MIC per symbol: tickers.mic where known, else from the Yahoo suffix.
+    Symbols with an unknown suffix are left out."""
+    con.register('_mic_syms', pd.DataFrame({'symbol': symbols}))
+    try:
+        known = dict(con.execute("""
+            SELECT t.yahoo_ticker, any_value(t.mic)
+            FROM tickers t
+            JOIN _mic_syms s ON t.yahoo_ticker = s.symbol
+            WHERE t.mic IS NOT NULL AND t.mic != ''
+            GROUP BY t.yahoo_ticker
+        """).fetchall())
+    finally:
+        con.unregister('_mic_syms')
+
+    mics = {}
+    for symbol in symbols:
+        suffix = '.' + symbol.rsplit('.', 1)[1] if '.' in symbol else ''
+        mic = known.get(symbol) or _SUFFIX_MIC.get(suffix)
+        if mic:
+            mics[symbol] = mic
+    return mics
+
+
+def _mic_frame(mics: dict[str, str]) -> pd.DataFrame:
+    return pd.DataFrame({'symbol': list(mics), 'mic': list(mics.values())}, columns=['symbol', 'mic'])
+
+
+def refresh(con) -> int:
+    """Rebuild trading_calendar from everything in price_history. Returns
+    the number of sessions."""
+    symbols = [r[0] for r in con.execute("SELECT DISTINCT symbol FROM price_history").fetchall()]
+    con.register('_cal_mics', _mic_frame(symbol_mics(con, symbols)))
+    try:
+        con.execute("BEGIN")
+        try:
+            con.execute("DELETE FROM trading_calendar")
+            con.execute(f"INSERT INTO trading_calendar (mic, date, symbols) {_CALENDAR_SQL}", (_SESSION_SHARE,))
+            con.execute("COMMIT")
+        except Exception:
+            con.execute("ROLLBACK")
+            raise
+    finally:
+        con.unregister('_cal_mics')
+    return con.execute("SELECT count(*) FROM trading_calendar").fetchone()[0]
+
+
+def missing_ranges(con, symbols: list[str]) -> dict[str, list[tuple[date, date]]]:
+    """
+    Holes per symbol: runs of consecutive sessions of its exchange between
+    its first and last stored bar with no bar, as inclusive (start, end)
+    dates. Symbols without holes are left out.
+    """
+    con.register('_gap_mics', _mic_frame(symbol_mics(con, symbols)))
+    try:
+        rows = con.execute(_GAPS_SQL).fetchall()
+    finally:
+        con.unregister('_gap_mics')
+
+    ranges: dict[str, list[tuple[date, date]]] = {}
+    for symbol, start, end in rows:
+        ranges.setdefault(symbol, []).append((start, end))
+    return ranges
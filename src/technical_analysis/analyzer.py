@@ -1,16 +1,19 @@
 import sys
+import warnings
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from database.db import connect
+from database.db import TA_SNAPSHOTS, connect, refresh_snapshots
+from technical_analysis import indicators
 
 _TOP_N = 500
 
 
-def _top_symbols(con) -> list[tuple[str, float]]:
+def _top_symbols(con, top: int | None = _TOP_N) -> list[tuple[str, float]]:
+    """Symbols scored in the last 35 days, best AFV21 first; top=None for all."""
     return con.execute("""
         WITH latest_run AS (
             SELECT symbol, afv21,
@@ -25,138 +28,197 @@ def _top_symbols(con) -> list[tuple[str, float]]:
         WHERE rn = 1
         ORDER BY afv21 DESC
         LIMIT ?
-    """, (_TOP_N,)).fetchall()
+    """, (top,)).fetchall()
 
 
-def _load_from_db(con, symbols: list[str]) -> dict[str, pd.DataFrame]:
-    """Load price history from DB for the given symbols, returning DataFrames keyed by symbol."""
+# Symbols per price matrix; bounds memory when the full universe is analysed
+_CHUNK_SYMBOLS = 2000
+
+
+def _load_from_db(con, symbols: list[str], tail: int | None = None) -> dict[str, np.ndarray]:
+    """
+    Load closes and volumes for the given symbols as flat arrays sorted by
+    (symbol, date), only the newest `tail` bars per symbol if given. Rows
+    without a close are dropped; a missing volume is kept as NaN.
+    """
     if not symbols:
         return {}
 
+    qualify = "QUALIFY row_number() OVER (PARTITION BY p.symbol ORDER BY p.date DESC) <= ?" if tail else ""
     sym_df = pd.DataFrame({'symbol': symbols})
     con.register('_ta_sym_list', sym_df)
     try:
-        raw = con.execute("""
-            SELECT p.symbol, p.date, p.open, p.high, p.low, p.close, p.volume
+        raw = con.execute(f"""
+            SELECT p.symbol, p.date, p.close::DOUBLE AS close, p.volume::DOUBLE AS volume
             FROM price_history p
             JOIN _ta_sym_list s ON p.symbol = s.symbol
+            WHERE p.close IS NOT NULL AND NOT isnan(p.close)
+            {qualify}
             ORDER BY p.symbol, p.date ASC
-        """).fetchdf()
+        """, (tail,) if tail else ()).fetchnumpy()
     finally:
         con.unregister('_ta_sym_list')
 
-    histories: dict[str, pd.DataFrame] = {}
-    for symbol, group in raw.groupby('symbol'):
-        g = group[['date', 'open', 'high', 'low', 'close', 'volume']].copy()
-        g['date'] = pd.to_datetime(g['date'])
-        g = g.set_index('date')
-        g.columns = ['Open', 'High', 'Low', 'Close', 'Volume']
-        histories[symbol] = g
-
-    return histories
-
-
-def _rsi(close: pd.Series, period: int = 14) -> float | None:
-    if len(close) < period + 1:
-        return None
-    delta = close.diff()
-    gain = delta.clip(lower=0).rolling(period).mean()
-    loss = (-delta.clip(upper=0)).rolling(period).mean()
-    rs = gain / loss
-    val = (100 - 100 / (1 + rs)).iloc[-1]
-    return None if pd.isna(val) else float(val)
-
-
-def _macd(close: pd.Series) -> tuple[float | None, float | None, float | None, str]:
-    if len(close) < 26:
-        return None, None, None, 'neutral'
-    ema12 = close.ewm(span=12, adjust=False).mean()
-    ema26 = close.ewm(span=26, adjust=False).mean()
-    macd_line = ema12 - ema26
-    signal_line = macd_line.ewm(span=9, adjust=False).mean()
-    histogram = macd_line - signal_line
-
-    m = float(macd_line.iloc[-1]) if not pd.isna(macd_line.iloc[-1]) else None
-    s = float(signal_line.iloc[-1]) if not pd.isna(signal_line.iloc[-1]) else None
-    h = float(histogram.iloc[-1]) if not pd.isna(histogram.iloc[-1]) else None
-
-    if m is None or s is None:
-        sentiment = 'neutral'
-    elif m > s:
-        sentiment = 'bullish'
-    elif m < s:
-        sentiment = 'bearish'
-    else:
-        sentiment = 'neutral'
-
-    return m, s, h, sentiment
-
-
-def _obv(close: pd.Series, volume: pd.Series) -> tuple[float | None, str]:
-    if len(close) < 20:
-        return None, 'neutral'
-    direction = close.diff().apply(lambda x: 1 if x > 0 else (-1 if x < 0 else 0))
-    obv_series = (volume * direction).cumsum()
-    obv_val = float(obv_series.iloc[-1])
-
-    # Trend: compare the most recent 20-bar OBV average to the prior 20-bar average
-    if len(obv_series) >= 40:
-        recent = obv_series.iloc[-20:].mean()
-        prior  = obv_series.iloc[-40:-20].mean()
-        if recent > prior * 1.01:
-            trend = 'rising'
-        elif recent < prior * 0.99:
-            trend = 'falling'
-        else:
-            trend = 'neutral'
-    else:
-        trend = 'neutral'
-
-    return obv_val, trend
-
-
-def _ma_cross_info(
-    ma50: pd.Series, ma200: pd.Series
-) -> tuple[str, int | None, float | None]:
-    """Returns (signal, days_since_cross, distance_pct)."""
-    valid = ma50.dropna().index.intersection(ma200.dropna().index)
-    if len(valid) < 2:
-        return 'none', None, None
-
-    ma50_v  = ma50[valid]
-    ma200_v = ma200[valid]
-
-    cur50  = float(ma50_v.iloc[-1])
-    cur200 = float(ma200_v.iloc[-1])
-
-    signal       = 'golden_cross' if cur50 > cur200 else 'death_cross'
-    distance_pct = (cur50 - cur200) / cur200 * 100
-
-    # Locate the most recent bar where the two MAs changed sides
-    diff         = ma50_v - ma200_v
-    sign_changes = (diff.shift(1) * diff) < 0
-    cross_dates  = diff.index[sign_changes]
-
-    if len(cross_dates) == 0:
-        return signal, None, distance_pct
+    return {
+        'symbol': np.asarray(raw['symbol'], dtype=object),
+        'day':    raw['date'].astype('datetime64[D]').astype(np.int64),
+        'close':  np.asarray(raw['close'], dtype=float),
+        'volume': np.ma.filled(raw['volume'].astype(float), np.nan),
+    }
 
-    raw_diff = ma50_v.index[-1] - cross_dates[-1]
-    days_ago = raw_diff.days if hasattr(raw_diff, 'days') else int(raw_diff)
-    return signal, int(days_ago), distance_pct
 
+# Checks each stored ta_state against price_history: the bar count and
+# close/volume sums up to the state's last_date must be unchanged (no
+# backfill or correction), and the totals now give the new bars' share
+_STATE_SQL = """
+    SELECT s.symbol, s.bars, s.ema12, s.ema26, s.macd_signal, s.obv,
+           s.last_cross_date - DATE '1970-01-01' AS last_cross,
+           count(p.date)                           AS new_bars
+    FROM ta_state s
+    JOIN _ta_sym_list l ON s.symbol = l.symbol
+    LEFT JOIN price_history p
+           ON p.symbol = s.symbol AND p.date > s.last_date
+          AND p.close IS NOT NULL AND NOT isnan(p.close)
+          AND p.date > ?  -- lets the scan skip row groups and files older than every state
+    GROUP BY ALL
+"""
+
+# Bars read per symbol when its state is current: the MA200 bottom search
+# (80 MA values) needs 279 closes, the OBV trend 40
+_TAIL_BARS = 300
+
+# A symbol with more new bars than this since its state was saved is
+# recomputed from full history rather than carried forward
+_MAX_NEW_BARS = 20
+
+
+def _load_state(con, symbols: list[str]) -> dict[str, dict]:
+    """
+    Stored indicator state for the symbols that gained at most
+    _MAX_NEW_BARS bars since it was saved. Only bars after each state's
+    last_date are read. A state whose history was backfilled or corrected
+    has already been deleted by price_history.fetcher._store, so a symbol
+    without one (or with too many new bars) needs a full recompute.
+    """
+    if not symbols:
+        return {}
+    con.register('_ta_sym_list', pd.DataFrame({'symbol': symbols}))
+    try:
+        since = con.execute("""
+            SELECT min(s.last_date) FROM ta_state s JOIN _ta_sym_list l ON s.symbol = l.symbol
+        """).fetchone()[0]
+        if since is None:
+            return {}
+        rows = con.execute(_STATE_SQL, [since]).fetchall()
+    finally:
+        con.unregister('_ta_sym_list')
 
-def _ma_trend(ma: pd.Series, slope_window: int = 10) -> str:
-    """Current slope direction of a moving average."""
-    clean = ma.dropna()
-    if len(clean) < slope_window + 1:
-        return 'unknown'
-    return 'rising' if float(clean.diff(slope_window).iloc[-1]) > 0 else 'falling'
+    prior = {}
+    for symbol, bars, ema12, ema26, signal, obv, last_cross, new_bars in rows:
+        if new_bars <= _MAX_NEW_BARS:
+            prior[symbol] = {
+                'bars': bars + new_bars, 'new_bars': new_bars,
+                'ema12': ema12, 'ema26': ema26, 'macd_signal': signal, 'obv': obv,
+                'last_cross': np.nan if last_cross is None else last_cross,
+            }
+    return prior
 
 
-def _ma_days_since_bottom(ma: pd.Series, lookback_days: int = 30,
-                          min_decline_pct: float = 0.02, min_recovery_bars: int = 5) -> int | None:
+def _price_matrices(flat: dict[str, np.ndarray]):
+    """
+    Yield (symbols, n, day, close, volume) per chunk of _CHUNK_SYMBOLS
+    symbols. Each is a (dates x symbols) matrix, right-aligned: row -1 holds
+    every symbol's latest bar and a symbol with n bars fills the last n rows
+    of its column. Rows above are NaN (day 0), so positional windows such as
+    "the last 200 bars" are plain row slices for every column at once.
+    """
+    if not flat or not len(flat['symbol']):
+        return
+    sym = flat['symbol']
+    starts = np.flatnonzero(np.r_[True, sym[1:] != sym[:-1]])
+    counts = np.diff(np.r_[starts, len(sym)])
+
+    for c0 in range(0, len(starts), _CHUNK_SYMBOLS):
+        g_starts = starts[c0:c0 + _CHUNK_SYMBOLS]
+        g_counts = counts[c0:c0 + _CHUNK_SYMBOLS]
+        lo, hi = g_starts[0], g_starts[-1] + g_counts[-1]
+        T, N = int(g_counts.max()), len(g_starts)
+
+        col = np.repeat(np.arange(N), g_counts)
+        row = T - np.repeat(g_counts, g_counts) + (np.arange(lo, hi) - np.repeat(g_starts, g_counts))
+
+        day = np.zeros((T, N), dtype=np.int64)
+        close = np.full((T, N), np.nan)
+        volume = np.full((T, N), np.nan)
+        day[row, col] = flat['day'][lo:hi]
+        close[row, col] = flat['close'][lo:hi]
+        volume[row, col] = flat['volume'][lo:hi]
+        yield list(sym[g_starts]), g_counts, day, close, volume
+
+
+def _rsi(close: np.ndarray, period: int = 14) -> np.ndarray:
+    """RSI of the latest bar per column; only the last period + 1 closes matter."""
+    return indicators.rsi(close[-period - 1:], period)[-1]
+
+
+def _macd_state(close: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Latest EMA12, EMA26 and MACD signal line per column from the full history."""
+    ema12, ema26 = indicators.ewm(close, 12), indicators.ewm(close, 26)
+    signal_line = indicators.ewm(ema12 - ema26, 9)
+    return ema12[-1], ema26[-1], signal_line[-1]
+
+
+def _carry_macd_state(close: np.ndarray, new: np.ndarray, ema12: np.ndarray, ema26: np.ndarray,
+                      signal_line: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fold the closes marked in `new` into stored EMA12, EMA26 and signal values."""
+    for t in np.flatnonzero(new.any(axis=1)):
+        x = np.where(new[t], close[t], np.nan)
+        ema12 = indicators.ewm_step(ema12, x, 12)
+        ema26 = indicators.ewm_step(ema26, x, 26)
+        signal_line = indicators.ewm_step(signal_line, np.where(new[t], ema12 - ema26, np.nan), 9)
+    return ema12, ema26, signal_line
+
+
+def _obv_series(flow: np.ndarray, total: np.ndarray) -> np.ndarray:
+    """OBV per row, anchored so the last row equals `total`; NaN where the
+    volume is missing. Only the rows' own flows are needed, not the history
+    before them."""
+    cum = np.nancumsum(flow, axis=0)
+    obv = total - (cum[-1] - cum)
+    obv[np.isnan(flow)] = np.nan
+    return obv
+
+
+def _obv_trend(obv: np.ndarray) -> np.ndarray:
+    """Compares the mean OBV of the last 20 bars to the 20 before, per column
+    (+1 rising, -1 falling, 0 neutral)."""
+    trend = np.zeros(obv.shape[1], dtype=int)
+    if len(obv) >= 40:
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN windows
+            recent = np.nanmean(obv[-20:], axis=0)
+            prior = np.nanmean(obv[-40:-20], axis=0)
+            # with a negative prior both tests can pass; rising wins
+            trend[recent < prior * 0.99] = -1
+            trend[recent > prior * 1.01] = 1
+    return trend
+
+
+def _last_cross(ma50: np.ndarray, ma200: np.ndarray, day: np.ndarray) -> np.ndarray:
+    """Calendar days since the MAs last changed sides per column, -1 if never."""
+    diff = ma50 - ma200
+    with np.errstate(invalid='ignore'):
+        crossed = diff[1:] * diff[:-1] < 0
+    has_cross = crossed.any(axis=0)
+    row = len(diff) - 1 - np.argmax(crossed[::-1], axis=0)
+    days = day[-1] - day[row, np.arange(day.shape[1])]
+    return np.where(has_cross, days, -1)
+
+
+def _days_since_bottom(ma: np.ndarray, valid: np.ndarray, day: np.ndarray, lookback_days: int,
+                       min_decline_pct: float = 0.02, min_recovery_bars: int = 5) -> np.ndarray:
     """
-    Detects a cup-like trough in the MA within the last lookback_days.
+    Detects a cup-like trough in each column's MA within the last lookback_days.
 
     Requires:
     - A genuine prior decline: the MA fell at least min_decline_pct from its
@@ -165,88 +227,195 @@ def _ma_days_since_bottom(ma: pd.Series, lookback_days: int = 30,
       trading days since the trough (rules out single-day reversals)
     - The trough is not at the very edge of the search window (needs context on both sides)
 
-    Returns days since the trough, or None if no valid cup bottom is found.
+    `valid` is the number of non-NaN MA values per column. Returns days since
+    the trough per column, -1 where no valid cup bottom is found.
     """
-    clean = ma.dropna()
+    n_cols = ma.shape[1]
+    out = np.full(n_cols, -1)
     # Need enough history: lookback window + pre-trough context + post-trough recovery
-    if len(clean) < lookback_days + 30:
-        return None
+    size = lookback_days + 20
+    eligible = valid >= lookback_days + 30
+    if len(ma) < size or not eligible.any():
+        return out
 
-    # Search window: lookback_days back from today, but keep 20 bars of pre-trough context
-    search_start = -(lookback_days + 20)
-    window = clean.iloc[search_start:]
-
-    trough_idx = window.idxmin()
-    trough_pos = window.index.get_loc(trough_idx)
+    # Search window: lookback_days back from today, with 20 bars of pre-trough context
+    window = np.where(eligible, ma[-size:], np.inf)
+    cols = np.arange(n_cols)
+    trough_pos = np.argmin(window, axis=0)
+    trough_val = window[trough_pos, cols]
 
     # Trough must have at least 10 bars before it (for pre-decline context)
     # and at least min_recovery_bars bars after it (to confirm recovery)
-    if trough_pos < 10 or trough_pos > len(window) - min_recovery_bars - 1:
-        return None
-
-    trough_val = window[trough_idx]
+    ok = eligible & (trough_pos >= 10) & (trough_pos <= size - min_recovery_bars - 1)
 
     # Pre-trough: the MA must have been genuinely higher (real decline into trough)
-    pre_peak = window.iloc[:trough_pos].max()
-    if (pre_peak - trough_val) / pre_peak < min_decline_pct:
-        return None
-
-    # Post-trough: the MA must be monotonically or consistently rising
-    # (check that the current value is above the trough and the post-trough
-    # segment has a positive slope over its full span)
-    post = window.iloc[trough_pos:]
-    if clean.iloc[-1] <= trough_val:
-        return None
-    post_slope = float(post.iloc[-1]) - float(post.iloc[0])
-    if post_slope <= 0:
-        return None
-
-    days_since = (clean.index[-1] - trough_idx).days
-    # Only report if the trough itself falls within lookback_days
-    return days_since if days_since <= lookback_days else None
-
+    before = np.arange(size)[:, None] < trough_pos[None, :]
+    pre_peak = np.where(before, window, -np.inf).max(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ok &= (pre_peak - trough_val) / pre_peak >= min_decline_pct
 
-def _analyze(symbol: str, df: pd.DataFrame, afv21: float) -> dict | None:
-    if df.empty or 'Close' not in df.columns or 'Volume' not in df.columns:
-        return None
+    # Post-trough: the MA must be above the trough now and have a positive
+    # slope over the post-trough segment
+    ok &= window[-1] > trough_val
 
-    close  = df['Close'].dropna()
-    volume = df['Volume'].dropna()
+    days_since = day[-1] - day[len(day) - size + trough_pos, cols]
+    # Only report if the trough itself falls within lookback_days
+    ok &= days_since <= lookback_days
+    out[ok] = days_since[ok]
+    return out
 
-    if len(close) < 50:
-        return None
 
-    ma50  = close.rolling(50).mean()
-    ma200 = close.rolling(200).mean()
+def _analyze(symbols: list[str], n: np.ndarray, day: np.ndarray, close: np.ndarray,
+             volume: np.ndarray, scores: dict[str, float | None],
+             prior: dict[str, np.ndarray] | None = None) -> tuple[list[dict], pd.DataFrame]:
+    """
+    Indicators for every column of one right-aligned price matrix (see
+    _price_matrices) at once. Symbols with fewer than 50 bars are skipped.
+
+    Without `prior` the matrix holds each symbol's full history. With it
+    (per-column arrays from _load_state) it holds only the newest
+    _TAIL_BARS bars: the EMAs, OBV total and last MA cross, which depend on
+    everything before, are carried forward from the stored state through
+    the new bars, and `n` is the full bar count. Returns the results and the
+    updated ta_state rows for every column.
+    """
+    ma50  = indicators.rolling_mean(close, 50)
+    ma200 = indicators.rolling_mean(close, 200)
+    cross_days = _last_cross(ma50, ma200, day)
+    rsi14 = _rsi(close)
+    flow = indicators.obv_flow(close, volume)
+    if prior is None:
+        ema12, ema26, macd_sig = _macd_state(close)
+        obv_total = np.nansum(flow, axis=0)
+    else:
+        new = np.arange(len(close))[:, None] >= len(close) - prior['new_bars']
+        ema12, ema26, macd_sig = _carry_macd_state(close, new, prior['ema12'], prior['ema26'],
+                                                   prior['macd_signal'])
+        obv_total = prior['obv'] + np.nansum(np.where(new, flow, np.nan), axis=0)
+        # MAs in the tail only cover its last rows; older crosses come from the state
+        with np.errstate(invalid='ignore'):
+            stored = np.where(np.isnan(prior['last_cross']), -1, day[-1] - prior['last_cross'])
+        cross_days = np.where(cross_days >= 0, cross_days, stored).astype(np.int64)
+    macd_line = ema12 - ema26
+    obv = _obv_series(flow, obv_total)
+    obv_val, obv_trend = obv[-1], _obv_trend(obv)
+    ma50_bottom  = _days_since_bottom(ma50, n - 49, day, lookback_days=30)
+    ma200_bottom = _days_since_bottom(ma200, n - 199, day, lookback_days=60, min_decline_pct=0.03)
+    ma200_rising = ma200[-1] - ma200[-11] > 0 if len(ma200) > 10 else np.zeros(len(symbols), dtype=bool)
+
+    last_cross = (day[-1] - cross_days).astype('datetime64[D]')
+    last_cross[cross_days < 0] = np.datetime64('NaT')
+    state = pd.DataFrame({
+        'symbol':          symbols,
+        'last_date':       day[-1].astype('datetime64[D]'),
+        'bars':            n,
+        'ema12':           ema12,
+        'ema26':           ema26,
+        'macd_signal':     macd_sig,
+        'obv':             obv_total,
+        'last_cross_date': last_cross,
+    })
+
+    def num(v):
+        return None if np.isnan(v) else float(v)
+
+    results = []
+    for j, symbol in enumerate(symbols):
+        if n[j] < 50:
+            continue
+
+        cur50, cur200 = ma50[-1, j], ma200[-1, j]
+        if n[j] - 199 >= 2:
+            signal       = 'golden_cross' if cur50 > cur200 else 'death_cross'
+            distance_pct = float((cur50 - cur200) / cur200 * 100)
+            days_ago     = int(cross_days[j]) if cross_days[j] >= 0 else None
+        else:
+            signal, distance_pct, days_ago = 'none', None, None
 
-    signal, days_ago, distance_pct = _ma_cross_info(ma50, ma200)
-    rsi14                          = _rsi(close)
-    macd_line, macd_sig, macd_hist, macd_sentiment = _macd(close)
-    obv_val, obv_trend             = _obv(close, volume)
-    ma50_bottom                    = _ma_days_since_bottom(ma50,  lookback_days=30)
-    ma200_trend                    = _ma_trend(ma200, slope_window=10)
-    ma200_bottom                   = _ma_days_since_bottom(ma200, lookback_days=60, min_decline_pct=0.03)
+        m, s = num(macd_line[j]), num(macd_sig[j])
+        if m is None or s is None or m == s:
+            macd_sentiment = 'neutral'
+        else:
+            macd_sentiment = 'bullish' if m > s else 'bearish'
 
-    return {
-        'symbol':               symbol,
-        'afv21_score':          afv21,
-        'close_price':          float(close.iloc[-1]),
-        'ma50':                 float(ma50.iloc[-1]) if not pd.isna(ma50.iloc[-1]) else None,
-        'ma200':                float(ma200.iloc[-1]) if not pd.isna(ma200.iloc[-1]) else None,
-        'ma_cross_signal':      signal,
-        'ma_cross_days_ago':    days_ago,
-        'ma_distance_pct':      distance_pct,
-        'rsi14':                rsi14,
-        'macd_line':            macd_line,
-        'macd_signal_line':     macd_sig,
-        'macd_histogram':       macd_hist,
-        'macd_sentiment':       macd_sentiment,
-        'obv':                  obv_val,
-        'obv_trend':            obv_trend,
-        'ma50_bottom_days_ago':  ma50_bottom,
-        'ma200_trend':           ma200_trend,
-        'ma200_bottom_days_ago': ma200_bottom,
-    }
+        if n[j] - 199 < 11:
+            ma200_trend = 'unknown'
+        else:
+            ma200_trend = 'rising' if ma200_rising[j] else 'falling'
+
+        results.append({
+            'symbol':               symbol,
+            'afv21_score':          scores.get(symbol),
+            'close_price':          float(close[-1, j]),
+            'ma50':                 num(cur50),
+            'ma200':                num(cur200),
+            'ma_cross_signal':      signal,
+            'ma_cross_days_ago':    days_ago,
+            'ma_distance_pct':      distance_pct,
+            'rsi14':                num(rsi14[j]),
+            'macd_line':            m,
+            'macd_signal_line':     s,
+            'macd_histogram':       None if m is None or s is None else m - s,
+            'macd_sentiment':       macd_sentiment,
+            'obv':                  num(obv_val[j]),
+            'obv_trend':            ('falling', 'neutral', 'rising')[obv_trend[j] + 1],
+            'ma50_bottom_days_ago':  int(ma50_bottom[j]) if ma50_bottom[j] >= 0 else None,
+            'ma200_trend':           ma200_trend,
+            'ma200_bottom_days_ago': int(ma200_bottom[j]) if ma200_bottom[j] >= 0 else None,
+        })
+    return results, state
+
+
+def _analyze_all(con, symbols: list[str], scores: dict[str, float | None],
+                 full: bool = False) -> tuple[list[dict], pd.DataFrame, int]:
+    """
+    Load and analyse `symbols` chunk by chunk. Symbols with a usable
+    ta_state only read their last _TAIL_BARS bars; the rest (and all of
+    them when `full`) are computed from their whole history. Returns the
+    results (in `symbols` order), the ta_state rows to save and how many
+    symbols had price history.
+    """
+    prior = {} if full else _load_state(con, symbols)
+    recompute = [s for s in symbols if s not in prior]
+    carried = [s for s in symbols if s in prior]
+    if carried:
+        print(f"TA state: {len(carried)} symbols updated incrementally, {len(recompute)} recomputed.")
+
+    loaded = 0
+    by_symbol = {}
+    states = []
+    for group, tail in ((recompute, None), (carried, _TAIL_BARS)):
+        for chunk_symbols, n, day, close, volume in _price_matrices(_load_from_db(con, group, tail)):
+            loaded += len(chunk_symbols)
+            chunk_prior = None
+            if tail:
+                chunk_prior = {k: np.array([prior[s][k] for s in chunk_symbols], dtype=float)
+                               for k in prior[chunk_symbols[0]]}
+                n = chunk_prior['bars'].astype(np.int64)
+                chunk_prior['new_bars'] = chunk_prior['new_bars'].astype(np.int64)
+            rows, state = _analyze(chunk_symbols, n, day, close, volume, scores, chunk_prior)
+            for row in rows:
+                by_symbol[row['symbol']] = row
+            states.append(state)
+    state = pd.concat(states, ignore_index=True) if states else pd.DataFrame()
+    return [by_symbol[s] for s in symbols if s in by_symbol], state, loaded
+
+
+def _save_state(con, state: pd.DataFrame) -> None:
+    """Upsert ta_state rows from _analyze_all."""
+    if state.empty:
+        return
+    con.register('_ta_state_rows', state)
+    try:
+        con.execute("""
+            INSERT OR REPLACE INTO ta_state
+                (symbol, last_date, bars, ema12, ema26, macd_signal, obv, last_cross_date, updated_at)
+            SELECT symbol, last_date::DATE, bars,
+                   ema12, ema26, macd_signal, obv, last_cross_date::DATE, now()
+            FROM _ta_state_rows
+        """)
+    finally:
+        con.unregister('_ta_state_rows')
 
 
 def _print_summary(results: list[dict]):
@@ -303,27 +472,30 @@ def _print_summary(results: list[dict]):
 
 
 
+_RESULT_COLUMNS = [
+    'symbol', 'afv21_score', 'close_price',
+    'ma50', 'ma200',
+    'ma_cross_signal', 'ma_cross_days_ago', 'ma_distance_pct',
+    'rsi14',
+    'macd_line', 'macd_signal_line', 'macd_histogram', 'macd_sentiment',
+    'obv', 'obv_trend',
+    'ma50_bottom_days_ago', 'ma200_trend', 'ma200_bottom_days_ago',
+]
+
+
 def _insert_results(con, results: list[dict]) -> None:
-    for r in results:
-        con.execute("""
-            INSERT INTO technical_analysis (
-                symbol, afv21_score, close_price,
-                ma50, ma200,
-                ma_cross_signal, ma_cross_days_ago, ma_distance_pct,
-                rsi14,
-                macd_line, macd_signal_line, macd_histogram, macd_sentiment,
-                obv, obv_trend,
-                ma50_bottom_days_ago, ma200_trend, ma200_bottom_days_ago
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            r['symbol'], r['afv21_score'], r['close_price'],
-            r['ma50'], r['ma200'],
-            r['ma_cross_signal'], r['ma_cross_days_ago'], r['ma_distance_pct'],
-            r['rsi14'],
-            r['macd_line'], r['macd_signal_line'], r['macd_histogram'], r['macd_sentiment'],
-            r['obv'], r['obv_trend'],
-            r['ma50_bottom_days_ago'], r['ma200_trend'], r['ma200_bottom_days_ago'],
-        ))
+    """Append all results in one INSERT ... SELECT from a registered frame."""
+    if not results:
+        return
+    frame = pd.DataFrame.from_records(results, columns=_RESULT_COLUMNS)
+    con.register('_ta_rows', frame)
+    try:
+        con.execute(f"""
+            INSERT INTO technical_analysis ({', '.join(_RESULT_COLUMNS)})
+            SELECT {', '.join(_RESULT_COLUMNS)} FROM _ta_rows
+        """)
+    finally:
+        con.unregister('_ta_rows')
 
 
 def _latest_afv21(con, symbols: list[str]) -> dict[str, float]:
@@ -343,9 +515,11 @@ def _latest_afv21(con, symbols: list[str]) -> dict[str, float]:
     return {s: sc for s, sc in rows}
 
 
-def run(db_path: str):
+def run(db_path: str, top: int | None = _TOP_N, full: bool = False):
+    """TA for the top symbols by AFV21. Indicators carry forward from
+    ta_state where possible; full=True recomputes everything from history."""
     with connect(db_path) as con:
-        symbol_scores = _top_symbols(con)
+        symbol_scores = _top_symbols(con, top)
         if not symbol_scores:
             print("No AFV21 scores found. Run the AFV processor first.")
             return
@@ -353,27 +527,20 @@ def run(db_path: str):
         symbols = [s for s, _ in symbol_scores]
         print(f"Running technical analysis on top {len(symbols)} symbols by AFV21 score...")
 
-        histories = _load_from_db(con, symbols)
-        print(f"Loaded price history from DB: {len(histories)}/{len(symbols)} symbols.")
-        if not histories:
+        results, state, loaded = _analyze_all(con, symbols, dict(symbol_scores), full)
+        print(f"Loaded price history from DB: {loaded}/{len(symbols)} symbols.")
+        if not loaded:
             print("No price history in DB. Run 'prices fetch --period 2y' first.")
             return
 
-        results = []
-        for symbol, afv21 in symbol_scores:
-            df = histories.get(symbol)
-            if df is None:
-                continue
-            row = _analyze(symbol, df, afv21)
-            if row:
-                results.append(row)
-
         if not results:
             print("No results to store.")
             return
 
         con.execute("DELETE FROM technical_analysis WHERE computed_at::DATE = current_date")
         _insert_results(con, results)
+        _save_state(con, state)
+        refresh_snapshots(con, TA_SNAPSHOTS)
         print(f"Stored {len(results)} records in technical_analysis.")
         _print_summary(results)
 
@@ -395,21 +562,12 @@ def run_holdings(db_path: str):
         print(f"Running technical analysis for {len(symbols)} holdings: {', '.join(symbols)}")
         score_map = _latest_afv21(con, symbols)
 
-        histories = _load_from_db(con, symbols)
-        print(f"Loaded price history from DB: {len(histories)}/{len(symbols)} symbols.")
-        if not histories:
+        results, state, loaded = _analyze_all(con, symbols, score_map)
+        print(f"Loaded price history from DB: {loaded}/{len(symbols)} symbols.")
+        if not loaded:
             print("No price history in DB. Run 'prices fetch --period 2y' first.")
             return
 
-        results = []
-        for symbol in symbols:
-            df = histories.get(symbol)
-            if df is None:
-                continue
-            row = _analyze(symbol, df, score_map.get(symbol))
-            if row:
-                results.append(row)
-
         computed_syms = [r['symbol'] for r in results]
         placeholders  = ', '.join('?' * len(computed_syms))
         con.execute(
@@ -418,6 +576,8 @@ def run_holdings(db_path: str):
             computed_syms,
         )
         _insert_results(con, results)
+        _save_state(con, state)
+        refresh_snapshots(con, TA_SNAPSHOTS)
 
     print(f"Stored {len(results)} holdings TA records.")
     _print_holdings_summary(results)
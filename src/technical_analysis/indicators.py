@@ -0,0 +1,118 @@
+"""
+NumPy indicator kernels.
+
+Every function takes a 1-D series or a 2-D (dates x symbols) matrix and
+works down axis 0, returning arrays of the same shape. Leading NaNs are
+padding: a column's series starts at its first value, as in the
+right-aligned matrices built by analyzer._price_matrices. Gaps after the
+first value are not supported. Results match the pandas formulas the
+analyzer used before (rolling().mean(), ewm(adjust=False), the
+diff/apply OBV); see indicators_bench.py.
+"""
+import numpy as np
+
+# Rows per EWM block; bounds beta ** -BLOCK so the block sums stay exact to ~1e-13
+_EWM_BLOCK = 32
+
+
+def _as_2d(x) -> tuple[np.ndarray, bool]:
+    x = np.asarray(x, dtype=float)
+    return (x[:, None], True) if x.ndim == 1 else (x, False)
+
+
+def rolling_mean(x, window: int) -> np.ndarray:
+    """Mean of the last `window` values, NaN until a column has that many."""
+    x, flat = _as_2d(x)
+    zero = np.zeros((1, x.shape[1]))
+    sums = np.vstack([zero, np.cumsum(np.nan_to_num(x), axis=0)])
+    counts = np.vstack([zero, np.cumsum(~np.isnan(x), axis=0)])
+    out = np.full(x.shape, np.nan)
+    if len(x) >= window:
+        full = counts[window:] - counts[:-window] == window
+        out[window - 1:] = np.where(full, (sums[window:] - sums[:-window]) / window, np.nan)
+    return out[:, 0] if flat else out
+
+
+def ewm(x, span: int) -> np.ndarray:
+    """
+    Exponentially weighted mean with adjust=False: y[0] = x[0],
+    y[t] = (1 - a) * y[t-1] + a * x[t], a = 2 / (span + 1).
+
+    Instead of a Python step per row, the recursion is unrolled over blocks
+    of _EWM_BLOCK rows: inside a block y = b^i * (y_prev + a * cumsum(x * b^-i)),
+    with b = 1 - a. Seeding each column's first value as x / a makes the
+    same formula start every column at y = x from a zero state.
+    """
+    x, flat = _as_2d(x)
+    alpha = 2 / (span + 1)
+    beta = 1 - alpha
+
+    valid = ~np.isnan(x)
+    started = np.logical_or.accumulate(valid, axis=0)
+    first = started & ~np.vstack([np.zeros((1, x.shape[1]), dtype=bool), started[:-1]])
+    z = np.where(valid, x, 0.0)
+    z[first] /= alpha
+
+    steps = np.arange(1, _EWM_BLOCK + 1, dtype=float)[:, None]
+    grow, decay = beta ** -steps, beta ** steps
+    out = np.empty(x.shape)
+    y = np.zeros(x.shape[1])
+    for s in range(0, len(x), _EWM_BLOCK):
+        block = z[s:s + _EWM_BLOCK]
+        m = len(block)
+        out[s:s + m] = decay[:m] * (y + alpha * np.cumsum(block * grow[:m], axis=0))
+        y = out[s + m - 1]
+    out[~started] = np.nan
+    return out[:, 0] if flat else out
+
+
+def rsi(close, period: int = 14) -> np.ndarray:
+    """RSI from simple rolling averages of gains and losses."""
+    close, flat = _as_2d(close)
+    delta = np.diff(close, axis=0, prepend=np.nan)
+    gain = rolling_mean(np.where(np.isnan(delta), np.nan, np.clip(delta, 0, None)), period)
+    loss = rolling_mean(np.where(np.isnan(delta), np.nan, np.clip(-delta, 0, None)), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = 100 - 100 / (1 + gain / loss)
+    return out[:, 0] if flat else out
+
+
+def macd(close, fast: int = 12, slow: int = 26, signal: int = 9) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """MACD line, signal line and histogram."""
+    line = ewm(close, fast) - ewm(close, slow)
+    signal_line = ewm(line, signal)
+    return line, signal_line, line - signal_line
+
+
+def ewm_step(prev, x, span: int) -> np.ndarray:
+    """
+    Advance adjust=False EWM values by one observation per column, for
+    carrying stored values forward without the history behind them. NaN in
+    x leaves that column's value unchanged.
+    """
+    alpha = 2 / (span + 1)
+    prev = np.asarray(prev, dtype=float)
+    x = np.asarray(x, dtype=float)
+    return np.where(np.isnan(x), prev, (1 - alpha) * prev + alpha * x)
+
+
+def obv_flow(close, volume) -> np.ndarray:
+    """
+    Volume signed by the close's direction (0 on unchanged closes and the
+    first bar); NaN where the volume is missing. OBV is its running sum.
+    """
+    close, flat = _as_2d(close)
+    volume, _ = _as_2d(volume)
+    flow = volume * np.nan_to_num(np.sign(np.diff(close, axis=0, prepend=np.nan)))
+    return flow[:, 0] if flat else flow
+
+
+def obv(close, volume) -> np.ndarray:
+    """
+    On-balance volume. A missing volume leaves NaN at its bar and adds
+    nothing to the total.
+    """
+    flow = obv_flow(close, volume)
+    out = np.nancumsum(flow, axis=0)
+    out[np.isnan(flow)] = np.nan
+    return out
@@ -0,0 +1,110 @@
+"""
+Check the indicators kernels against the pandas formulas the analyzer used
+per symbol (rolling().mean(), ewm(adjust=False), diff().apply() OBV) and
+time both.
+
+Synthetic data: `symbols` random-walk closes with between 20 and `days`
+bars each, right-aligned in one (days x symbols) matrix like
+analyzer._price_matrices builds, with a few missing volumes.
+
+    python src/technical_analysis/indicators_bench.py [--symbols 2000] [--days 800]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from technical_analysis import indicators
+
+
+def _pandas_reference(close: pd.Series, volume: pd.Series) -> dict[str, np.ndarray]:
+    """Full indicator series for one symbol, the way analyzer computed them."""
+    delta = close.diff()
+    gain = delta.clip(lower=0).rolling(14).mean()
+    loss = (-delta.clip(upper=0)).rolling(14).mean()
+    macd_line = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    direction = close.diff().apply(lambda x: 1 if x > 0 else (-1 if x < 0 else 0))
+    return {
+        'ma50':   close.rolling(50).mean().values,
+        'ma200':  close.rolling(200).mean().values,
+        'rsi14':  (100 - 100 / (1 + gain / loss)).values,
+        'macd':   macd_line.values,
+        'signal': macd_line.ewm(span=9, adjust=False).mean().values,
+        'obv':    (volume * direction).cumsum().values,
+    }
+
+
+def _kernels(close: np.ndarray, volume: np.ndarray) -> dict[str, np.ndarray]:
+    macd_line, signal_line, _ = indicators.macd(close)
+    return {
+        'ma50':   indicators.rolling_mean(close, 50),
+        'ma200':  indicators.rolling_mean(close, 200),
+        'rsi14':  indicators.rsi(close),
+        'macd':   macd_line,
+        'signal': signal_line,
+        'obv':    indicators.obv(close, volume),
+    }
+
+
+def _matrix(symbols: int, days: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    n = rng.integers(20, days + 1, symbols)
+    close = np.full((days, symbols), np.nan)
+    volume = np.full((days, symbols), np.nan)
+    for j, bars in enumerate(n):
+        close[-bars:, j] = 50 * np.cumprod(1 + rng.normal(0.0003, 0.02, bars))
+        volume[-bars:, j] = rng.integers(1_000, 1_000_000, bars)
+        if j % 17 == 0:
+            volume[days - bars + rng.integers(0, bars, 3), j] = np.nan
+    return n, close, volume
+
+
+def _time(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--symbols', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=800)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    n, close, volume = _matrix(args.symbols, args.days)
+    series = [(pd.Series(close[-bars:, j]), pd.Series(volume[-bars:, j])) for j, bars in enumerate(n)]
+    print(f"{args.symbols} symbols, up to {args.days} bars each")
+
+    def per_symbol():
+        return [_pandas_reference(c, v) for c, v in series]
+
+    ref, got = per_symbol(), _kernels(close, volume)
+    failed = False
+    for name, values in got.items():
+        worst = 0.0
+        for j, bars in enumerate(n):
+            old, new = ref[j][name], values[-bars:, j]
+            if not np.allclose(old, new, equal_nan=True, rtol=1e-9, atol=1e-9):
+                worst = max(worst, np.nanmax(np.abs(old - new)))
+        if worst:
+            print(f"MISMATCH {name}: max abs diff {worst:.3g}")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+    t_old = _time(per_symbol, args.repeat)
+    t_new = _time(lambda: _kernels(close, volume), args.repeat)
+    print(f"  pandas per symbol : {t_old * 1000:9.1f} ms")
+    print(f"  numpy kernels     : {t_new * 1000:9.1f} ms  ({t_old / t_new:.0f}x faster, results match)")
+
+
+if __name__ == '__main__':
+    main()
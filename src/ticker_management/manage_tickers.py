@@ -18,23 +18,11 @@ import sys
 import urllib.request
 from pathlib import Path
 
-import duckdb
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from database.db import connect
 
 DB_PATH = str(Path(__file__).resolve().parent.parent.parent / 'data' / 'finance_data.db')
 
-
-def _connect(db_path: str) -> duckdb.DuckDBPyConnection:
-    try:
-        return duckdb.connect(db_path)
-    except duckdb.IOException as e:
-        if 'lock' in str(e).lower():
-            print(f"ERROR: {db_path} is locked by another process.")
-            print("You probably have an open DuckDB connection in a Jupyter notebook.")
-            print("Close it with:  con.close()")
-            print("or restart the notebook kernel, then re-run this command.")
-            sys.exit(1)
-        raise
-
 US_MIC_MAP = {
     'NYSE': 'XNYS',
     'NASDAQ': 'XNMS',
@@ -105,7 +93,7 @@ def add_ticker(symbol: str, mic: str = 'XNMS', name: str = '', isin: str = '',
     yt = yahoo_ticker if yahoo_ticker else symbol
     ticker_pk = md5_hash(symbol + mic)
 
-    with _connect(db_path) as con:
+    with connect(db_path) as con:
         existing = con.execute(
             "select ticker_pk, is_dead from tickers where ticker_pk = ?", (ticker_pk,)
         ).fetchone()
@@ -129,7 +117,7 @@ def add_ticker(symbol: str, mic: str = 'XNMS', name: str = '', isin: str = '',
 
 def mark_dead(symbol: str, reason: str = 'manually marked dead', db_path: str = DB_PATH):
     """Mark a ticker as dead so it is skipped during score calculation."""
-    with _connect(db_path) as con:
+    with connect(db_path) as con:
         rows = con.execute(
             "select ticker_pk from tickers where yahoo_ticker = ? or raw_ticker = ?",
             (symbol, symbol)
@@ -148,7 +136,7 @@ def mark_dead(symbol: str, reason: str = 'manually marked dead', db_path: str =
 
 def revive(symbol: str, db_path: str = DB_PATH):
     """Re-enable a dead ticker so it is included in score calculation again."""
-    with _connect(db_path) as con:
+    with connect(db_path) as con:
         rows = con.execute(
             "select ticker_pk from tickers where yahoo_ticker = ? or raw_ticker = ?",
             (symbol, symbol)
@@ -167,7 +155,7 @@ def revive(symbol: str, db_path: str = DB_PATH):
 
 def list_dead(db_path: str = DB_PATH):
     """Print all tickers currently marked as dead."""
-    with _connect(db_path) as con:
+    with connect(db_path) as con:
         rows = con.execute(
             "select yahoo_ticker, raw_ticker, mic, asset_name, dead_reason "
             "from tickers where is_dead = true order by mic, yahoo_ticker"
@@ -189,7 +177,7 @@ def refresh_us(db_path: str = DB_PATH):
     total_new = 0
     total_seen = 0
 
-    with _connect(db_path) as con:
+    with connect(db_path) as con:
         for path, mic in _US_SOURCES:
             url = f"{_GITHUB_BASE}/{path}"
             print(f"Fetching {url} ...")
@@ -252,7 +240,7 @@ def refresh_eu(db_path: str = DB_PATH):
     new_count = 0
     skipped = 0
 
-    with _connect(db_path) as con:
+    with connect(db_path) as con:
         existing_pks = {
             row[0] for row in con.execute("select ticker_pk from tickers").fetchall()
         }
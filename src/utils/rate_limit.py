@@ -0,0 +1,79 @@
+"""Thread-safe rate limiting for outbound Yahoo Finance calls."""
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Global token bucket shared by all worker threads.
+
+    `rate` tokens are added per second up to `burst`. Each call to acquire()
+    takes one token, blocking until one is available, so the aggregate call
+    rate across every thread never exceeds `rate` once the burst is spent.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveRateLimiter:
+    """
+    Call pacing that follows how the server responds: additive increase,
+    multiplicative decrease.
+
+    acquire() spaces calls 1 / rate seconds apart across all threads. Each
+    success() raises the rate by `increase` up to `max_rate`; each failure()
+    multiplies it by `decrease`, down to `min_rate`. So a throttling server
+    is backed off from quickly and healthy responses win the rate back
+    gradually.
+    """
+
+    def __init__(self, rate: float, min_rate: float, max_rate: float,
+                 increase: float = 0.05, decrease: float = 0.5):
+        if not 0 < min_rate <= rate <= max_rate:
+            raise ValueError("need 0 < min_rate <= rate <= max_rate")
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def failure(self) -> None:
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            # the slot already handed out was at the old pace; push it back
+            self._next = max(self._next, time.monotonic() + 1 / self.rate)
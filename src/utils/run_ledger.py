@@ -0,0 +1,89 @@
+"""
+Per-step bookkeeping for `run daily`.
+
+Each step of a run gets a row in run_ledger with its status, start/finish
+time and how many rows it added to its target table. A resumed run reuses
+the id of the last unfinished run and skips the steps already marked done.
+"""
+import threading
+from datetime import datetime
+
+from database.db import connect
+
+# Marker row written by finish(); a run without it is resumable
+_FINAL_STEP = 'complete'
+
+
+class RunLedger:
+    def __init__(self, db_path: str, run_id: str):
+        self.db_path = db_path
+        self.run_id = run_id
+        # Steps may run on several threads; keep ledger writes one at a time
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, db_path: str, resume: bool = False) -> 'RunLedger':
+        """Start a new run, or with resume=True continue the most recent run
+        that never reached finish() (a new run if there is none)."""
+        if resume:
+            with connect(db_path) as con:
+                row = con.execute("""
+                    SELECT run_id FROM run_ledger
+                    GROUP BY run_id
+                    HAVING NOT bool_or(step = $final AND status = 'done')
+                    ORDER BY min(started_at) DESC
+                    LIMIT 1
+                """, {"final": _FINAL_STEP}).fetchone()
+            if row:
+                print(f"Resuming run {row[0]}")
+                return cls(db_path, row[0])
+            print("No unfinished run to resume, starting a new one")
+        return cls(db_path, datetime.now().strftime('%Y%m%dT%H%M%S'))
+
+    def completed(self) -> set[str]:
+        with connect(self.db_path) as con:
+            rows = con.execute(
+                "SELECT step FROM run_ledger WHERE run_id = ? AND status = 'done'", (self.run_id,)
+            ).fetchall()
+        return {r[0] for r in rows}
+
+    def _record(self, step: str, status: str, started_at: datetime,
+                finished_at: datetime | None = None, rows: int | None = None, error: str | None = None):
+        with self._lock, connect(self.db_path) as con:
+            con.execute("""
+                INSERT INTO run_ledger (run_id, step, status, started_at, finished_at, rows, error)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (run_id, step) DO UPDATE SET
+                    status = excluded.status, started_at = excluded.started_at,
+                    finished_at = excluded.finished_at, rows = excluded.rows, error = excluded.error
+            """, (self.run_id, step, status, started_at, finished_at, rows, error))
+
+    def _count(self, table: str | None) -> int | None:
+        if table is None:
+            return None
+        with connect(self.db_path) as con:
+            return con.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+
+    def run(self, step: str, fn, table: str | None = None):
+        """Run fn() as `step` unless this run already finished it. `table` is
+        counted before and after so the ledger shows how many rows the step added.
+        A failing step is recorded as failed and its exception re-raised."""
+        if step in self.completed():
+            print(f"  Step '{step}' already done in run {self.run_id}, skipping.")
+            return
+
+        started_at = datetime.now()
+        self._record(step, 'running', started_at)
+        before = self._count(table)
+        try:
+            fn()
+        except BaseException as e:
+            self._record(step, 'failed', started_at, datetime.now(), error=f"{type(e).__name__}: {e}")
+            raise
+        after = self._count(table)
+        rows = after - before if table is not None else None
+        self._record(step, 'done', started_at, datetime.now(), rows=rows)
+
+    def finish(self):
+        now = datetime.now()
+        self._record(_FINAL_STEP, 'done', now, now)
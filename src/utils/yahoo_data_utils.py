@@ -1,24 +1,14 @@
 #!/usr/bin/env python3
 import hashlib
 import json
-from io import StringIO
 
 import duckdb
-import pandas as pd
 
 def list_all_industries() -> list[str]:
-    """List all distinct industries from the stock_info table"""
+    """List all distinct industries from the yahoo_info table"""
     with duckdb.connect('../../data/finance_data.db') as db:
-        result = db.execute("SELECT data  FROM yahoo_data WHERE dataset = 'info'").fetchall()
-
-        industries = set()
-        for row in result:
-            json_data = row[0]
-            df = pd.read_json(StringIO(json_data))
-            if "industry" in df.columns:
-                industries.update(df["industry"].dropna().unique().tolist())
-
-        return sorted(industries)
+        result = db.execute("SELECT DISTINCT industry FROM yahoo_info WHERE industry IS NOT NULL").fetchall()
+        return sorted(row[0] for row in result)
 
 def list_all_info_fields() -> list[str]:
     """List all distinct fields available in the stock_info table"""
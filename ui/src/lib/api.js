@@ -49,7 +49,7 @@ export const api = {
     history: (symbol) => request(`/api/scores/${symbol}/history`),
   },
   prices: {
-    history: (symbol) => request(`/api/prices/${symbol}`),
+    history: (symbol, params) => request(`/api/prices/${symbol}`, params),
   },
   screen: {
     options: ()       => request('/api/screen/options'),